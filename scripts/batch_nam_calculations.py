@@ -38,8 +38,8 @@ sys.path.insert(0, _PROJECT_ROOT)
 
 # Import required modules
 from helpers.prisma import prisma
-# Import the NAM function directly (not the task wrapper)
-import calculations.nam
+# NAM without the Celery task and without writing results to the database
+from calculations.nam import NAMInputError, run_nam_batch
 
 def get_all_nam_entries(limit: Optional[int] = None, project_id: Optional[str] = None) -> List[Dict[str, Any]]:
     """
@@ -202,70 +202,45 @@ def call_nam_calculation(nam_entry) -> Optional[Dict[str, Any]]:
         else:
             print(f"  Warning: No discharge point found in project")
         
-        # Use a default curve number (will be overridden by raster if available)
-        curve_number = 70.0
-        
         print(f"Calling NAM calculation for entry {nam_id} (project: {project_id})")
         print(f"  Return period: {x} ({getattr(annuality, 'description', 'unknown')})")
         print(f"  Catchment area: {catchment_area:.2f} km²")
         print(f"  Channel length: {channel_length:.1f} m")
         print(f"  Delta H: {delta_h:.1f} m")
-        
-        # Call the NAM function
-        # Note: We need to create a mock task object since the function expects @app.task
-        class MockTask:
-            def update_state(self, state, meta=None):
-                print(f"    Task state: {state} - {meta}")
-        
-        mock_task = MockTask()
-        
-        print(f"  Calling NAM function with parameters:")
-        print(f"    project_id: {project_id}")
-        print(f"    user_id: {user_id}")
+        print(f"  NAM parameters:")
         print(f"    water_balance_mode: {water_balance_mode}")
         print(f"    precipitation_factor: {precipitation_factor}")
         print(f"    storm_center_mode: {storm_center_mode}")
         print(f"    routing_method: {routing_method}")
         print(f"    readiness_to_drain: {readiness_to_drain}")
-        
-        # Call the NAM function directly (not through Celery)
-        # Get the underlying function from the module
-        nam_function = calculations.nam.nam.__wrapped__
-        
-        # Create kwargs dict to avoid argument conflicts
-        kwargs = {
-            'P_low_1h': P_low_1h,
-            'P_high_1h': P_high_1h,
-            'P_low_24h': P_low_24h,
-            'P_high_24h': P_high_24h,
-            'rp_low': rp_low,
-            'rp_high': rp_high,
-            'x': x,
-            'curve_number': curve_number,
-            'catchment_area': catchment_area,
-            'channel_length': channel_length,
-            'delta_h': delta_h,
-            'nam_id': nam_id,
-            'project_id': project_id,
-            'user_id': user_id,
-            'water_balance_mode': water_balance_mode,
-            'precipitation_factor': precipitation_factor,
-            'storm_center_mode': storm_center_mode,
-            'routing_method': routing_method,
-            'readiness_to_drain': readiness_to_drain,
-            'discharge_point': discharge_point,
-            'discharge_point_crs': discharge_point_crs
-        }
-        
-        # Call the function without self parameter
-        result = nam_function(**kwargs)
-        
+
+        # Run the NAM calculation in-process; the results are only returned
+        try:
+            results = run_nam_batch(
+                P_low_1h,
+                P_high_1h,
+                P_low_24h,
+                P_high_24h,
+                rp_low,
+                rp_high,
+                [x],
+                catchment_area,
+                project_id,
+                user_id,
+                water_balance_mode,
+                precipitation_factor,
+                storm_center_mode,
+                routing_method,
+                readiness_to_drain=readiness_to_drain,
+                discharge_point=discharge_point,
+                discharge_point_crs=discharge_point_crs,
+                climate_scenarios=["current"],
+            )
+        except NAMInputError as e:
+            return {"error": str(e)}
+        result = results[0]
+
         print(f"  NAM calculation completed for entry {nam_id}")
-        print(f"  Result type: {type(result)}")
-        if isinstance(result, dict):
-            print(f"  Result keys: {list(result.keys())}")
-            if 'error' in result:
-                print(f"  Error: {result['error']}")
         return result
         
     except Exception as e:
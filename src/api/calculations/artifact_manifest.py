@@ -0,0 +1,145 @@
+"""
+Manifest of the files generated for a project.
+
+``data/{user}/{project}/artifact_manifest.json`` records, for every generated
+file, the hash of the inputs it was produced from, the version of the code
+that produced it, the mtime and size of the written file and the fingerprints
+of the generated files it was derived from (``ARTIFACT_UPSTREAM``).
+
+A producer task whose file is still current (same inputs, same code version,
+file untouched, upstream files unchanged) skips its work. Recording a file
+drops the entries of the files derived from it, so they are regenerated on
+their next request.
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+
+
+ARTIFACT_MANIFEST_FILENAME = "artifact_manifest.json"
+
+# Version of the code generating each file; bump it when the output changes
+ARTIFACT_CODE_VERSIONS = {
+    "isozones_cog.tif": 1,
+    "time_values.tif": 1,
+    "catchment.geojson": 1,
+    "dem.tif": 1,
+    "curvenumbers.tif": 1,
+}
+
+# Generated files each generated file is derived from
+ARTIFACT_UPSTREAM = {
+    "isozones_cog.tif": (),
+    "time_values.tif": (),
+    "catchment.geojson": (),
+    "dem.tif": ("catchment.geojson",),
+    "curvenumbers.tif": ("catchment.geojson",),
+}
+
+
+def _canonical_json(value):
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def inputs_hash(**inputs):
+    """Hash of the JSON-serialisable inputs of a producer."""
+    return hashlib.sha256(_canonical_json(inputs).encode()).hexdigest()
+
+
+def file_signature(path):
+    """[mtime_ns, size] of a source file, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _fingerprint(entry):
+    if entry is None:
+        return None
+    return hashlib.sha256(_canonical_json(entry).encode()).hexdigest()
+
+
+@contextlib.contextmanager
+def _locked(project_dir):
+    # Producers of one project run in parallel and share the manifest
+    os.makedirs(project_dir, exist_ok=True)
+    with open(os.path.join(project_dir, f"{ARTIFACT_MANIFEST_FILENAME}.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _read(project_dir):
+    try:
+        with open(os.path.join(project_dir, ARTIFACT_MANIFEST_FILENAME)) as f:
+            manifest = json.load(f)
+        return manifest if isinstance(manifest, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _write(project_dir, manifest):
+    path = os.path.join(project_dir, ARTIFACT_MANIFEST_FILENAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _dependents(filename):
+    """Generated files derived (directly or not) from ``filename``."""
+    dependents = []
+    pending = [filename]
+    while pending:
+        current = pending.pop()
+        for name, upstream in ARTIFACT_UPSTREAM.items():
+            if current in upstream and name not in dependents:
+                dependents.append(name)
+                pending.append(name)
+    return dependents
+
+
+def is_current(project_dir, filename, inputs):
+    """
+    Whether ``filename`` of ``project_dir`` was produced from ``inputs`` by the
+    current code and neither it nor its upstream files changed since.
+    """
+    manifest = _read(project_dir)
+    entry = manifest.get(filename)
+    if entry is None:
+        return False
+    if entry.get("version") != ARTIFACT_CODE_VERSIONS[filename] or entry.get("inputs") != inputs:
+        return False
+    if entry.get("signature") != file_signature(os.path.join(project_dir, filename)):
+        return False
+    recorded_upstream = entry.get("upstream", {})
+    return all(
+        recorded_upstream.get(name) == _fingerprint(manifest.get(name))
+        for name in ARTIFACT_UPSTREAM[filename]
+    )
+
+
+def record_artifact(project_dir, filename, inputs):
+    """
+    Record that ``filename`` was just written from ``inputs``.
+
+    Entries of the files derived from ``filename`` are dropped.
+    """
+    with _locked(project_dir):
+        manifest = _read(project_dir)
+        manifest[filename] = {
+            "version": ARTIFACT_CODE_VERSIONS[filename],
+            "inputs": inputs,
+            "signature": file_signature(os.path.join(project_dir, filename)),
+            "upstream": {name: _fingerprint(manifest.get(name)) for name in ARTIFACT_UPSTREAM[filename]},
+        }
+        for name in _dependents(filename):
+            manifest.pop(name, None)
+        _write(project_dir, manifest)
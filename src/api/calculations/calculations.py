@@ -51,11 +51,15 @@ app.conf.task_routes = {
     "extract_dem": {"queue": "heavy"},
     "get_curve_numbers": {"queue": "heavy"},
     "nam": {"queue": "heavy"},
+    "nam_batch": {"queue": "heavy"},
     # Lightweight method calculations
     "modifizierte_fliesszeit": {"queue": "light"},
     "koella": {"queue": "light"},
     "clark-wsl": {"queue": "light"},
+    "clark_wsl_batch": {"queue": "light"},
+    "light_methods_batch": {"queue": "light"},
     "launch_group": {"queue": "light"},
+    "launch_signatures": {"queue": "light"},
     "send_support_notification": {"queue": "light"},
 }
 
@@ -24,6 +24,7 @@ from shapely.geometry import shape
 from shapely import ops
 from prisma import Prisma
 from calculations.calculations import app
+from calculations.artifact_manifest import file_signature, inputs_hash, is_current, record_artifact
 
 @app.task(name="get_curve_numbers", bind=True)
 def get_curve_numbers(self, projectId: str, userId: int, soil_data_source: str = "bek", own_soil: bool = True  ):
@@ -50,6 +51,21 @@ def get_curve_numbers(self, projectId: str, userId: int, soil_data_source: str =
         }
     )
     
+    # Nothing to do if the catchment and all soil and land cover sources are unchanged
+    output_dir = f"data/{userId}/{projectId}"
+    output_file = f"{output_dir}/curvenumbers.tif"
+    curve_number_inputs = inputs_hash(
+        catchment_geojson=project.catchment_geojson,
+        soil_data_source=soil_data_source,
+        own_soil=own_soil,
+        sources={path: file_signature(path) for path in _curve_number_sources(output_dir)},
+    )
+    if is_current(output_dir, "curvenumbers.tif", curve_number_inputs):
+        prisma.disconnect(5)
+        self.update_state(state='PROGRESS',
+                    meta={'text': 'Curve numbers are up to date', 'progress': 100})
+        return {"status": "success", "file": output_file, "unchanged": True}
+
     # Parse catchment geojson
     catchment_geojson = json.loads(project.catchment_geojson)
     
@@ -143,13 +159,12 @@ def get_curve_numbers(self, projectId: str, userId: int, soil_data_source: str =
                 meta={'text': 'Saving curve number raster', 'progress': 80})
     
     # Create output directory
-    output_dir = f"data/{userId}/{projectId}"
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
     # Save as GeoTIFF
-    output_file = f"{output_dir}/curvenumbers.tif"
     save_curve_number_raster(curve_number_raster, grid, output_file)
+    record_artifact(output_dir, "curvenumbers.tif", curve_number_inputs)
     
     # Save LC_HSG combination statistics as JSON
     stats_file = f"{output_dir}/lc_hsg_stats.json"
@@ -167,6 +182,17 @@ def get_curve_numbers(self, projectId: str, userId: int, soil_data_source: str =
     return {"status": "success", "file": output_file}
 
 
+def _curve_number_sources(project_dir):
+    """Land cover and soil files read by ``get_curve_numbers`` (including the own soil shapefile)."""
+    own_soil = [os.path.join(project_dir, f"soil.{ext}") for ext in ("shp", "shx", "dbf", "prj", "cpg")]
+    return own_soil + [
+        "./data/esa_worldcover_2021.vrt",
+        "./data/HYSOGs250m.tif",
+        "./data/Bodeneignungskarte_LV95.shp",
+        "./data/Bodeneignungskarte_LV95.dbf",
+    ]
+
+
 def load_local_esa_worldcover(bbox):
     """
     Load land cover data from local ESA WorldCover 2021 VRT file.
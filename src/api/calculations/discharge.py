@@ -5,8 +5,9 @@ from rio_cogeo.cogeo import cog_translate
 from rio_cogeo.profiles import cog_profiles
 from rasterio.io import MemoryFile
 import rasterio
-from pysheds.view import Raster,View
+from pysheds.view import Raster,View,ViewFinder
 from scipy.ndimage import gaussian_filter
+from scipy.signal import lfilter
 import geopandas as gpd
 from shapely import geometry, ops
 import pandas as pd
@@ -14,6 +15,16 @@ import os
 import shutil
 from prisma import Prisma
 from calculations.calculations import app
+from celery import signals
+from calculations.artifact_manifest import file_signature, inputs_hash, record_artifact
+from calculations.flow_accumulation import FLOW_ACCUMULATION_FILE, accumulation_is_current
+from calculations.flow_distance import distances_to_outlet
+from calculations.idf import IDFCurve
+from calculations.isozone_histogram import isozone_cell_counts, read_zone_cell_counts, time_value_histogram, write_isozone_histogram
+from calculations.light_methods import koella_array, modifizierte_fliesszeit_array
+from calculations.obstacle_layer import obstacle_weights
+from calculations.raster_cache import read_raster
+from calculations.result_memo import memo_key, memoized, result_memo
 try:
     from prisma.engine.errors import EngineConnectionError
 except ImportError:
@@ -73,6 +84,13 @@ def _sanitize_nodata_for_dtype(nodata_value, dtype_name):
     return None
 
 
+def _is_connection_error(e):
+    """Whether ``e`` means the query engine could not be reached."""
+    if isinstance(e, (EngineConnectionError, ConnectionError, OSError)):
+        return True
+    return _HTTPX_AVAILABLE and isinstance(e, (httpx.ConnectError, httpx.RemoteProtocolError))
+
+
 def connect_prisma_with_retry(max_retries=10, base_delay=0.2, max_delay=5.0):
     """
     Connect to Prisma with exponential backoff retry logic and connection limiting.
@@ -112,14 +130,7 @@ def connect_prisma_with_retry(max_retries=10, base_delay=0.2, max_delay=5.0):
                 prisma.connect()
                 return prisma
             except Exception as e:
-                # Check if it's a connection-related error
-                is_connection_error = isinstance(e, (EngineConnectionError, ConnectionError, OSError))
-                if not is_connection_error and _HTTPX_AVAILABLE:
-                    try:
-                        is_connection_error = isinstance(e, httpx.ConnectError)
-                    except:
-                        pass
-                if not is_connection_error:
+                if not _is_connection_error(e):
                     # Not a connection error, re-raise immediately
                     raise
                 if attempt == max_retries - 1:
@@ -142,6 +153,194 @@ def connect_prisma_with_retry(max_retries=10, base_delay=0.2, max_delay=5.0):
         _prisma_connection_semaphore.release()
 
 
+# Prisma connection of this process, shared by all tasks it runs
+_worker_prisma = None
+_worker_prisma_lock = threading.Lock()
+
+
+def get_worker_prisma():
+    """
+    Long-lived Prisma connection of this process.
+
+    Worker processes connect on ``worker_process_init``; other processes (the
+    API running the synchronous endpoints) connect on first use. A connection
+    that was lost is re-established with ``connect_prisma_with_retry``.
+    """
+    global _worker_prisma
+    with _worker_prisma_lock:
+        if _worker_prisma is None or not _worker_prisma.is_connected():
+            _worker_prisma = connect_prisma_with_retry()
+        return _worker_prisma
+
+
+def close_worker_prisma():
+    """Disconnect the connection of this process (the next use reconnects)."""
+    global _worker_prisma
+    with _worker_prisma_lock:
+        prisma, _worker_prisma = _worker_prisma, None
+    if prisma is not None:
+        try:
+            prisma.disconnect(5)
+        except Exception:
+            pass
+
+
+def with_worker_prisma(operation):
+    """Run ``operation(prisma)`` on the process connection, reconnecting once if it dropped."""
+    try:
+        return operation(get_worker_prisma())
+    except Exception as e:
+        if not _is_connection_error(e):
+            raise
+        close_worker_prisma()
+        return operation(get_worker_prisma())
+
+
+@signals.worker_process_init.connect
+def _connect_worker_prisma(**kwargs):
+    try:
+        get_worker_prisma()
+    except Exception as e:
+        # Tasks connect on first use instead
+        print(f"Could not connect to Prisma at worker start: {e}")
+
+
+@signals.worker_process_shutdown.connect
+def _disconnect_worker_prisma(**kwargs):
+    close_worker_prisma()
+
+
+class ResultWriter:
+    """
+    Collects result upserts and writes them in one transaction.
+
+    Upserts of the same object are merged into a single ``update`` carrying all
+    its result relations, so all climate scenarios of a method cost one round
+    trip::
+
+        with ResultWriter() as writer:
+            for climate_scenario, result_data in results.items():
+                writer.upsert("koella", koella_id, KOELLA_RESULT_RELATIONS[climate_scenario], result_data)
+
+    The batch is written on leaving the ``with`` block unless it raised.
+    """
+
+    def __init__(self):
+        self._updates = {}
+
+    def __len__(self):
+        return len(self._updates)
+
+    def upsert(self, model, object_id, relation, result_data):
+        """Queue the upsert of ``relation`` of ``model`` ``object_id``."""
+        data_update = self._updates.setdefault((model, object_id), {})
+        data_update[relation] = {
+            'upsert': {'update': result_data, 'create': result_data}
+        }
+
+    def flush(self):
+        """Write all queued upserts in one batch transaction."""
+        if not self._updates:
+            return
+        updates, self._updates = self._updates, {}
+
+        def write(prisma):
+            with prisma.batch_() as batcher:
+                for (model, object_id), data_update in updates.items():
+                    getattr(batcher, model).update(
+                        where = {
+                            'id' : object_id
+                        },
+                        data = data_update
+                    )
+
+        with_worker_prisma(write)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        return False
+
+
+# Solvers for the rain duration TB of Mod. Fliesszeit and Kölla
+TB_SOLVERS = ("step", "bracket")
+_TB_BRACKET_MIN = 1e-6      # Lower end of the TB bracket [min]
+_TB_BRACKET_EXPANSIONS = 60  # Max. doublings of the upper end of the bracket
+_TB_BISECTION_MAXITER = 100  # Max. bisection steps
+
+
+def _solve_tb(intensity_fn, x, TFl, Vox, TB_start=10, istep=0.1, tol=1, max_iter=100000, solver="step"):
+    """
+    Rain duration TB [min] whose precipitation TB/60 · i(TB + TFl) equals Vox.
+
+    ``solver="step"`` walks from ``TB_start`` in steps of ``istep`` for up to
+    ``max_iter`` iterations and retries from TB=1 min. ``solver="bracket"``
+    brackets the root of the residual, which increases monotonically with TB,
+    by doubling the upper end from ``TB_start`` and then bisects the bracket.
+    It needs at most ``_TB_BRACKET_EXPANSIONS + _TB_BISECTION_MAXITER``
+    intensity evaluations. Both stop as soon as the residual is below ``tol``.
+
+    Returns:
+        float: TB [min]
+
+    Raises:
+        RuntimeError: If no TB within ``tol`` is found
+        ValueError: If ``solver`` is unknown
+    """
+    if solver == "step":
+        tb_start_attempts = [TB_start] + ([1] if TB_start != 1 else [])
+        for tb0 in tb_start_attempts:
+            TB = tb0
+            for _ in range(max_iter):
+                Tc = TB + TFl
+                ix = intensity_fn(rp_years = x, duration_minutes = Tc)  # [mm/h]
+                if abs(TB / 60 * ix - Vox) < tol:
+                    return TB
+                if TB * ix < Vox:
+                    TB = TB - istep
+                else:
+                    TB = TB + istep
+        raise RuntimeError("TB iteration did not converge.")
+
+    if solver != "bracket":
+        raise ValueError(f"Unknown TB solver: {solver}")
+
+    def residual(TB):
+        return TB / 60 * intensity_fn(rp_years = x, duration_minutes = TB + TFl) - Vox
+
+    lower = _TB_BRACKET_MIN
+    r_lower = residual(lower)
+    if abs(r_lower) < tol:
+        return lower
+    if not r_lower < 0:
+        raise RuntimeError("TB iteration did not converge.")
+
+    upper = max(float(TB_start), 1.0)
+    for _ in range(_TB_BRACKET_EXPANSIONS):
+        r_upper = residual(upper)
+        if abs(r_upper) < tol:
+            return upper
+        if r_upper > 0:
+            break
+        lower, upper = upper, upper * 2
+    else:
+        raise RuntimeError("TB iteration did not converge.")
+
+    for _ in range(_TB_BISECTION_MAXITER):
+        TB = 0.5 * (lower + upper)
+        r = residual(TB)
+        if abs(r) < tol:
+            return TB
+        if r < 0:
+            lower = TB
+        else:
+            upper = TB
+    raise RuntimeError("TB iteration did not converge.")
+
+
 @app.task(name="modifizierte_fliesszeit", bind=True)
 def modifizierte_fliesszeit(self, 
     P_low_1h,
@@ -164,97 +363,58 @@ def modifizierte_fliesszeit(self,
     TB_start=10,    # Initial value for TB [min]
     istep=0.1,        # Step size for TB [min]
     tol=1,          # Convergence tolerance [mm]
-    max_iter=100000
+    max_iter=100000,
+    solver="step",  # TB solver: "step" or "bracket"
 ):
-    result_data = {}    
-    if x == 2.3 or x == 100 or x == 20:
-        result_data = modifizierte_fliesszeit_standardVo(self, 
-            P_low_1h,
-            P_high_1h,
-            P_low_24h,
-            P_high_24h,
-            rp_low,
-            rp_high,  
-            x, Vo20, L, delta_H, psi, E, mod_fliesszeit_id, project_easting, project_northing, cc_degree, climate_scenario, TB_start, istep, tol, max_iter)
-    elif x == 30 or x == 300:
-        result_data_20 = modifizierte_fliesszeit_standardVo(self, 
-            P_low_1h,
-            P_high_1h,
-            P_low_24h,
-            P_high_24h,
-            rp_low,
-            rp_high,  
-            20, Vo20, L, delta_H, psi, E, mod_fliesszeit_id, project_easting, project_northing, cc_degree, climate_scenario, TB_start, istep, tol, max_iter)
-        result_data_100 = modifizierte_fliesszeit_standardVo(self, 
-            P_low_1h,
-            P_high_1h,
-            P_low_24h,
-            P_high_24h,
-            rp_low,
-            rp_high,  
-            100, Vo20, L, delta_H, psi, E, mod_fliesszeit_id, project_easting, project_northing, cc_degree, climate_scenario, TB_start, istep, tol, max_iter)
-        hq = loglog_interp_targets(20, result_data_20['HQ'], 100, result_data_100['HQ'])
-        result_data = {
-            "HQ": hq[int(x)],
-            "Tc": result_data_20['Tc'],
-            "TB": result_data_20['TB'],
-            "TFl": result_data_20['TFl'],
-            "i": result_data_20['i'],
-            "Vox": result_data_20['Vox']
-        }
-    else:
-        raise ValueError("Return period x must be 2.3, 20 or 100.")
-
-    prisma = None
-    try:
-        # Use retry logic to handle concurrent connection attempts
-        prisma = connect_prisma_with_retry()
-        
-        # Use conditional logic to set the correct relation field
-        if climate_scenario == "1_5_degree":
-            data_update = {
-                'Mod_Fliesszeit_Result_1_5': {
-                    'upsert': {'update': result_data, 'create': result_data}
-                }
-            }
-        elif climate_scenario == "2_degree":
-            data_update = {
-                'Mod_Fliesszeit_Result_2': {
-                    'upsert': {'update': result_data, 'create': result_data}
-                }
-            }
-        elif climate_scenario == "3_degree":
-            data_update = {
-                'Mod_Fliesszeit_Result_3': {
-                    'upsert': {'update': result_data, 'create': result_data}
-                }
-            }
-        elif climate_scenario == "4_degree":
-            data_update = {
-                'Mod_Fliesszeit_Result_4': {
-                    'upsert': {'update': result_data, 'create': result_data}
-                }
+    # Identical inputs give identical results: reuse a previous result if there is one
+    def compute():
+        if x == 2.3 or x == 100 or x == 20:
+            result_data = modifizierte_fliesszeit_standardVo(self, 
+                P_low_1h,
+                P_high_1h,
+                P_low_24h,
+                P_high_24h,
+                rp_low,
+                rp_high,  
+                x, Vo20, L, delta_H, psi, E, mod_fliesszeit_id, project_easting, project_northing, cc_degree, climate_scenario, TB_start, istep, tol, max_iter, solver)
+        elif x == 30 or x == 300:
+            result_data_20 = modifizierte_fliesszeit_standardVo(self, 
+                P_low_1h,
+                P_high_1h,
+                P_low_24h,
+                P_high_24h,
+                rp_low,
+                rp_high,  
+                20, Vo20, L, delta_H, psi, E, mod_fliesszeit_id, project_easting, project_northing, cc_degree, climate_scenario, TB_start, istep, tol, max_iter, solver)
+            result_data_100 = modifizierte_fliesszeit_standardVo(self, 
+                P_low_1h,
+                P_high_1h,
+                P_low_24h,
+                P_high_24h,
+                rp_low,
+                rp_high,  
+                100, Vo20, L, delta_H, psi, E, mod_fliesszeit_id, project_easting, project_northing, cc_degree, climate_scenario, TB_start, istep, tol, max_iter, solver)
+            hq = loglog_interp_targets(20, result_data_20['HQ'], 100, result_data_100['HQ'])
+            result_data = {
+                "HQ": hq[int(x)],
+                "Tc": result_data_20['Tc'],
+                "TB": result_data_20['TB'],
+                "TFl": result_data_20['TFl'],
+                "i": result_data_20['i'],
+                "Vox": result_data_20['Vox']
             }
-        else:  # current
-            data_update = {
-                'Mod_Fliesszeit_Result': {
-                    'upsert': {'update': result_data, 'create': result_data}
-                }
-            }
-        
-        updatedResults = prisma.mod_fliesszeit.update(
-            where = {
-                'id' : mod_fliesszeit_id
-            },
-            data = data_update
-        )
-    finally:
-        # Ensure cleanup even if update fails
-        if prisma is not None:
-            try:
-                prisma.disconnect(5)
-            except:
-                pass
+        else:
+            raise ValueError("Return period x must be 2.3, 20 or 100.")
+        return result_data
+
+    result_data = memoized("modifizierte_fliesszeit", dict(
+        P_low_1h=P_low_1h, P_high_1h=P_high_1h, P_low_24h=P_low_24h, P_high_24h=P_high_24h, rp_low=rp_low, rp_high=rp_high,
+        x=x, Vo20=Vo20, L=L, delta_H=delta_H, psi=psi, E=E, project_easting=project_easting, project_northing=project_northing,
+        cc_degree=cc_degree, climate_scenario=climate_scenario, TB_start=TB_start, istep=istep, tol=tol, max_iter=max_iter, solver=solver,
+    ), compute)
+
+    with ResultWriter() as writer:
+        writer.upsert("mod_fliesszeit", mod_fliesszeit_id, MOD_FLIESSZEIT_RESULT_RELATIONS.get(climate_scenario, "Mod_Fliesszeit_Result"), result_data)
     return result_data
 
 
@@ -279,7 +439,8 @@ def modifizierte_fliesszeit_standardVo(self,
     TB_start=10,    # Initial value for TB [min]
     istep=0.1,        # Step size for TB [min]
     tol=1,          # Convergence tolerance [mm]
-    max_iter=100000
+    max_iter=100000,
+    solver="step",  # TB solver: "step" or "bracket"
 ):
     # Map climate scenario to cc_degree if not explicitly set
     scenario_to_degree = {
@@ -330,25 +491,8 @@ def modifizierte_fliesszeit_standardVo(self,
     J = delta_H / L
     TFl = 0.0195 * (L ** 0.77) * (J ** -0.385)
 
-    # 3. Iteration to determine TB (retry with TB_start=1 if user start value fails)
-    tb_start_attempts = [TB_start] + ([1] if TB_start != 1 else [])
-    converged = False
-    for tb0 in tb_start_attempts:
-        TB = tb0
-        for _ in range(max_iter):
-            Tc = TB + TFl
-            ix = intensity_fn(rp_years = x, duration_minutes = Tc)  # [mm/h]
-            if abs(TB / 60 * ix - Vox) < tol:
-                converged = True
-                break
-            if TB * ix < Vox:
-                TB = TB - istep
-            else:
-                TB = TB + istep
-        if converged:
-            break
-    if not converged:
-        raise RuntimeError("TB iteration did not converge.")
+    # 3. Iteration to determine TB (the step solver retries with TB_start=1 if the user start value fails)
+    TB = _solve_tb(intensity_fn, x, TFl, Vox, TB_start, istep, tol, max_iter, solver)
 
     Tc = TB + TFl
     i_final = intensity_fn(rp_years = x, duration_minutes = Tc)
@@ -386,98 +530,60 @@ def koella(self,
     TB_start=10,            # Start value for TB [min]
     tol=1,                  # Convergence tolerance [mm]
     istep=0.1,                # Step size for TB [min]
-    max_iter=100000            # Max. iterations
+    max_iter=100000,           # Max. iterations
+    solver="step",             # TB solver: "step" or "bracket"
 ):
-    result_data = {}    
-    if x == 2.3 or x == 100 or x == 20:
-        result_data = koella_standardVo(self, 
-            P_low_1h,
-            P_high_1h,
-            P_low_24h,
-            P_high_24h,
-            rp_low,
-            rp_high,  
-            x, Vo20, Lg, E, glacier_area, koella_id, project_easting, project_northing, cc_degree, climate_scenario, rs, snow_melt, TB_start, tol, istep, max_iter)
-    elif x == 30 or x == 300:
-        result_data_20 = koella_standardVo(self, 
-            P_low_1h,
-            P_high_1h,
-            P_low_24h,
-            P_high_24h,
-            rp_low,
-            rp_high,  
-            20, Vo20, Lg, E, glacier_area, koella_id, project_easting, project_northing, cc_degree, climate_scenario, rs, snow_melt, TB_start, tol, istep, max_iter)
-        result_data_100 = koella_standardVo(self, 
-            P_low_1h,
-            P_high_1h,
-            P_low_24h,
-            P_high_24h,
-            rp_low,
-            rp_high,  
-            100, Vo20, Lg, E, glacier_area, koella_id, project_easting, project_northing, cc_degree, climate_scenario, rs, snow_melt, TB_start, tol, istep, max_iter)
-        hq = loglog_interp_targets(20, result_data_20['HQ'], 100, result_data_100['HQ'])
-        result_data = {
-            "HQ": hq[int(x)],
-            "Tc": result_data_20['Tc'],
-            "TB": result_data_20['TB'],
-            "TFl": result_data_20['TFl'],
-            "FLeff": result_data_20['FLeff'],
-            "i_final": result_data_20['i_final'],
-            "i_korrigiert": result_data_20['i_korrigiert']
-        }
-    else:
-        raise ValueError("Return period x must be 2.3, 20 or 100.")
-    
-    prisma = None
-    try:
-        # Use retry logic to handle concurrent connection attempts
-        prisma = connect_prisma_with_retry()
-        
-        # Use conditional logic to set the correct relation field
-        if climate_scenario == "1_5_degree":
-            data_update = {
-                'Koella_Result_1_5': {
-                    'upsert': {'update': result_data, 'create': result_data}
-                }
-            }
-        elif climate_scenario == "2_degree":
-            data_update = {
-                'Koella_Result_2': {
-                    'upsert': {'update': result_data, 'create': result_data}
-                }
-            }
-        elif climate_scenario == "3_degree":
-            data_update = {
-                'Koella_Result_3': {
-                    'upsert': {'update': result_data, 'create': result_data}
-                }
+    # Identical inputs give identical results: reuse a previous result if there is one
+    def compute():
+        if x == 2.3 or x == 100 or x == 20:
+            result_data = koella_standardVo(self, 
+                P_low_1h,
+                P_high_1h,
+                P_low_24h,
+                P_high_24h,
+                rp_low,
+                rp_high,  
+                x, Vo20, Lg, E, glacier_area, koella_id, project_easting, project_northing, cc_degree, climate_scenario, rs, snow_melt, TB_start, tol, istep, max_iter, solver)
+        elif x == 30 or x == 300:
+            result_data_20 = koella_standardVo(self, 
+                P_low_1h,
+                P_high_1h,
+                P_low_24h,
+                P_high_24h,
+                rp_low,
+                rp_high,  
+                20, Vo20, Lg, E, glacier_area, koella_id, project_easting, project_northing, cc_degree, climate_scenario, rs, snow_melt, TB_start, tol, istep, max_iter, solver)
+            result_data_100 = koella_standardVo(self, 
+                P_low_1h,
+                P_high_1h,
+                P_low_24h,
+                P_high_24h,
+                rp_low,
+                rp_high,  
+                100, Vo20, Lg, E, glacier_area, koella_id, project_easting, project_northing, cc_degree, climate_scenario, rs, snow_melt, TB_start, tol, istep, max_iter, solver)
+            hq = loglog_interp_targets(20, result_data_20['HQ'], 100, result_data_100['HQ'])
+            result_data = {
+                "HQ": hq[int(x)],
+                "Tc": result_data_20['Tc'],
+                "TB": result_data_20['TB'],
+                "TFl": result_data_20['TFl'],
+                "FLeff": result_data_20['FLeff'],
+                "i_final": result_data_20['i_final'],
+                "i_korrigiert": result_data_20['i_korrigiert']
             }
-        elif climate_scenario == "4_degree":
-            data_update = {
-                'Koella_Result_4': {
-                    'upsert': {'update': result_data, 'create': result_data}
-                }
-            }
-        else:  # current
-            data_update = {
-                'Koella_Result': {
-                    'upsert': {'update': result_data, 'create': result_data}
-                }
-            }
-       
-        updatedResults = prisma.koella.update(
-            where = {
-                'id' : koella_id
-            },
-            data = data_update
-        )
-    finally:
-        # Ensure cleanup even if update fails
-        if prisma is not None:
-            try:
-                prisma.disconnect(5)
-            except:
-                pass
+        else:
+            raise ValueError("Return period x must be 2.3, 20 or 100.")
+        return result_data
+
+    result_data = memoized("koella", dict(
+        P_low_1h=P_low_1h, P_high_1h=P_high_1h, P_low_24h=P_low_24h, P_high_24h=P_high_24h, rp_low=rp_low, rp_high=rp_high,
+        x=x, Vo20=Vo20, Lg=Lg, E=E, glacier_area=glacier_area, project_easting=project_easting, project_northing=project_northing,
+        cc_degree=cc_degree, climate_scenario=climate_scenario, rs=rs, snow_melt=snow_melt, TB_start=TB_start, tol=tol, istep=istep,
+        max_iter=max_iter, solver=solver,
+    ), compute)
+
+    with ResultWriter() as writer:
+        writer.upsert("koella", koella_id, KOELLA_RESULT_RELATIONS.get(climate_scenario, "Koella_Result"), result_data)
     return result_data
 
 
@@ -503,7 +609,8 @@ def koella_standardVo(self,
     TB_start=10,            # Start value for TB [min]
     tol=1,                  # Convergence tolerance [mm]
     istep=.1,                # Step size for TB [min]
-    max_iter=100000            # Max. iterations
+    max_iter=100000,           # Max. iterations
+    solver="step",             # TB solver: "step" or "bracket"
 ):
     # Map climate scenario to cc_degree if not explicitly set
     scenario_to_degree = {
@@ -584,24 +691,8 @@ def koella_standardVo(self,
     TFl = TFl_h * 60  # min
     kGang = 1 # Initial value for hydrograph correction factor
 
-    tb_start_attempts = [TB_start] + ([1] if TB_start != 1 else [])
-    converged = False
-    for tb0 in tb_start_attempts:
-        TB = tb0
-        for _ in range(max_iter):
-            Tc = TB + TFl
-            ix = intensity_fn(rp_years = x, duration_minutes = Tc)
-            if abs(TB / 60 * ix - Vox) < tol:
-                converged = True
-                break
-            if TB * ix < Vox:
-                TB = TB - istep
-            else:
-                TB = TB + istep
-        if converged:
-            break
-    if not converged:
-        raise RuntimeError("TB iteration did not converge.")
+    TB = _solve_tb(intensity_fn, x, TFl, Vox, TB_start, istep, tol, max_iter, solver)
+    Tc = TB + TFl
 
     # Hydrograph correction (rain duration = Tc)
     if Tc <= 60:
@@ -641,29 +732,26 @@ def koella_standardVo(self,
         "i_korrigiert": i_corrected,
     }
 
-@app.task(name="clark-wsl", bind=True)
-def clark_wsl_modified(self,
-    P_low_1h,
-    P_high_1h,
-    P_low_24h,
-    P_high_24h,
-    rp_low,
-    rp_high, 
-    discharge_types_parameters,# dict: ID -> {"WSV", "psi"}
-    x,                         # Return period [y]
-    fractions_dict,            # Dict with fractions by zone
-    clark_wsl,                 # Clark WSL id
-    project_id,                # Project ID for getting isozone raster
-    user_id,                   # User ID for getting isozone raster
-    project_easting: Optional[float] = None,
-    project_northing: Optional[float] = None,
-    cc_degree: float = 0.0,
-    climate_scenario: str = "current",  # Climate scenario: "current", "1_5_degree", "2_degree", "3_degree", "4_degree"
-    intensity_fn=None,         # Precipitation intensity function: i(x, Tc) in mm/h
-    dt=10,                     # Time step [min]
-    pixel_area_m2=25           # Cell area [m²] (e.g. 5x5 m)
-):
-    # Map climate scenario to cc_degree if not explicitly set
+# Climate scenario -> relation holding the results of Mod. Fliesszeit / Kölla
+MOD_FLIESSZEIT_RESULT_RELATIONS = {
+    "current": "Mod_Fliesszeit_Result",
+    "1_5_degree": "Mod_Fliesszeit_Result_1_5",
+    "2_degree": "Mod_Fliesszeit_Result_2",
+    "3_degree": "Mod_Fliesszeit_Result_3",
+    "4_degree": "Mod_Fliesszeit_Result_4",
+}
+KOELLA_RESULT_RELATIONS = {
+    "current": "Koella_Result",
+    "1_5_degree": "Koella_Result_1_5",
+    "2_degree": "Koella_Result_2",
+    "3_degree": "Koella_Result_3",
+    "4_degree": "Koella_Result_4",
+}
+LIGHT_CLIMATE_SCENARIOS = ("current", "1_5_degree", "2_degree", "3_degree")
+
+
+def _climate_cc_factor(climate_scenario, cc_degree=0.0, project_easting=None, project_northing=None):
+    """Climate change factor of a climate scenario (0 without project coordinates)."""
     scenario_to_degree = {
         "current": 0.0,
         "1_5_degree": 1.5,
@@ -671,133 +759,263 @@ def clark_wsl_modified(self,
         "3_degree": 3.0,
         "4_degree": 4.0
     }
-    
-    # Use climate_scenario to determine cc_degree
     if climate_scenario in scenario_to_degree:
         cc_degree = scenario_to_degree[climate_scenario]
-    
-    # Compute climate change factor from project coordinates if available
-    cc_factor = 0.0
     try:
         if project_easting is not None and project_northing is not None:
             lon, lat = _project_to_wgs84(project_easting, project_northing)
-            #cc_factor = _load_cc_factor(lon, lat, cc_degree)
-            cc_factor = _load_cc_factor_simple(cc_degree)
+            return _load_cc_factor_simple(cc_degree)
     except Exception:
-        cc_factor = 0.0
-    intensity_fn = construct_idf_curve(
-        P_low_1h,
-        P_high_1h,
-        P_low_24h,
-        P_high_24h,
-        rp_low,
-        rp_high,
-        cc_factor
-    )
-    
-    # read the isozone_raster
-    isozone = f"data/{user_id}/{project_id}/isozones_cog.tif"
-    grid = Grid.from_raster(isozone)
-    isozone_raster = grid.read_raster(isozone)
+        pass
+    return 0.0
 
-    fractions = fractions_dict
 
-    max_zone = int(np.nanmax(isozone_raster))
-    Tc = dt * (max_zone + 1)
-    Ptotal = intensity_fn(rp_years = x, duration_minutes = Tc) * (1 + cc_factor) * Tc / 60  # mm
-    W_iso = np.zeros((1, max_zone + 1))
-    WSV_weighted_sum = 0
-    total_area = 0
-    P_deficit = 0
-
-    for z in range(max_zone + 1):
-        zone_mask = isozone_raster == z
-        if not np.any(zone_mask):
-            continue
+def _evaluate_light_method(method_fn, curve, objects, climate_scenarios, cc_factors, **common):
+    """
+    Evaluate a light method for every object × climate scenario in one array call.
 
-        zone_area = np.sum(zone_mask) * pixel_area_m2  # m²
-                
-        for fraction in fractions:
-            typ = fraction.get('typ')
-            pct = fraction.get('pct')
-            if pd.isna(pct) or pct == 0:
-                continue
-            frac = pct / 100
-            area = frac * zone_area  # m²
-            total_area += area
+    If the array call fails (e.g. a TB that does not converge), the objects are
+    evaluated one by one so that only the failing ones report an error.
 
-            # Convert typ to string if it isn't already, to match dictionary keys
-            typ_str = str(typ)
+    Returns:
+        dict: {object id: {climate_scenario: result dict}} or
+        {object id: {"error": message}}
+    """
+    if not objects:
+        return {}
+    params = {
+        name: np.array([[obj[name]] for obj in objects], dtype=np.float64)
+        for name in objects[0] if name != "id"
+    }
+    cc_factor = np.asarray(cc_factors, dtype=np.float64)[None, :]
 
-            if typ not in discharge_types_parameters:
+    def to_results(arrays, rows):
+        return {
+            objects[row]["id"]: {
+                scenario: {name: float(values[k, j]) for name, values in arrays.items()}
+                for j, scenario in enumerate(climate_scenarios)
+            }
+            for k, row in enumerate(rows)
+        }
+
+    try:
+        arrays = method_fn(curve, cc_factor=cc_factor, **params, **common)
+        return to_results(arrays, range(len(objects)))
+    except (RuntimeError, ValueError):
+        pass
+
+    results = {}
+    for row, obj in enumerate(objects):
+        try:
+            arrays = method_fn(curve, cc_factor=cc_factor, **{name: value[row:row + 1] for name, value in params.items()}, **common)
+            results.update(to_results(arrays, [row]))
+        except (RuntimeError, ValueError) as e:
+            results[obj["id"]] = {"error": str(e)}
+    return results
+
+
+CLARK_WSL_RESULT_RELATIONS = {
+    "current": "ClarkWSL_Result",
+    "1_5_degree": "ClarkWSL_Result_1_5",
+    "2_degree": "ClarkWSL_Result_2",
+    "3_degree": "ClarkWSL_Result_3",
+    "4_degree": "ClarkWSL_Result_4",
+}
+
+
+def _memoized_light_method(method, method_fn, curve, objects, climate_scenarios, cc_factors, idf, **common):
+    """``_evaluate_light_method`` for the objects without a memoized result."""
+    results = {}
+    keys = {}
+    misses = []
+    for obj in objects:
+        params = dict(
+            idf, **common,
+            **{name: value for name, value in obj.items() if name != "id"},
+            climate_scenarios=list(climate_scenarios), cc_factors=list(cc_factors),
+        )
+        keys[obj["id"]] = memo_key(method, params)
+        cached = result_memo.get(method, keys[obj["id"]])
+        if cached is None:
+            misses.append(obj)
+        else:
+            results[obj["id"]] = cached
+
+    computed = _evaluate_light_method(method_fn, curve, misses, climate_scenarios, cc_factors, **common)
+    for object_id, result in computed.items():
+        if "error" not in result:
+            result_memo.put(keys[object_id], result)
+    results.update(computed)
+    return results
+
+
+def _store_light_results(model, relations, results):
+    """Upsert the result relations of every object and scenario in one transaction."""
+    with ResultWriter() as writer:
+        for object_id, scenario_results in results.items():
+            if "error" in scenario_results:
                 continue
-          
-            params = discharge_types_parameters[typ_str]
-            WSV60min = params["WSV"]
-            
-            # WSV correction
-            WSVcorr = WSV60min * (0.5 + Tc / 120)
-
-            # Effective precipitation
-            Peff = ((Ptotal - 0.2 * WSVcorr) ** 2) / (Ptotal + 0.8 * WSVcorr)
-            Pinfilt_total = Ptotal - Peff
-
-            # Infiltration capacity
-            if WSV60min >= 30:
-                f0_fc = 1
-                r_val = 0.0000001
-            elif 25 <= WSV60min < 30:
-                f0_fc = 2
-                r_val = 0.02
-            elif 20 <= WSV60min < 25:
-                f0_fc = 5
-                r_val = 0.04
-            else:  # WSV < 20
-                f0_fc = 8
-                r_val = 0.06
-
-            r = r_val
-            t_sec_z = Tc * 60 / (max_zone + 1) 
-
-            # Step 1: Distribute total infiltration across zones
-            Pinfilt_available = Pinfilt_total / (max_zone + 1)
-
-            # Step 2: Compute fc from that available infiltration
-            denominator = t_sec_z + ((f0_fc - 1) / r) * (1 - np.exp(-r * t_sec_z))
-            fc = Pinfilt_available / denominator
-            f0 = f0_fc * fc
-
-            # Step 3: Reconstruct cumulative infiltration for the zone
-            Pinfilt_z = fc * t_sec_z + ((f0 - fc) / r) * (1 - np.exp(-r * t_sec_z))
-
-            # Step 4: Ensure that cumulative infiltration does not exceed available
-            Pinfilt_z = min(Pinfilt_z, Pinfilt_available)
-                      
-            # Effective precipitation after infiltration and deficit from previous time step
-            P_step = Ptotal / (max_zone + 1) - Pinfilt_z - P_deficit
-            if P_step < 0:
-                P_step = 0
-            else:
-                P_deficit = 0
-
-            Q_step = P_step * area / 1000 / 60 / dt # [m³/s]
-            WSV_weighted_sum += WSV60min * area
-            WSV_corr_weighted_sum = WSVcorr * area
-            W_iso[0][z] += Q_step
-
-    # Clark W(t) by time step
-    W = np.zeros(max_zone + 1)
-    for t in range(len(W)):
-        for z in range(len(W_iso[0])):
-            if t - z >= 0:
-                W[t] += W_iso[0, t - z]
+            for climate_scenario, result_data in scenario_results.items():
+                writer.upsert(model, object_id, relations.get(climate_scenario, relations["current"]), result_data)
+
+
+def run_light_methods(
+    P_low_1h, P_high_1h, P_low_24h, P_high_24h, rp_low, rp_high,
+    mod_fliesszeit_objects, koella_objects, L, delta_H, Lg, E,
+    project_easting=None, project_northing=None, climate_scenarios=LIGHT_CLIMATE_SCENARIOS,
+    cc_degree=0.0, TB_start=10, tol=1, store=True,
+):
+    """
+    Evaluate and (with ``store``) persist Mod. Fliesszeit and Kölla objects.
+
+    Shared by the ``light_methods_batch`` task and the synchronous API path.
+
+    Returns:
+        dict: ``{"mod_fliesszeit": {id: {climate_scenario: result}}, "koella": {...}}``;
+        objects whose evaluation failed map to ``{"error": message}``
+    """
+    climate_scenarios = list(climate_scenarios)
+    curve = construct_idf_curve(P_low_1h, P_high_1h, P_low_24h, P_high_24h, rp_low, rp_high, 0.0)
+    cc_factors = [_climate_cc_factor(scenario, cc_degree, project_easting, project_northing) for scenario in climate_scenarios]
+
+    idf = dict(P_low_1h=P_low_1h, P_high_1h=P_high_1h, P_low_24h=P_low_24h, P_high_24h=P_high_24h, rp_low=rp_low, rp_high=rp_high)
+
+    mod_fliesszeit_results = _memoized_light_method(
+        "modifizierte_fliesszeit_array", modifizierte_fliesszeit_array, curve, list(mod_fliesszeit_objects), climate_scenarios, cc_factors, idf,
+        L=L, delta_H=delta_H, E=E, TB_start=TB_start, tol=tol,
+    )
+    koella_results = _memoized_light_method(
+        "koella_array", koella_array, curve, list(koella_objects), climate_scenarios, cc_factors, idf,
+        Lg=Lg, E=E, TB_start=TB_start, tol=tol,
+    )
+
+    if store and mod_fliesszeit_results:
+        _store_light_results("mod_fliesszeit", MOD_FLIESSZEIT_RESULT_RELATIONS, mod_fliesszeit_results)
+    if store and koella_results:
+        _store_light_results("koella", KOELLA_RESULT_RELATIONS, koella_results)
+    return {"mod_fliesszeit": mod_fliesszeit_results, "koella": koella_results}
+
+
+@app.task(name="light_methods_batch", bind=True)
+def light_methods_batch(self,
+    P_low_1h,
+    P_high_1h,
+    P_low_24h,
+    P_high_24h,
+    rp_low,
+    rp_high,
+    mod_fliesszeit_objects,     # [{"id", "x", "Vo20", "psi"}]
+    koella_objects,             # [{"id", "x", "Vo20", "glacier_area"}]
+    L: float,                   # Channel length up to the watershed ridge [m]
+    delta_H: float,             # Elevation difference along L [m]
+    Lg: float,                  # Cumulative channel length [km]
+    E: float,                   # Catchment area [km²]
+    project_easting: Optional[float] = None,
+    project_northing: Optional[float] = None,
+    climate_scenarios=LIGHT_CLIMATE_SCENARIOS,
+    cc_degree: float = 0.0,
+    TB_start=10,                # Start value for TB [min]
+    tol=1,                      # Convergence tolerance [mm]
+):
+    """
+    Mod. Fliesszeit and Kölla for all objects and climate scenarios of a project in one task.
+
+    Every method is evaluated in a single array call (``calculations.light_methods``)
+    giving the TB of the scalar tasks' stepping solver, and the results of all
+    objects and scenarios are upserted in one transaction.
+
+    Returns:
+        dict: ``{"mod_fliesszeit": {id: {climate_scenario: result}}, "koella": {...}}``;
+        objects whose evaluation failed map to ``{"error": message}``
+    """
+    return run_light_methods(
+        P_low_1h, P_high_1h, P_low_24h, P_high_24h, rp_low, rp_high,
+        mod_fliesszeit_objects, koella_objects, L, delta_H, Lg, E,
+        project_easting, project_northing, climate_scenarios, cc_degree, TB_start, tol,
+    )
+
+
+def _infiltration_parameters(WSV60min):
+    """Infiltration capacity ratio f0/fc and decay constant r for an array of WSV [mm]."""
+    f0_fc = np.select([WSV60min >= 30, WSV60min >= 25, WSV60min >= 20], [1, 2, 5], 8).astype(np.float64)
+    r = np.select([WSV60min >= 30, WSV60min >= 25, WSV60min >= 20], [0.0000001, 0.02, 0.04], 0.06)
+    return f0_fc, r
+
+
+def _clark_wsl_hydrograph(zone_cell_counts, fractions, discharge_types_parameters, Ptotal, Tc, dt, pixel_area_m2):
+    """
+    Clark WSL inflow W(t) and Muskingum-routed discharge Q(t) [m³/s].
+
+    The effective precipitation of every land use fraction is the same in all
+    zones, so the zone inflows are the zone areas times the area-weighted
+    fraction runoff. W is the running sum of the zone inflows and the linear
+    reservoir runs as an IIR filter.
+
+    Args:
+        zone_cell_counts: Number of cells per isozone (``isozone_cell_counts``)
+        fractions: List of {"typ", "pct"} land use fractions
+        discharge_types_parameters: dict: typ -> {"WSV", ...}
+        Ptotal: Total precipitation [mm]
+        Tc: Rain duration [min]
+        dt: Time step [min]
+        pixel_area_m2: Cell area [m²]
+
+    Returns:
+        tuple: (W, Q) as float64 arrays of length ``len(zone_cell_counts)``
+    """
+    n_zones = len(zone_cell_counts)
+    zone_area = np.asarray(zone_cell_counts, dtype=np.float64) * pixel_area_m2  # m²
+
+    # Fractions counted in the total area and the subset with known parameters
+    frac_all = np.array(
+        [f.get('pct') / 100 for f in fractions if not (pd.isna(f.get('pct')) or f.get('pct') == 0)],
+        dtype=np.float64,
+    )
+    known = [
+        f for f in fractions
+        if not (pd.isna(f.get('pct')) or f.get('pct') == 0) and f.get('typ') in discharge_types_parameters
+    ]
+    frac = np.array([f.get('pct') / 100 for f in known], dtype=np.float64)
+    WSV60min = np.array([discharge_types_parameters[str(f.get('typ'))]["WSV"] for f in known], dtype=np.float64)
+
+    # WSV correction and effective precipitation per fraction
+    WSVcorr = WSV60min * (0.5 + Tc / 120)
+    Peff = ((Ptotal - 0.2 * WSVcorr) ** 2) / (Ptotal + 0.8 * WSVcorr)
+    Pinfilt_total = Ptotal - Peff
+
+    # Infiltration capacity
+    f0_fc, r = _infiltration_parameters(WSV60min)
+    t_sec_z = Tc * 60 / n_zones
+
+    # Step 1: Distribute total infiltration across zones
+    Pinfilt_available = Pinfilt_total / n_zones
+
+    # Step 2: Compute fc from that available infiltration
+    denominator = t_sec_z + ((f0_fc - 1) / r) * (1 - np.exp(-r * t_sec_z))
+    fc = Pinfilt_available / denominator
+    f0 = f0_fc * fc
+
+    # Step 3: Reconstruct cumulative infiltration for the zone
+    Pinfilt_z = fc * t_sec_z + ((f0 - fc) / r) * (1 - np.exp(-r * t_sec_z))
+
+    # Step 4: Ensure that cumulative infiltration does not exceed available
+    Pinfilt_z = np.minimum(Pinfilt_z, Pinfilt_available)
+
+    # Effective precipitation after infiltration
+    P_step = np.maximum(Ptotal / n_zones - Pinfilt_z, 0)
+
+    # (zones × fractions) inflow [m³/s] summed over the fractions
+    W_iso = zone_area * float(np.sum(P_step * frac)) / 1000 / 60 / dt
+
+    # Clark W(t) by time step: every zone contributes from its arrival onwards
+    W = np.cumsum(W_iso)
 
     # Linear reservoir
-    WSV_mean = WSV_weighted_sum / total_area
-    WSV_corr_mean = WSV_corr_weighted_sum / total_area
+    total_area = float(np.sum(zone_area)) * float(np.sum(frac_all))
+    WSV_mean = float(np.sum(zone_area)) * float(np.sum(WSV60min * frac)) / total_area
 
     K = 2.25 * WSV_mean - 18.5  # in minutes
-    K_sec = K * 60 
+    K_sec = K * 60
 
     # Muskingum routing
     c1 = dt * 60 / (2 * K_sec + dt * 60)
@@ -805,76 +1023,163 @@ def clark_wsl_modified(self,
     c3 = (2 * K_sec - dt * 60) / (2 * K_sec + dt * 60)
 
     Q = np.zeros_like(W)
-    for t in range(1, len(Q)):
-        Q[t] = c1 * W[t] + c2 * W[t - 1] + c3 * Q[t - 1]
+    if len(Q) > 1:
+        # Q[t] = c1 W[t] + c2 W[t-1] + c3 Q[t-1] with Q[0] = 0
+        Q[1:], _ = lfilter([c1, c2], [1, -c3], W[1:], zi=[c2 * W[0]])
+    return W, Q
 
-    prisma = None
-    try:
-        # Use retry logic to handle concurrent connection attempts
-        prisma = connect_prisma_with_retry()
 
-        Q_max = float(np.max(Q))
+def clark_wsl_zone_cell_counts(project_id, user_id, allow_raster=True):
+    """
+    Cells per isozone of a project for Clark-WSL.
+
+    The counts are stored by ``prepare_discharge_hydroparameters``. Projects
+    prepared before the sidecar existed fall back to the isozone raster, unless
+    ``allow_raster`` is False, in which case None is returned.
+    """
+    project_dir = f"data/{user_id}/{project_id}"
+    zone_cell_counts = read_zone_cell_counts(project_dir)
+    if zone_cell_counts is None and allow_raster:
+        zone_cell_counts = isozone_cell_counts(read_raster(f"{project_dir}/isozones_cog.tif").data)
+    return zone_cell_counts
 
-        # Build the update data based on climate scenario
-        result_data = {
-            "Q": Q_max,
-            "W": 0,
-            "K": 0,
-            "Tc": 0
-        }
-        
-        # Use conditional logic to set the correct relation field
-        if climate_scenario == "1_5_degree":
-            data_update = {
-                'ClarkWSL_Result_1_5': {
-                    'upsert': {'update': result_data, 'create': result_data}
-                }
-            }
-        elif climate_scenario == "2_degree":
-            data_update = {
-                'ClarkWSL_Result_2': {
-                    'upsert': {'update': result_data, 'create': result_data}
-                }
-            }
-        elif climate_scenario == "3_degree":
-            data_update = {
-                'ClarkWSL_Result_3': {
-                    'upsert': {'update': result_data, 'create': result_data}
-                }
-            }
-        elif climate_scenario == "4_degree":
-            data_update = {
-                'ClarkWSL_Result_4': {
-                    'upsert': {'update': result_data, 'create': result_data}
-                }
-            }
-        else:  # current
-            data_update = {
-                'ClarkWSL_Result': {
-                    'upsert': {'update': result_data, 'create': result_data}
-                }
-            }
 
-        updatedResults = prisma.clarkwsl.update(
-            where = {
-                'id' : clark_wsl
-            },
-            data = data_update
+def _compute_clark_wsl(
+    P_low_1h, P_high_1h, P_low_24h, P_high_24h, rp_low, rp_high,
+    discharge_types_parameters, x, fractions_dict, zone_cell_counts,
+    project_easting, project_northing, climate_scenarios, cc_degree, dt, pixel_area_m2,
+):
+    max_zone = len(zone_cell_counts) - 1
+    Tc = dt * (max_zone + 1)
+
+    results = {}
+    for climate_scenario in climate_scenarios:
+        cc_factor = _climate_cc_factor(climate_scenario, cc_degree, project_easting, project_northing)
+        intensity_fn = construct_idf_curve(
+            P_low_1h,
+            P_high_1h,
+            P_low_24h,
+            P_high_24h,
+            rp_low,
+            rp_high,
+            cc_factor
         )
-    finally:
-        # Ensure cleanup even if update fails
-        if prisma is not None:
-            try:
-                prisma.disconnect(5)
-            except:
-                pass
+        Ptotal = intensity_fn(rp_years = x, duration_minutes = Tc) * (1 + cc_factor) * Tc / 60  # mm
+        W, Q = _clark_wsl_hydrograph(zone_cell_counts, fractions_dict, discharge_types_parameters, Ptotal, Tc, dt, pixel_area_m2)
+        results[climate_scenario] = {
+            "Q": Q.tolist(),
+            "W": W.tolist(),
+            # "K": K,
+            "Tc": Tc
+        }
+    return results
 
-    return {
-        "Q": Q.tolist(),
-        "W": W.tolist(),
-        # "K": K,
-        "Tc": Tc
-    }
+
+def run_clark_wsl(
+    P_low_1h, P_high_1h, P_low_24h, P_high_24h, rp_low, rp_high,
+    discharge_types_parameters, x, fractions_dict, clark_wsl, zone_cell_counts,
+    project_easting=None, project_northing=None, climate_scenarios=LIGHT_CLIMATE_SCENARIOS,
+    cc_degree=0.0, dt=10, pixel_area_m2=25, store=True,
+):
+    """
+    Evaluate and (with ``store``) persist Clark-WSL for several climate scenarios.
+
+    Shared by the ``clark-wsl`` task and the synchronous API path; the results
+    of all scenarios are upserted in one transaction. The zone cell counts stand in
+    for the isozone raster in the memoization key.
+
+    Returns:
+        dict: {climate_scenario: {"Q": [m³/s], "W": [m³/s], "Tc": [min]}}
+    """
+    params = dict(
+        P_low_1h=P_low_1h, P_high_1h=P_high_1h, P_low_24h=P_low_24h, P_high_24h=P_high_24h, rp_low=rp_low, rp_high=rp_high,
+        discharge_types_parameters=discharge_types_parameters, x=x, fractions=fractions_dict,
+        zone_cell_counts=[int(count) for count in zone_cell_counts], project_easting=project_easting, project_northing=project_northing,
+        climate_scenarios=list(climate_scenarios), cc_degree=cc_degree, dt=dt, pixel_area_m2=pixel_area_m2,
+    )
+    results = memoized("clark-wsl", params, lambda: _compute_clark_wsl(
+        P_low_1h, P_high_1h, P_low_24h, P_high_24h, rp_low, rp_high,
+        discharge_types_parameters, x, fractions_dict, zone_cell_counts,
+        project_easting, project_northing, climate_scenarios, cc_degree, dt, pixel_area_m2,
+    ))
+
+    if store:
+        stored = {
+            climate_scenario: {"Q": float(np.max(result["Q"])), "W": 0, "K": 0, "Tc": 0}
+            for climate_scenario, result in results.items()
+        }
+        _store_light_results("clarkwsl", CLARK_WSL_RESULT_RELATIONS, {clark_wsl: stored})
+    return results
+
+
+@app.task(name="clark-wsl", bind=True)
+def clark_wsl_modified(self,
+    P_low_1h,
+    P_high_1h,
+    P_low_24h,
+    P_high_24h,
+    rp_low,
+    rp_high, 
+    discharge_types_parameters,# dict: ID -> {"WSV", "psi"}
+    x,                         # Return period [y]
+    fractions_dict,            # Dict with fractions by zone
+    clark_wsl,                 # Clark WSL id
+    project_id,                # Project ID for getting isozone raster
+    user_id,                   # User ID for getting isozone raster
+    project_easting: Optional[float] = None,
+    project_northing: Optional[float] = None,
+    cc_degree: float = 0.0,
+    climate_scenario: str = "current",  # Climate scenario: "current", "1_5_degree", "2_degree", "3_degree", "4_degree"
+    intensity_fn=None,         # Precipitation intensity function: i(x, Tc) in mm/h
+    dt=10,                     # Time step [min]
+    pixel_area_m2=25           # Cell area [m²] (e.g. 5x5 m)
+):
+    zone_cell_counts = clark_wsl_zone_cell_counts(project_id, user_id)
+    results = run_clark_wsl(
+        P_low_1h, P_high_1h, P_low_24h, P_high_24h, rp_low, rp_high,
+        discharge_types_parameters, x, fractions_dict, clark_wsl, zone_cell_counts,
+        project_easting, project_northing, [climate_scenario], cc_degree, dt, pixel_area_m2,
+    )
+    return results[climate_scenario]
+
+
+@app.task(name="clark_wsl_batch", bind=True)
+def clark_wsl_batch(self,
+    P_low_1h,
+    P_high_1h,
+    P_low_24h,
+    P_high_24h,
+    rp_low,
+    rp_high,
+    discharge_types_parameters,# dict: ID -> {"WSV", "psi"}
+    x,                         # Return period [y]
+    fractions_dict,            # Dict with fractions by zone
+    clark_wsl,                 # Clark WSL id
+    project_id,                # Project ID for getting isozone raster
+    user_id,                   # User ID for getting isozone raster
+    project_easting: Optional[float] = None,
+    project_northing: Optional[float] = None,
+    climate_scenarios=LIGHT_CLIMATE_SCENARIOS,
+    cc_degree: float = 0.0,
+    dt=10,                     # Time step [min]
+    pixel_area_m2=25           # Cell area [m²] (e.g. 5x5 m)
+):
+    """
+    Clark-WSL for all climate scenarios of one object in one task.
+
+    The isozone histogram is read once and the results of all scenarios are
+    written in one transaction.
+
+    Returns:
+        dict: ``{"results": {climate_scenario: result}}``
+    """
+    zone_cell_counts = clark_wsl_zone_cell_counts(project_id, user_id)
+    results = run_clark_wsl(
+        P_low_1h, P_high_1h, P_low_24h, P_high_24h, rp_low, rp_high,
+        discharge_types_parameters, x, fractions_dict, clark_wsl, zone_cell_counts,
+        project_easting, project_northing, list(climate_scenarios), cc_degree, dt, pixel_area_m2,
+    )
+    return {"results": results}
 
 def _load_cc_factor_simple(degree: float = 2.0) -> float:
     if degree == 1.5:
@@ -1015,65 +1320,23 @@ def construct_idf_curve(
         rp_high:    Upper return period (e.g. 100) as string
         cc_factor:  Climate change factor
     Returns:
-        idf_intensity: function(duration_minutes, return_period_years) -> intensity [mm/h]
+        IDFCurve: callable(rp_years, duration_minutes) -> intensity [mm/h],
+        evaluated on scalars or broadcast arrays
     """
-
-    # Convert return periods from string to float
-    log_rp = np.log10([rp_low, rp_high2])
-    P_1h = [P_low_1h * (1 + cc_factor), P_high_1h * (1 + cc_factor)]
-    P_24h = [P_low_24h * (1 + cc_factor), P_high_24h * (1 + cc_factor)]
-
-    # Linear fit for 1h and 24h precipitation
-    coeffs_1h = np.polyfit(log_rp, P_1h, 1)
-    coeffs_24h = np.polyfit(log_rp, P_24h, 1)
-
-    # Climate change factor is applied in hydrologic tasks, not here
-
-    def precipitation_amount(duration_h, rp_years):
-        log_rp_val = np.log10(rp_years)
-        if duration_h == 1:
-            return coeffs_1h[0] * log_rp_val + coeffs_1h[1]
-        elif duration_h == 24:
-            return coeffs_24h[0] * log_rp_val + coeffs_24h[1]
-        else:
-            raise ValueError("Only 1h and 24h durations supported for precipitation amount.")
-
-    def idf_intensity(rp_years, duration_minutes):
-        # Convert return periods from string to float
-        duration_h = duration_minutes / 60.0
-        P1 = precipitation_amount(1, rp_years)
-        P24 = precipitation_amount(24, rp_years)
-        I1 = P1 / 1.0
-        I24 = P24 / 24.0
-        log_durations = np.log10([1, 24])
-        log_intensities = np.log10([I1, I24])
-        slope, intercept = np.polyfit(log_durations, log_intensities, 1)
-        log_duration = np.log10(duration_h)
-        log_intensity = slope * log_duration + intercept
-        return 10 ** log_intensity
-
-    return idf_intensity
+    return IDFCurve(P_low_1h, P_high_1h, P_low_24h, P_high_24h, rp_low, rp_high2, cc_factor)
 
 # Example usage:
 # idf_fn = construct_idf_curve(25, 50, 60, 120, 2.33, 100)
 
 def _clear_isozones_running_on_failure(project_id: str) -> None:
     """Reset isozones_running if the task fails before the success DB update."""
-    prisma = None
     try:
-        prisma = connect_prisma_with_retry()
-        prisma.project.update(
+        with_worker_prisma(lambda prisma: prisma.project.update(
             where={"id": project_id},
             data={"isozones_running": False},
-        )
+        ))
     except Exception:
         pass
-    finally:
-        if prisma is not None:
-            try:
-                prisma.disconnect(5)
-            except Exception:
-                pass
 
 
 @app.task(name="prepare_discharge_hydroparameters", bind=True)
@@ -1087,6 +1350,131 @@ def prepare_discharge_hydroparameters(self, projectId: str, userId: int, northin
         raise
 
 
+def _read_window_raster(path, window_bounds, clip=True):
+    """
+    Window of a national raster as a pysheds Raster, clipped to its valid data
+    unless ``clip`` is False.
+
+    The window is handed to pysheds through an uncompressed in-memory GeoTIFF,
+    so nodata, CRS and transform are interpreted exactly as by
+    ``Grid.read_raster`` without writing temporary files.
+    """
+    with rasterio.open(path) as src:
+        window = rasterio.windows.from_bounds(
+            window_bounds[0], window_bounds[1], window_bounds[2], window_bounds[3],
+            src.transform
+        ).round_offsets().round_lengths()
+        data = src.read(1, window=window)
+        profile = src.profile.copy()
+        profile.update({
+            'driver': 'GTiff',
+            'height': window.height,
+            'width': window.width,
+            'transform': rasterio.windows.transform(window, src.transform)
+        })
+    profile.pop('compress', None)
+
+    with MemoryFile() as memfile:
+        with memfile.open(**profile) as mem:
+            mem.write(data, 1)
+        del data
+        raster = Grid().read_raster(memfile.name)
+
+    if not clip:
+        return raster
+    grid = Grid.from_raster(raster)
+    grid.clip_to(raster)
+    return grid.view(raster)
+
+
+def _window_bounds(northing, easting, half_window_m, dataset_bounds):
+    """Square window around the outlet, clipped to the dataset extent."""
+    requested_bounds = (
+        northing - half_window_m,
+        easting - half_window_m,
+        northing + half_window_m,
+        easting + half_window_m
+    )
+    window_bounds = (
+        max(requested_bounds[0], dataset_bounds[0]),
+        max(requested_bounds[1], dataset_bounds[1]),
+        min(requested_bounds[2], dataset_bounds[2]),
+        min(requested_bounds[3], dataset_bounds[3]),
+    )
+    if window_bounds[0] >= window_bounds[2] or window_bounds[1] >= window_bounds[3]:
+        raise ValueError(
+            f"Requested outlet window does not overlap DEM extent. "
+            f"requested={requested_bounds} dem_bounds={dataset_bounds}"
+        )
+    return window_bounds
+
+
+def _catchment_touches_window_edge(catch, grid_bbox, window_bounds, dataset_bounds, cell_size):
+    """
+    Whether the catchment reaches an edge of the window that a larger window
+    would move, i.e. it may continue outside the window.
+
+    Edges where the grid was clipped to valid data or the window ends at the
+    dataset extent cannot be extended and do not count.
+    """
+    mask = np.asarray(catch, dtype=bool)
+    # (touches, side) for west, south, east, north in bbox order
+    touches = (mask[:, 0].any(), mask[-1, :].any(), mask[:, -1].any(), mask[0, :].any())
+    for side, touched in enumerate(touches):
+        at_window_edge = abs(grid_bbox[side] - window_bounds[side]) < cell_size
+        can_grow = abs(window_bounds[side] - dataset_bounds[side]) >= cell_size
+        if touched and at_window_edge and can_grow:
+            return True
+    return False
+
+
+def _predicted_window_half_size(northing, easting, a_crit, cell_size, snap_radius_m=250):
+    """
+    Half window size expected to contain the catchment, or None without a
+    current national accumulation.
+
+    Reads the national accumulation at the channel cell nearest to the outlet
+    (as snapped by the delineation) and sizes the window by Hack's law
+    (main stream length ≈ 1.4 km · A[km²]^0.6) plus a margin.
+    """
+    if not accumulation_is_current(FLOW_ACCUMULATION_FILE, 'data/d8.tif'):
+        return None
+    with rasterio.open(FLOW_ACCUMULATION_FILE) as src:
+        window = rasterio.windows.from_bounds(
+            northing - snap_radius_m, easting - snap_radius_m,
+            northing + snap_radius_m, easting + snap_radius_m,
+            src.transform
+        ).round_offsets().round_lengths()
+        acc = src.read(1, window=window, boundless=True, fill_value=0)
+        transform = rasterio.windows.transform(window, src.transform)
+    rows, cols = np.nonzero(acc > a_crit)
+    if len(rows) == 0:
+        return None
+    xs, ys = rasterio.transform.xy(transform, rows, cols)
+    nearest = np.argmin((np.asarray(xs) - northing) ** 2 + (np.asarray(ys) - easting) ** 2)
+    area_km2 = float(acc[rows[nearest], cols[nearest]]) * cell_size ** 2 / 1e6
+    return 1400 * area_km2 ** 0.6 + 500
+
+
+def _initial_window_half_size(northing, easting, a_crit, cell_size, use_accumulation_file,
+                              initial_half_window_m, max_half_window_m, predict=True):
+    """
+    Half size of the first delineation window.
+
+    Without a current national accumulation the window is accumulated on its
+    own, so the channel the outlet snaps to depends on the window size; the
+    window then starts at ``max_half_window_m`` and does not grow.
+    """
+    if not use_accumulation_file:
+        return max_half_window_m
+    half_window_m = initial_half_window_m
+    if predict:
+        predicted = _predicted_window_half_size(northing, easting, a_crit, cell_size)
+        if predicted is not None:
+            half_window_m = max(initial_half_window_m, predicted)
+    return min(half_window_m, max_half_window_m)
+
+
 def _prepare_discharge_hydroparameters_impl(self, projectId: str, userId: int, northing: float, easting: float, a_crit = 3000, v_gerinne = 1.5):
     # Send immediate progress update to indicate task has started
     self.update_state(state='PROGRESS',
@@ -1104,146 +1492,69 @@ def _prepare_discharge_hydroparameters_impl(self, projectId: str, userId: int, n
     # Optimized: Use rasterio directly for windowed reading (faster than Grid.from_raster + read_raster)
     # This avoids opening the full raster file before reading the window
     self.update_state(state='PROGRESS',
-                meta={'text': 'Reading DEM window', 'progress' : 10})
+                meta={'text': 'Sizing the delineation window', 'progress' : 10})
     
-    # Calculate requested bounds around the outlet point (x, y in EPSG:2056).
-    half_window_m = float(os.getenv("DISCHARGE_WINDOW_HALF_SIZE_M", "12000"))
-    requested_bounds = (
-        northing - half_window_m,
-        easting - half_window_m,
-        northing + half_window_m,
-        easting + half_window_m
-    )
-    
-    # Use rasterio directly for faster windowed reading
+    # Delineate in a window around the outlet (x, y in EPSG:2056) that starts at
+    # the size predicted from the national accumulation (or a small default) and
+    # grows geometrically only while the catchment touches its edge. Without the
+    # national accumulation the full window is used (_initial_window_half_size).
+    max_half_window_m = float(os.getenv("DISCHARGE_WINDOW_HALF_SIZE_M", "12000"))
+    initial_half_window_m = float(os.getenv("DISCHARGE_WINDOW_INITIAL_HALF_SIZE_M", "2000"))
+    window_growth = float(os.getenv("DISCHARGE_WINDOW_GROWTH", "2"))
+    #d8_file = 'data/d8_besoagluaraiti_int.tif'
+    d8_file = 'data/d8.tif'
+    use_accumulation_file = accumulation_is_current(FLOW_ACCUMULATION_FILE, d8_file)
+
     with rasterio.open(dem_file) as src:
-        dem_crs = src.crs
-        # Clip requested bounds to dataset extent to avoid out-of-range windows.
-        window_bounds = (
-            max(requested_bounds[0], src.bounds.left),
-            max(requested_bounds[1], src.bounds.bottom),
-            min(requested_bounds[2], src.bounds.right),
-            min(requested_bounds[3], src.bounds.top),
-        )
-        if window_bounds[0] >= window_bounds[2] or window_bounds[1] >= window_bounds[3]:
-            raise ValueError(
-                f"Requested outlet window does not overlap DEM extent. "
-                f"requested={requested_bounds} dem_bounds={src.bounds}"
-            )
+        dataset_bounds = tuple(src.bounds)
 
-        window = rasterio.windows.from_bounds(
-            window_bounds[0], window_bounds[1], window_bounds[2], window_bounds[3],
-            src.transform
-        ).round_offsets().round_lengths()
-        # Read the windowed data directly
-        dem_data = src.read(1, window=window)
-        window_transform = rasterio.windows.transform(window, src.transform)
-        
-        # Save the windowed DEM to temp file for Grid operations
-        temp_dem_path = f'data/temp/{projectId}_smalldem.tif'
-        os.makedirs(os.path.dirname(temp_dem_path), exist_ok=True)
-        
-        profile = src.profile.copy()
-        profile.update({
-            'height': window.height,
-            'width': window.width,
-            'transform': window_transform
-        })
-        with rasterio.open(temp_dem_path, 'w', **profile) as dst:
-            dst.write(dem_data, 1)
-    
-    # Free windowed DEM data now that it's written to disk
-    del dem_data
-    
-    # Now create Grid from the smaller windowed file (much faster)
-    self.update_state(state='PROGRESS',
-                meta={'text': 'Processing DEM', 'progress' : 15})
-    grid = Grid.from_raster(temp_dem_path)
-    dem = grid.read_raster(temp_dem_path)
-    grid.clip_to(dem)
-    small_view = grid.view(dem)
-    grid.to_raster(dem, temp_dem_path, target_view=small_view)
-
-    del grid, dem, small_view
-    gc.collect()
-    self.update_state(state='PROGRESS',
-                meta={'text': 'Reading flow direction', 'progress' : 25})
+    half_window_m = _initial_window_half_size(
+        northing, easting, a_crit, cell_size, use_accumulation_file,
+        initial_half_window_m, max_half_window_m,
+        predict=os.getenv("DISCHARGE_WINDOW_PREDICT", "1") == "1",
+    )
 
-    #d8_file = 'data/d8_besoagluaraiti_int.tif'
-    d8_file = 'data/d8.tif'
-    
-    # Optimized: Use rasterio directly for windowed reading (same optimization as DEM)
-    with rasterio.open(d8_file) as src:
-        # Calculate window from bounds (same as DEM)
-        window = rasterio.windows.from_bounds(
-            window_bounds[0], window_bounds[1], window_bounds[2], window_bounds[3],
-            src.transform
-        ).round_offsets().round_lengths()
-        # Read the windowed data directly
-        fdir_data = src.read(1, window=window)
-        window_transform = rasterio.windows.transform(window, src.transform)
-        
-        # Save the windowed flow direction to temp file
-        temp_fdir_path = f'data/temp/{projectId}_smallfdir.tif'
-        os.makedirs(os.path.dirname(temp_fdir_path), exist_ok=True)
-        
-        profile = src.profile.copy()
-        profile.update({
-            'height': window.height,
-            'width': window.width,
-            'transform': window_transform
-        })
-        with rasterio.open(temp_fdir_path, 'w', **profile) as dst:
-            dst.write(fdir_data, 1)
-    
-    # Free windowed fdir data now that it's written to disk
-    del fdir_data
-    
-    # Create Grid from the smaller windowed file
-    grid = Grid.from_raster(temp_fdir_path)
-    fdir = grid.read_raster(temp_fdir_path)
-    grid.clip_to(fdir)
-    small_view = grid.view(fdir)
-    grid.to_raster(fdir, temp_fdir_path, target_view=small_view)
-
-    del grid, small_view
-    gc.collect()
+    while True:
+        window_bounds = _window_bounds(northing, easting, half_window_m, dataset_bounds)
+        self.update_state(state='PROGRESS',
+                    meta={'text': f'Reading flow direction ({2 * half_window_m / 1000:.0f} km window)', 'progress' : 15})
+        fdir = _read_window_raster(d8_file, window_bounds)
+        gc.collect()
+        grid2 = Grid.from_raster(fdir)
+
+        # Window of the precomputed national accumulation, so cells near the window
+        # edge count their full upstream area; accumulate the window if it is missing
+        # or was built from another version of d8.tif
+        if use_accumulation_file:
+            acc = grid2.view(_read_window_raster(FLOW_ACCUMULATION_FILE, window_bounds, clip=False))
+        else:
+            acc = grid2.accumulation(fdir, dirmap=dirmap)
 
+        self.update_state(state='PROGRESS',
+                    meta={'text': 'Delineate the catchment', 'progress' : 25})
 
-    grid2 = Grid.from_raster(temp_fdir_path)
-    """    
-    self.update_state(state='PROGRESS',
-                meta={'text': 'Compute flow directions: Fill pits', 'progress' : 8})
-    
+        # Delineate the catchment
+        x_snap, y_snap = grid2.snap_to_mask(acc > a_crit, (northing, easting))
+        catch = grid2.catchment(x=x_snap, y=y_snap, fdir=fdir, dirmap=dirmap,
+                            xytype='coordinate')
 
-    # calculate accumulation
+        if half_window_m >= max_half_window_m or not _catchment_touches_window_edge(
+            catch, grid2.bbox, window_bounds, dataset_bounds, cell_size
+        ):
+            break
+        half_window_m = min(half_window_m * window_growth, max_half_window_m)
+        del fdir, grid2, acc, catch
+        gc.collect()
 
-    pit_filled_dem = grid2.fill_pits(dem)
-    
-    self.update_state(state='PROGRESS',
-                meta={'text': 'Compute flow directions: Fill depressions', 'progress' : 16})
-    flooded_dem = grid2.fill_depressions(pit_filled_dem)
-    
-    self.update_state(state='PROGRESS',
-                meta={'text': 'Compute flow directions: Resolve flats', 'progress' : 22})
-    inflated_dem = grid2.resolve_flats(flooded_dem)
-    self.update_state(state='PROGRESS',
-                meta={'text': 'Compute flow directions: Accumulation', 'progress' : 40})
-    fdir = grid2.flowdir(inflated_dem, dirmap=dirmap)    
-    """
-    
-    acc = grid2.accumulation(fdir, dirmap=dirmap)
+    if not use_accumulation_file:
+        print(f"{FLOW_ACCUMULATION_FILE} missing or stale, accumulated the full window")
 
-    
+    # DEM window clipped to its valid data; kept for ΔH and slope below
     self.update_state(state='PROGRESS',
-                meta={'text': 'Delineate the catchment', 'progress' : 50})
-    
+                meta={'text': 'Processing DEM', 'progress' : 50})
+    dem = _read_window_raster(dem_file, window_bounds)
+    gc.collect()
 
-    # Delineate the catchment
-    x_snap, y_snap = grid2.snap_to_mask(acc > a_crit, (northing, easting))
-    catch = grid2.catchment(x=x_snap, y=y_snap, fdir=fdir, dirmap=dirmap, 
-                        xytype='coordinate')
-          
     # Clip the bounding box to the catchment
     grid2.clip_to(catch)
 
@@ -1257,8 +1568,7 @@ def _prepare_discharge_hydroparameters_impl(self, projectId: str, userId: int, n
     branches = grid2.extract_river_network(fdir, acc > a_crit, dirmap=dirmap)
     L_cum = cumulative_length(branches)
 
-    # Reload DEM and compute elevation range strictly within the catchment.
-    dem = grid2.read_raster(temp_dem_path)
+    # Elevation range strictly within the catchment.
     dem_values = np.asarray(np.ma.filled(dem, np.nan), dtype=np.float64)
     catch_mask = np.asarray(catch, dtype=bool)
     dem_values[~catch_mask] = np.nan
@@ -1311,21 +1621,7 @@ def _prepare_discharge_hydroparameters_impl(self, projectId: str, userId: int, n
     self.update_state(state='PROGRESS',
                 meta={'text': 'Calculating obstacle layer', 'progress' : 80})
     acc_view = grid2.view(acc)
-    obstacle_grid = acc_view.copy()
-    
-    obstacle_grid = np.where(np.logical_and(np.logical_and(slope_percentage < 1,slope_percentage>-100), forests_raster==1), 3000,obstacle_grid)
-    obstacle_grid = np.where(np.logical_and(np.logical_and(slope_percentage < 1,slope_percentage>-100), forests_raster==0), 1500,obstacle_grid)
-    obstacle_grid = np.where(np.logical_and(np.logical_and(slope_percentage >= 1,slope_percentage<5), forests_raster==1), 1500, obstacle_grid)
-    obstacle_grid = np.where(np.logical_and(np.logical_and(slope_percentage >= 1,slope_percentage<5), forests_raster==0), 750, obstacle_grid)
-    obstacle_grid = np.where(np.logical_and(np.logical_and(slope_percentage >= 5,slope_percentage<10), forests_raster==1), 750, obstacle_grid)
-    obstacle_grid = np.where(np.logical_and(np.logical_and(slope_percentage >= 5,slope_percentage<10), forests_raster==0), 375, obstacle_grid)
-    obstacle_grid = np.where(np.logical_and(np.logical_and(slope_percentage >= 10,slope_percentage<20), forests_raster==1), 500, obstacle_grid)
-    obstacle_grid = np.where(np.logical_and(np.logical_and(slope_percentage >= 10,slope_percentage<20), forests_raster==0), 250, obstacle_grid)
-    obstacle_grid = np.where(np.logical_and(np.logical_and(slope_percentage >= 20,slope_percentage<40), forests_raster==1), 375, obstacle_grid)
-    obstacle_grid = np.where(np.logical_and(np.logical_and(slope_percentage >= 20,slope_percentage<40), forests_raster==0), 188, obstacle_grid)
-    obstacle_grid = np.where(np.logical_and(slope_percentage >= 40, forests_raster==1), 300, obstacle_grid)
-    obstacle_grid = np.where(np.logical_and(slope_percentage >= 40, forests_raster==0), 150, obstacle_grid)
-    obstacle_grid = np.where(acc_view>a_crit, 100, obstacle_grid)
+    obstacle_grid = obstacle_weights(slope_percentage, forests_raster, acc_view, a_crit)
 
     obstacle_raster = Raster(obstacle_grid, viewfinder=grid2.viewfinder)
 
@@ -1333,16 +1629,17 @@ def _prepare_discharge_hydroparameters_impl(self, projectId: str, userId: int, n
     del slope_percentage, forests_raster, acc_view, obstacle_grid
     gc.collect()
 
-    # Compute maximum distance to outlet
+    # Weighted distance to the outlet and maximum (unweighted) distance from one
+    # walk up the flow directions
     
     self.update_state(state='PROGRESS',
                 meta={'text': 'Calculate distance', 'progress' : 85})
-    dist = grid2.distance_to_outlet(x=x_snap, y=y_snap, fdir=fdir, xytype='coordinate', mask=grid2.mask, dirmap=dirmap)
-    dist *= cell_size
-    dist[~np.isfinite(dist)] = -1000000
-    dist_max = np.nanmax(dist)
-
-    dist = grid2.distance_to_outlet(x=x_snap, y=y_snap, fdir=fdir, xytype='coordinate', mask=grid2.mask, dirmap=dirmap, weights=obstacle_raster)
+    outlet_col, outlet_row = grid2.nearest_cell(x_snap, y_snap, snap='corner')
+    dist, max_steps = distances_to_outlet(
+        grid2.view(fdir, mask=grid2.mask), obstacle_raster, (outlet_row, outlet_col), dirmap
+    )
+    dist = Raster(dist, viewfinder=ViewFinder(**{**grid2.viewfinder.properties, 'nodata': np.nan}))
+    dist_max = np.float64(max_steps * cell_size)
 
     # Free obstacle raster and accumulation — no longer needed
     del obstacle_raster, acc
@@ -1448,6 +1745,13 @@ def _prepare_discharge_hydroparameters_impl(self, projectId: str, userId: int, n
             with rasterio.open(raw_time_filename, 'w', **raw_time_profile) as dst:
                 dst.write(np.asarray(raw_time_values, dtype=np.float32), 1)
 
+    # Store the isozone and time value histograms so that Clark-WSL does not read the rasters
+    write_isozone_histogram(
+        f"data/{userId}/{projectId}",
+        isozone_cell_counts(np.asarray(dist)),
+        time_value_histogram(raw_time_values),
+    )
+
     # Free raster data after writing — only scalar results needed from here
     del dist, raw_time_values, small_view2, fdir
     gc.collect()
@@ -1484,46 +1788,33 @@ def _prepare_discharge_hydroparameters_impl(self, projectId: str, userId: int, n
     with open(f"data/{userId}/{projectId}/catchment.geojson", 'r') as file:
         data = json.load(file)
 
+    # Files generated from the previous catchment (DEM clip, curve numbers) are stale now
+    prepare_inputs = inputs_hash(
+        northing=northing, easting=easting, a_crit=a_crit, v_gerinne=v_gerinne,
+        half_window_m=half_window_m, source=file_signature(dem_file),
+    )
+    for filename in ("isozones_cog.tif", "time_values.tif", "catchment.geojson"):
+        record_artifact(f"data/{userId}/{projectId}", filename, prepare_inputs)
+
 
     self.update_state(state='PROGRESS',
             meta={'text': 'Save to database', 'progress' : 99})    
 
-    prisma = None
-    try:
-        # Use retry logic to handle concurrent connection attempts
-        prisma = connect_prisma_with_retry()
-        
-        updatedProject = prisma.project.update(
-            where = {
-                'id' :  projectId
-            },
-            data = {
-                'isozones_running': False,
-                'catchment_geojson': json.dumps(data),
-                'branches_geojson': json.dumps(branches),
-                'channel_length': dist_max.item(),
-                'catchment_area': catchmentkm2.item(),
-                'cummulative_channel_length': L_cum,
-                'delta_h': delta_H,
-
-            },
-            )
-    finally:
-        # Ensure cleanup even if update fails
-        if prisma is not None:
-            try:
-                prisma.disconnect(5)
-            except:
-                pass
-    
-    # Clean up temp files to avoid disk accumulation
-    try:
-        if os.path.exists(temp_dem_path):
-            os.remove(temp_dem_path)
-        if os.path.exists(temp_fdir_path):
-            os.remove(temp_fdir_path)
-    except Exception:
-        pass  # Non-critical cleanup failure
+    updatedProject = with_worker_prisma(lambda prisma: prisma.project.update(
+        where = {
+            'id' :  projectId
+        },
+        data = {
+            'isozones_running': False,
+            'catchment_geojson': json.dumps(data),
+            'branches_geojson': json.dumps(branches),
+            'channel_length': dist_max.item(),
+            'catchment_area': catchmentkm2.item(),
+            'cummulative_channel_length': L_cum,
+            'delta_h': delta_H,
+
+        },
+        ))
     
     self.update_state(state='PROGRESS',
                 meta={'text': 'Finish', 'progress' : 100})
@@ -0,0 +1,242 @@
+"""
+Flow accumulation of the national D8 raster, computed tile by tile.
+
+``scripts/build_flow_accumulation.py`` writes ``FLOW_ACCUMULATION_FILE``, a
+tiled, deflate-compressed COG aligned to ``data/d8.tif`` holding the number of
+cells draining through every cell of the whole national grid.
+``prepare_discharge_hydroparameters`` reads a window of it instead of
+accumulating the flow directions of its window, so the accumulation no longer
+depends on the window size.
+
+Accumulation is linear in the cell weights, so the national grid is processed
+in two passes over the tiles without holding more than one tile in memory:
+
+1. Accumulate every tile on its own and record, for every exit cell (a cell
+   draining into a neighbouring tile), its local accumulation and the cell it
+   drains into, and for every border cell the exit cell its flow leaves the
+   tile through.
+2. Route the exit accumulations through the (small) graph of exit cells, which
+   gives the inflow every tile receives at its border, and accumulate every
+   tile again with those inflows added to the weights of the receiving cells.
+
+Within a tile cells are ordered by their depth in the flow tree (pointer
+jumping) and accumulated level by level, so everything is vectorised NumPy.
+"""
+
+import os
+
+import numpy as np
+import rasterio
+
+
+FLOW_ACCUMULATION_FILE = os.getenv("FLOW_ACCUMULATION_FILE", "data/flow_accumulation_cog.tif")
+
+# D8 codes of data/d8.tif in pysheds order: N, NE, E, SE, S, SW, W, NW
+D8_DIRMAP = (1, 2, 3, 4, 5, 6, 7, 8)
+_D8_OFFSETS = ((-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1))
+
+# Tags of the accumulation COG identifying the D8 raster it was built from
+SOURCE_SIZE_TAG = "d8_size"
+SOURCE_MTIME_TAG = "d8_mtime_ns"
+
+
+def _downstream_cells(fdir, dirmap=D8_DIRMAP):
+    """
+    Row and column of the downstream cell of every cell (possibly outside the
+    array) and the mask of cells with a flow direction.
+    """
+    rows, cols = np.indices(fdir.shape)
+    target_rows = rows.copy()
+    target_cols = cols.copy()
+    has_direction = np.zeros(fdir.shape, dtype=bool)
+    for code, (drow, dcol) in zip(dirmap, _D8_OFFSETS):
+        cells = fdir == code
+        target_rows[cells] += drow
+        target_cols[cells] += dcol
+        has_direction |= cells
+    return target_rows, target_cols, has_direction
+
+
+def flow_tree_depth(down):
+    """
+    Root and depth of every node of a flow forest by pointer jumping.
+
+    Args:
+        down: Index of the downstream node of every node; roots point to themselves
+
+    Returns:
+        tuple: (root, depth) int64 arrays
+
+    Raises:
+        ValueError: If the flow directions contain a cycle
+    """
+    down = np.asarray(down, dtype=np.int64)
+    n = len(down)
+    is_root = down == np.arange(n)
+    pointer = down.copy()
+    depth = (~is_root).astype(np.int64)
+    # Every path reaches its root within ceil(log2(n)) doublings
+    for _ in range(int(np.ceil(np.log2(max(n, 2)))) + 1):
+        if is_root[pointer].all():
+            return pointer, depth
+        depth = depth + depth[pointer]
+        pointer = pointer[pointer]
+    raise ValueError("Flow directions contain a cycle")
+
+
+def accumulate(down, weights, depth):
+    """
+    Sum of the weights of every node and all nodes upstream of it.
+
+    Nodes are processed from the deepest level up, so every node has received
+    the sums of its upstream nodes before it passes its own sum on.
+    """
+    acc = np.asarray(weights, dtype=np.float64).copy()
+    order = np.argsort(depth, kind="stable")
+    sorted_depth = depth[order]
+    starts = np.searchsorted(sorted_depth, np.arange(int(sorted_depth[-1]) + 2) if len(order) else [0])
+    for level in range(len(starts) - 2, 0, -1):
+        nodes = order[starts[level]:starts[level + 1]]
+        np.add.at(acc, down[nodes], acc[nodes])
+    return acc
+
+
+class _Tile:
+    """Flow tree of one tile of the national grid."""
+
+    def __init__(self, fdir, row0, col0, shape, nodata, dirmap=D8_DIRMAP):
+        height, width = fdir.shape
+        self.row0, self.col0 = row0, col0
+        self.shape = fdir.shape
+        self.valid = fdir != nodata if nodata is not None else np.ones(fdir.shape, dtype=bool)
+
+        target_rows, target_cols, has_direction = _downstream_cells(fdir, dirmap)
+        inside = has_direction & (target_rows >= 0) & (target_rows < height) & (target_cols >= 0) & (target_cols < width)
+        own = np.arange(height * width, dtype=np.int64)
+        self.down = np.where(inside, target_rows * width + target_cols, own.reshape(fdir.shape)).ravel()
+        self.root, self.depth = flow_tree_depth(self.down)
+
+        # Cells draining into a neighbouring tile of the national grid
+        global_rows = target_rows + row0
+        global_cols = target_cols + col0
+        leaving = has_direction & ~inside & self.valid
+        leaving &= (global_rows >= 0) & (global_rows < shape[0]) & (global_cols >= 0) & (global_cols < shape[1])
+        self.exits = np.flatnonzero(leaving)
+        self.exit_targets = (global_rows.ravel()[self.exits] * shape[1] + global_cols.ravel()[self.exits]).astype(np.int64)
+
+    def global_index(self, local_index, national_width):
+        rows, cols = np.divmod(local_index, self.shape[1])
+        return (rows + self.row0) * national_width + cols + self.col0
+
+    def border(self):
+        """Local indices of the cells on the tile border."""
+        mask = np.zeros(self.shape, dtype=bool)
+        mask[[0, -1], :] = True
+        mask[:, [0, -1]] = True
+        return np.flatnonzero(mask)
+
+    def accumulate(self, inflow_cells=None, inflow=None):
+        weights = self.valid.ravel().astype(np.float64)
+        if inflow_cells is not None and len(inflow_cells):
+            np.add.at(weights, inflow_cells, inflow)
+        acc = accumulate(self.down, weights, self.depth)
+        acc[~self.valid.ravel()] = 0
+        return acc.reshape(self.shape)
+
+
+def _tiles(shape, tile_size):
+    for row0 in range(0, shape[0], tile_size):
+        for col0 in range(0, shape[1], tile_size):
+            yield row0, col0, min(tile_size, shape[0] - row0), min(tile_size, shape[1] - col0)
+
+
+def build_flow_accumulation(read_tile, write_tile, shape, tile_size=2048, nodata=None, dirmap=D8_DIRMAP, progress=None):
+    """
+    Flow accumulation of a D8 raster too large to process at once.
+
+    Args:
+        read_tile: ``read_tile(row0, col0, height, width)`` -> D8 codes of the tile
+        write_tile: ``write_tile(row0, col0, acc)`` receives the float64 accumulation
+            (number of valid cells draining through each cell, 0 on nodata)
+        shape: (rows, cols) of the whole raster
+        tile_size: Tile edge length [cells]
+        nodata: D8 nodata value
+        dirmap: D8 codes of N, NE, E, SE, S, SW, W, NW
+        progress: Optional ``progress(message)`` callback
+    """
+    width = shape[1]
+    tiles = list(_tiles(shape, tile_size))
+
+    # Pass 1: local accumulation of the exit cells and border routing of every tile
+    exit_cells, exit_local, exit_targets = [], [], []
+    border_cells, border_exits = [], []
+    for k, (row0, col0, height, tile_width) in enumerate(tiles):
+        tile = _Tile(read_tile(row0, col0, height, tile_width), row0, col0, shape, nodata, dirmap)
+        local = tile.accumulate().ravel()
+        exit_cells.append(tile.global_index(tile.exits, width))
+        exit_local.append(local[tile.exits])
+        exit_targets.append(tile.exit_targets)
+
+        border = tile.border()
+        border_roots = tile.root[border]
+        is_exit = np.isin(border_roots, tile.exits)
+        border_cells.append(tile.global_index(border[is_exit], width))
+        border_exits.append(tile.global_index(border_roots[is_exit], width))
+        if progress:
+            progress(f"pass 1: tile {k + 1}/{len(tiles)}")
+        del tile, local
+
+    exit_cells = np.concatenate(exit_cells) if exit_cells else np.zeros(0, dtype=np.int64)
+    exit_local = np.concatenate(exit_local) if exit_local else np.zeros(0)
+    exit_targets = np.concatenate(exit_targets) if exit_targets else np.zeros(0, dtype=np.int64)
+    border_cells = np.concatenate(border_cells) if border_cells else np.zeros(0, dtype=np.int64)
+    border_exits = np.concatenate(border_exits) if border_exits else np.zeros(0, dtype=np.int64)
+
+    # Route the exit accumulations: the flow entering a tile leaves it again through
+    # the exit its entry cell drains to
+    exit_order = np.argsort(exit_cells)
+    sorted_exits = exit_cells[exit_order]
+    border_order = np.argsort(border_cells)
+    sorted_border = border_cells[border_order]
+
+    next_exit = np.arange(len(exit_cells), dtype=np.int64)
+    if len(sorted_border):
+        position = np.minimum(np.searchsorted(sorted_border, exit_targets), len(sorted_border) - 1)
+        routed = sorted_border[position] == exit_targets
+        downstream_exit = border_exits[border_order[position[routed]]]
+        next_exit[routed] = exit_order[np.searchsorted(sorted_exits, downstream_exit)]
+    _, exit_depth = flow_tree_depth(next_exit)
+    exit_total = accumulate(next_exit, exit_local, exit_depth)
+
+    inflow_cells, inverse = np.unique(exit_targets, return_inverse=True)
+    inflow = np.bincount(inverse, weights=exit_total, minlength=len(inflow_cells))
+
+    # Pass 2: accumulate every tile with the inflow at its border
+    for k, (row0, col0, height, tile_width) in enumerate(tiles):
+        tile = _Tile(read_tile(row0, col0, height, tile_width), row0, col0, shape, nodata, dirmap)
+        rows, cols = np.divmod(inflow_cells, width)
+        in_tile = (rows >= row0) & (rows < row0 + height) & (cols >= col0) & (cols < col0 + tile_width)
+        local_cells = (rows[in_tile] - row0) * tile_width + cols[in_tile] - col0
+        write_tile(row0, col0, tile.accumulate(local_cells, inflow[in_tile]))
+        if progress:
+            progress(f"pass 2: tile {k + 1}/{len(tiles)}")
+        del tile
+
+
+def accumulation_is_current(accumulation_path, d8_path):
+    """
+    Whether ``accumulation_path`` exists, is aligned to ``d8_path`` and was
+    built from its current version.
+    """
+    if not (os.path.exists(accumulation_path) and os.path.exists(d8_path)):
+        return False
+    stat = os.stat(d8_path)
+    with rasterio.open(accumulation_path) as acc, rasterio.open(d8_path) as d8:
+        tags = acc.tags()
+        return (
+            acc.shape == d8.shape
+            and acc.transform == d8.transform
+            and acc.crs == d8.crs
+            and tags.get(SOURCE_SIZE_TAG) == str(stat.st_size)
+            and tags.get(SOURCE_MTIME_TAG) == str(stat.st_mtime_ns)
+        )
@@ -0,0 +1,69 @@
+"""
+Distances to the catchment outlet along the D8 flow directions.
+
+``prepare_discharge_hydroparameters`` needs the weighted flow distance of
+every cell (isozone times) and the length of the longest flow path (channel
+length). Both come from one breadth-first walk up the D8 tree from the outlet
+instead of two runs of ``Grid.distance_to_outlet``; the unweighted distance of
+a cell is its level in the walk, so only its maximum is kept.
+"""
+
+import numpy as np
+
+from calculations.flow_accumulation import D8_DIRMAP, _D8_OFFSETS
+
+
+def distances_to_outlet(fdir, weights, outlet, dirmap=D8_DIRMAP):
+    """
+    Weighted distance of every cell to the outlet and the longest path length.
+
+    Follows the conventions of ``Grid.distance_to_outlet``: the outlet has
+    distance 0, every other cell the sum of the weights of the cells on its
+    flow path, itself included and the outlet excluded. Cells not draining to
+    the outlet are inf.
+
+    Args:
+        fdir: D8 codes
+        weights: Weight of every cell
+        outlet: (row, col) of the outlet
+        dirmap: D8 codes of N, NE, E, SE, S, SW, W, NW
+
+    Returns:
+        tuple: (weighted distance float64 array, number of cells on the longest
+        path to the outlet, the outlet excluded)
+    """
+    fdir = np.asarray(fdir)
+    weights = np.asarray(weights, dtype=np.float64)
+    height, width = fdir.shape
+    dist = np.full(fdir.shape, np.inf)
+    dist[outlet] = 0.0
+
+    frontier_rows = np.array([outlet[0]])
+    frontier_cols = np.array([outlet[1]])
+    frontier_dist = np.zeros(1)
+    max_steps = 0
+    while True:
+        up_rows, up_cols, down_dist = [], [], []
+        for code, (drow, dcol) in zip(dirmap, _D8_OFFSETS):
+            # Neighbours on the opposite side draining into the frontier
+            rows = frontier_rows - drow
+            cols = frontier_cols - dcol
+            inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+            drains = np.zeros(inside.shape, dtype=bool)
+            drains[inside] = fdir[rows[inside], cols[inside]] == code
+            up_rows.append(rows[drains])
+            up_cols.append(cols[drains])
+            down_dist.append(frontier_dist[drains])
+        frontier_rows = np.concatenate(up_rows)
+        frontier_cols = np.concatenate(up_cols)
+        frontier_dist = np.concatenate(down_dist)
+
+        # The outlet may drain into a cell draining back into it
+        unvisited = np.isinf(dist[frontier_rows, frontier_cols])
+        frontier_rows = frontier_rows[unvisited]
+        frontier_cols = frontier_cols[unvisited]
+        if len(frontier_rows) == 0:
+            return dist, max_steps
+        frontier_dist = frontier_dist[unvisited] + weights[frontier_rows, frontier_cols]
+        dist[frontier_rows, frontier_cols] = frontier_dist
+        max_steps += 1
@@ -0,0 +1,121 @@
+"""
+Intensity-duration-frequency (IDF) curve of the design precipitation.
+
+The 1h and 24h precipitation depths are linear in log10 of the return period
+between the two given return periods. For a return period, the intensity is
+then a power law of the duration through the 1h and 24h intensities:
+
+    i(d) = I1 · (I24 / I1) ** (log10(d) / log10(24)),    d in hours
+
+All fit coefficients are computed once when the curve is created, so an
+evaluation is a handful of array operations. Durations and return periods are
+broadcast against each other. The curve only holds four floats, so it pickles
+and round-trips through ``to_dict``/``from_dict`` for the JSON Celery
+serializer.
+"""
+
+import numpy as np
+
+
+_LOG10_24 = np.log10(24.0)
+
+
+class IDFCurve:
+    """
+    IDF curve fitted through two return periods.
+
+    Args:
+        P_low_1h:   Precipitation [mm] for lower return period, 1 hour duration
+        P_high_1h:  Precipitation [mm] for upper return period, 1 hour duration
+        P_low_24h:  Precipitation [mm] for lower return period, 24 hour duration
+        P_high_24h: Precipitation [mm] for upper return period, 24 hour duration
+        rp_low:     Lower return period [y] (e.g. 2.33)
+        rp_high:    Upper return period [y] (e.g. 100)
+        cc_factor:  Climate change factor applied to all depths
+
+    Calling the curve as ``curve(rp_years, duration_minutes)`` returns the
+    intensity [mm/h], like the closure formerly built by
+    ``construct_idf_curve``. Scalar inputs give a scalar, array inputs an
+    array of their broadcast shape.
+    """
+
+    __slots__ = ("slope_1h", "intercept_1h", "slope_24h", "intercept_24h")
+
+    def __init__(self, P_low_1h, P_high_1h, P_low_24h, P_high_24h, rp_low, rp_high, cc_factor=0.0):
+        log_rp_low = np.log10(float(rp_low))
+        log_rp_high = np.log10(float(rp_high))
+        scale = 1 + float(cc_factor)
+        span = log_rp_high - log_rp_low
+
+        # Line through both return periods (same as a degree 1 polyfit)
+        self.slope_1h = float((P_high_1h - P_low_1h) * scale / span)
+        self.intercept_1h = float(P_low_1h * scale - self.slope_1h * log_rp_low)
+        self.slope_24h = float((P_high_24h - P_low_24h) * scale / span)
+        self.intercept_24h = float(P_low_24h * scale - self.slope_24h * log_rp_low)
+
+    def to_dict(self):
+        """JSON-serialisable coefficients, e.g. for Celery task arguments."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, coefficients):
+        """Rebuild a curve from the output of ``to_dict``."""
+        curve = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(curve, name, float(coefficients[name]))
+        return curve
+
+    def __repr__(self):
+        coeffs = ", ".join(f"{name}={getattr(self, name):.6g}" for name in self.__slots__)
+        return f"IDFCurve({coeffs})"
+
+    def precipitation_amount(self, duration_h, rp_years):
+        """
+        Precipitation depth [mm] of the fitted 1h or 24h line.
+
+        Raises:
+            ValueError: If ``duration_h`` is neither 1 nor 24
+        """
+        log_rp = np.log10(rp_years)
+        if duration_h == 1:
+            return self.slope_1h * log_rp + self.intercept_1h
+        elif duration_h == 24:
+            return self.slope_24h * log_rp + self.intercept_24h
+        raise ValueError("Only 1h and 24h durations supported for precipitation amount.")
+
+    def duration_exponent(self, rp_years):
+        """
+        Exponent b of the power law i(d) = I1 · d ** b (d in hours).
+
+        Returns:
+            tuple: (I1 [mm/h], b), both broadcastable over ``rp_years``
+        """
+        log_rp = np.log10(rp_years)
+        I1 = self.slope_1h * log_rp + self.intercept_1h
+        I24 = (self.slope_24h * log_rp + self.intercept_24h) / 24.0
+        b = (np.log10(I24) - np.log10(I1)) / _LOG10_24
+        return I1, b
+
+    def intensity(self, rp_years, duration_minutes):
+        """Intensity [mm/h] for the return periods [y] and durations [min]."""
+        I1, b = self.duration_exponent(np.asarray(rp_years, dtype=np.float64))
+        duration_h = np.asarray(duration_minutes, dtype=np.float64) / 60.0
+        intensity = I1 * duration_h ** b
+        return intensity[()] if isinstance(intensity, np.ndarray) else intensity
+
+    __call__ = intensity
+
+    def depth(self, rp_years, duration_minutes):
+        """Precipitation depth [mm] for the return periods [y] and durations [min]."""
+        return self.intensity(rp_years, duration_minutes) * np.asarray(duration_minutes, dtype=np.float64) / 60.0
+
+    def intensity_derivative(self, rp_years, duration_minutes):
+        """Derivative of the intensity with respect to the duration [mm/h per min]."""
+        _, b = self.duration_exponent(np.asarray(rp_years, dtype=np.float64))
+        duration_minutes = np.asarray(duration_minutes, dtype=np.float64)
+        return b * self.intensity(rp_years, duration_minutes) / duration_minutes
+
+    def depth_derivative(self, rp_years, duration_minutes):
+        """Derivative of the depth with respect to the duration [mm per min]."""
+        _, b = self.duration_exponent(np.asarray(rp_years, dtype=np.float64))
+        return (1 + b) * self.intensity(rp_years, duration_minutes) / 60.0
@@ -0,0 +1,91 @@
+"""
+Isozone and travel time histograms stored next to the project rasters.
+
+Clark-WSL only needs the number of cells per isozone. The histograms are
+computed once by ``prepare_discharge_hydroparameters`` and written as a
+sidecar JSON to ``data/{user}/{project}/isozone_histogram.json`` together with
+the mtime and size of ``isozones_cog.tif``. A sidecar whose recorded signature
+no longer matches the isozone raster is ignored, so callers fall back to the
+raster after it was rewritten by other means.
+"""
+
+import json
+import os
+
+import numpy as np
+
+
+ISOZONE_HISTOGRAM_FILENAME = "isozone_histogram.json"
+TIME_VALUE_BIN_WIDTH = 1.0  # Bin width of the time value histogram [units of time_values.tif]
+
+
+def isozone_cell_counts(isozone_raster):
+    """
+    Number of cells per isozone from one histogram of the raster.
+
+    Only finite, non-negative, integer-valued zones are counted.
+
+    Returns:
+        np.ndarray: int64 counts of length ``max_zone + 1``
+    """
+    zones = np.asarray(isozone_raster).ravel()
+    if np.issubdtype(zones.dtype, np.floating):
+        zones = zones[np.isfinite(zones)]
+        zones = zones[(zones >= 0) & (zones == np.floor(zones))]
+    else:
+        zones = zones[zones >= 0]
+    max_zone = int(np.nanmax(isozone_raster))
+    return np.bincount(zones.astype(np.int64), minlength=max_zone + 1)[:max_zone + 1]
+
+
+def time_value_histogram(time_values, bin_width=TIME_VALUE_BIN_WIDTH):
+    """
+    Cell counts of the finite, non-negative travel times in bins of ``bin_width``.
+
+    Returns:
+        np.ndarray: int64 counts, bin ``k`` covering ``[k, k + 1) * bin_width``
+    """
+    values = np.asarray(time_values, dtype=np.float64).ravel()
+    values = values[np.isfinite(values) & (values >= 0)]
+    return np.bincount(np.floor(values / bin_width).astype(np.int64))
+
+
+def _raster_signature(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def write_isozone_histogram(project_dir, zone_cell_counts, time_counts=None, isozones_filename="isozones_cog.tif"):
+    """Write the sidecar of ``project_dir`` for the current ``isozones_filename``."""
+    sidecar = {
+        "isozones_signature": _raster_signature(os.path.join(project_dir, isozones_filename)),
+        "zone_cell_counts": [int(count) for count in zone_cell_counts],
+    }
+    if time_counts is not None:
+        sidecar["time_value_histogram"] = {
+            "bin_width": TIME_VALUE_BIN_WIDTH,
+            "counts": [int(count) for count in time_counts],
+        }
+    path = os.path.join(project_dir, ISOZONE_HISTOGRAM_FILENAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(sidecar, f)
+    os.replace(tmp_path, path)
+
+
+def read_zone_cell_counts(project_dir, isozones_filename="isozones_cog.tif"):
+    """
+    Cells per isozone from the sidecar of ``project_dir``.
+
+    Returns:
+        np.ndarray | None: int64 counts, or None if the sidecar is missing,
+        unreadable or older than the isozone raster
+    """
+    try:
+        with open(os.path.join(project_dir, ISOZONE_HISTOGRAM_FILENAME)) as f:
+            sidecar = json.load(f)
+        if sidecar["isozones_signature"] != _raster_signature(os.path.join(project_dir, isozones_filename)):
+            return None
+        return np.asarray(sidecar["zone_cell_counts"], dtype=np.int64)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
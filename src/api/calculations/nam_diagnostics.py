@@ -0,0 +1,116 @@
+"""
+Diagnostics of the NAM calculation.
+
+NAM reports progress, statistics and debug rasters through a
+``NAMDiagnostics`` object. Every record has a level and is dropped before
+anything is computed when the level is above the configured one: statistics
+are passed as callables and debug rasters are only written when their level
+is enabled and a raster writer is configured, so the production path
+(``DIAGNOSTICS_OFF``) only pays for warnings.
+
+Records are dicts ``{"event": ..., "level": ..., **fields}``. They are sent to
+the ``calculations.nam`` logger as JSON (the dict itself in
+``extra["nam_record"]``) and optionally collected in
+``NAMDiagnostics.records``.
+"""
+
+import json
+import logging
+
+import numpy as np
+
+
+DIAGNOSTICS_OFF = 0      # warnings only
+DIAGNOSTICS_SUMMARY = 1  # progress messages
+DIAGNOSTICS_DETAIL = 2   # statistics over cells, iteration totals, discharge series
+DIAGNOSTICS_RASTERS = 3  # additionally debug rasters in ./data/temp
+
+logger = logging.getLogger("calculations.nam")
+
+
+def summary_statistics(values, median=False):
+    """Min, max and mean (and median) of the finite values as floats."""
+    values = np.asarray(values)
+    values = values[np.isfinite(values)]
+    if values.size == 0:
+        return None
+    statistics = {
+        "min": float(np.min(values)),
+        "max": float(np.max(values)),
+        "mean": float(np.mean(values, dtype=np.float64)),
+    }
+    if median:
+        statistics["median"] = float(np.median(values))
+    return statistics
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+class NAMDiagnostics:
+    """
+    Level-filtered, structured diagnostics of one NAM run.
+
+    Calling the object logs a message (``DIAGNOSTICS_SUMMARY`` by default);
+    messages passed with ``warning=True`` are reported at every level.
+
+    Args:
+        level: Highest level that is reported
+        collect: Keep the records in ``records``
+        raster_writer: Function ``(values, cells, name, diagnostics)`` writing
+            a debug raster of per-cell values; without it no rasters are
+            written at any level
+    """
+
+    def __init__(self, level=DIAGNOSTICS_OFF, collect=False, raster_writer=None):
+        self.level = level
+        self.collect = collect
+        self.raster_writer = raster_writer
+        self.records = []
+
+    def enabled(self, level):
+        return level <= self.level
+
+    def __call__(self, *args, warning=False, level=DIAGNOSTICS_SUMMARY):
+        message = " ".join(str(arg) for arg in args)
+        if warning:
+            self._emit({"event": "warning", "level": DIAGNOSTICS_OFF, "message": message}, logging.WARNING)
+        elif self.enabled(level):
+            self._emit({"event": "message", "level": level, "message": message})
+
+    def record(self, event, level=DIAGNOSTICS_DETAIL, **fields):
+        """
+        Emit a structured record if ``level`` is enabled.
+
+        Callable field values are only evaluated for enabled records.
+        """
+        if not self.enabled(level):
+            return
+        values = {name: value() if callable(value) else value for name, value in fields.items()}
+        self._emit({"event": event, "level": level, **values})
+
+    def raster(self, name, values, cells):
+        """
+        Write a debug raster of per-cell ``values`` (or a callable returning
+        them) of ``cells`` if ``DIAGNOSTICS_RASTERS`` is enabled.
+        """
+        if self.raster_writer is None or not self.enabled(DIAGNOSTICS_RASTERS):
+            return
+        try:
+            self.raster_writer(values() if callable(values) else values, cells, name, self)
+        except Exception as e:
+            self(f"Warning: Could not save {name} as TIFF: {e}", warning=True)
+
+    def _emit(self, record, log_level=logging.INFO):
+        if self.collect:
+            self.records.append(record)
+        logger.log(log_level, json.dumps(record, default=_json_default, ensure_ascii=False), extra={"nam_record": record})
+
+
+# Default for helpers called without diagnostics: warnings only
+NAM_QUIET = NAMDiagnostics(DIAGNOSTICS_OFF)
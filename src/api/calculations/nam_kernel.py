@@ -0,0 +1,1249 @@
+"""
+NAM compute kernel.
+
+Everything NAM computes once the project rasters are available as a
+``CatchmentPack``: valid cells and retention, storm field, effective
+precipitation, routing and the results per scenario. The kernel has no
+Celery, Prisma or file I/O of its own, so it can be run in-process many times
+(calibration, parameter sweeps, benchmarks, tests) on packs from
+``nam_pack.pack_arrays`` or stored project packs. Loading the project, storing
+travel time fields and debug rasters and writing the results to the database
+is done by the adapters in ``calculations.nam``.
+"""
+
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+import numpy as np
+
+from calculations.nam_diagnostics import (
+    DIAGNOSTICS_DETAIL,
+    NAM_QUIET,
+    summary_statistics,
+)
+from calculations.nam_routing import (
+    arrival_timesteps_from_isozones,
+    arrival_timesteps_from_minutes,
+    route_runoff,
+    runoff_to_discharge,
+)
+
+
+class NAMInputError(Exception):
+    """Raised when the project rasters needed for NAM are missing or unusable."""
+
+
+@dataclass
+class NAMResult:
+    """Result of NAM for one climate scenario and return period."""
+
+    climate_scenario: str
+    x: float  # Return period [years]
+    HQ: float  # Peak discharge [m³/s]
+    Tc: float  # Time of the peak [min]
+    TB: float
+    TFl: float
+    i: float  # IDF intensity for Tc [mm/h]
+    S: float  # Mean retention [mm]
+    Ia: float  # Mean initial abstraction [mm]
+    Pe: float  # Effective precipitation of the peak timestep [mm]
+    effective_curve_number: float
+    runoff_timesteps: list  # Runoff volume per timestep [m³]
+    discharge_timesteps: list  # Discharge per timestep [m³/s]
+    max_timestep: int
+    total_cells: int
+    pixel_area_m2: float
+    water_balance: dict
+    storm_distribution: dict
+    routing_method: str
+    time_values_info: Optional[dict] = None
+    response_units: Optional[int] = None
+    quantization_error: Optional[dict] = None
+
+    def to_dict(self):
+        """Result as the dict returned by the NAM tasks; unset optional entries are left out."""
+        result = asdict(self)
+        for key in ("response_units", "quantization_error"):
+            if result[key] is None:
+                del result[key]
+        return result
+
+
+def geographic_to_raster_coords(lon, lat, transform, shape, log=NAM_QUIET):
+    """
+    Convert geographic coordinates (longitude, latitude) to raster coordinates (row, col).
+    
+    Args:
+        lon (float): Longitude coordinate
+        lat (float): Latitude coordinate  
+        transform: Rasterio transform object
+        shape (tuple): Raster shape (height, width)
+        log: NAMDiagnostics receiving conversion warnings
+    
+    Returns:
+        tuple: (row, col) raster coordinates
+    """
+    from rasterio.transform import rowcol
+    
+    try:
+        row, col = rowcol(transform, lon, lat)
+        # Ensure coordinates are within bounds
+        row = max(0, min(row, shape[0] - 1))
+        col = max(0, min(col, shape[1] - 1))
+        return int(row), int(col)
+    except Exception as e:
+        log(f"Warning: Error converting geographic coordinates ({lon}, {lat}) to raster coordinates: {e}", warning=True)
+        return None, None
+
+
+def parse_discharge_point(discharge_point, discharge_point_crs, transform=None, shape=None, log=NAM_QUIET):
+    """
+    Parse discharge point coordinates and convert to raster coordinates.
+    
+    Args:
+        discharge_point: Coordinates as tuple (x, y)
+        discharge_point_crs: CRS string ("EPSG:4326", "EPSG:2056", or "raster")
+        transform: Rasterio transform object (needed for coordinate conversion)
+        shape: Raster shape (height, width) (needed for bounds checking)
+        log: NAMDiagnostics receiving the input coordinates and warnings
+    
+    Returns:
+        tuple: (row, col) raster coordinates or (None, None) if conversion failed
+    """
+    log(f"parse_discharge_point: input discharge_point coordinates: {discharge_point}", level=DIAGNOSTICS_DETAIL)
+    log(f"parse_discharge_point: input discharge_point_crs: {discharge_point_crs}", level=DIAGNOSTICS_DETAIL)
+    
+    if discharge_point is None or len(discharge_point) != 2:
+        return None, None
+    
+    x, y = discharge_point
+    
+    if discharge_point_crs == "raster":
+        # Already in raster coordinates
+        if shape is not None:
+            row = max(0, min(int(x), shape[0] - 1))
+            col = max(0, min(int(y), shape[1] - 1))
+            return row, col
+        else:
+            return int(x), int(y)
+    
+    elif discharge_point_crs == "EPSG:4326":
+        # Geographic coordinates (WGS84)
+        if transform is not None and shape is not None:
+            return geographic_to_raster_coords(x, y, transform, shape, log)
+        else:
+            log("Warning: Transform and shape needed for EPSG:4326 coordinate conversion", warning=True)
+            return None, None
+    
+    elif discharge_point_crs == "EPSG:2056":
+        # Swiss coordinates
+        if transform is not None and shape is not None:
+            return geographic_to_raster_coords(x, y, transform, shape, log)
+        else:
+            log("Warning: Transform and shape needed for EPSG:2056 coordinate conversion", warning=True)
+            return None, None
+    
+    else:
+        log(f"Warning: Unknown CRS: {discharge_point_crs}", warning=True)
+        return None, None
+
+
+def _compute_travel_times(cells, discharge_row, discharge_col, log=NAM_QUIET):
+    """
+    Travel time [min] from every valid cell to the discharge point.
+
+    Uses a slope-dependent overland flow velocity where the DEM allows it and
+    a constant velocity of 1 m/s otherwise.
+
+    Args:
+        cells: CatchmentPack of the valid cells
+
+    Returns:
+        tuple: (travel_times per cell, discharge_row, discharge_col, method).
+        The discharge point is moved to the nearest cell with DEM data if its
+        elevation is missing.
+    """
+    rows = cells.rows.astype(np.int64)
+    cols = cells.cols.astype(np.int64)
+    pixel_area_m2 = cells.pixel_area_m2
+    dem_cells = cells.layer("dem")
+    travel_times = None
+
+    if dem_cells is not None:
+        log("Calculating travel times using overland flow method...")
+
+        # Get discharge point elevation
+        discharge_elevation = cells.value_at("dem", discharge_row, discharge_col)
+        log(f"Discharge point coordinates: ({discharge_row}, {discharge_col})")
+        log(f"Discharge point elevation: {discharge_elevation:.1f} m")
+
+        # Check if discharge point has valid DEM data
+        if np.isnan(discharge_elevation):
+            log(f"Warning: Discharge point elevation is NaN, finding nearest valid DEM point...", warning=True)
+
+            # Find valid DEM cells within the catchment
+            valid_dem_cells = ~np.isnan(dem_cells)
+
+            if np.any(valid_dem_cells):
+                # Find the cell closest to the original discharge point that has valid DEM data
+                valid_dem_indices = np.flatnonzero(valid_dem_cells)
+                distances_to_discharge = np.sqrt((rows[valid_dem_indices] - discharge_row)**2 + (cols[valid_dem_indices] - discharge_col)**2)
+                nearest_idx = valid_dem_indices[np.argmin(distances_to_discharge)]
+
+                # Update discharge point to nearest valid DEM cell
+                discharge_row = rows[nearest_idx]
+                discharge_col = cols[nearest_idx]
+                discharge_elevation = dem_cells[nearest_idx]
+
+                log(f"Updated discharge point to nearest valid DEM: ({discharge_row}, {discharge_col})")
+                log(f"New discharge elevation: {discharge_elevation:.1f} m")
+            else:
+                log(f"Error: No valid DEM cells found in catchment, using simplified approach", warning=True)
+                dem_cells = None
+
+        # Only proceed with overland flow if we have a valid discharge point
+        if dem_cells is not None and not np.isnan(discharge_elevation):
+            # Flow length: distance from each cell to discharge point [m]
+            flow_lengths = np.sqrt((rows - discharge_row)**2 + (cols - discharge_col)**2) * np.sqrt(pixel_area_m2)
+
+            # Elevation difference: elevation of each cell minus discharge elevation [m]
+            elevation_diffs = dem_cells - discharge_elevation
+
+            # Apply overland flow calculation
+            travel_times = np.zeros_like(flow_lengths, dtype=np.float32)
+
+            # Only calculate for cells with positive elevation difference
+            valid_kirpich_mask = (elevation_diffs > 0) & (flow_lengths > 0) & (~np.isnan(elevation_diffs))
+
+            if np.any(valid_kirpich_mask):
+                # For overland flow, use a more realistic approach
+                L = flow_lengths[valid_kirpich_mask]  # Flow length [m]
+                H = elevation_diffs[valid_kirpich_mask]  # Elevation difference [m]
+
+                # Calculate H/L ratio (slope as decimal, not degrees)
+                slope = H / L
+
+                # Use overland flow velocity based on slope
+                # Typical overland flow velocities: 0.5-2.0 m/s depending on slope and surface
+                velocities = 1.0 * np.sqrt(slope)  # [m/s] - conservative overland flow
+                velocities = np.clip(velocities, 0.5, 2.0)  # [m/s] - realistic range
+
+                # Convert to m/min for travel time calculation
+                velocities_m_per_min = velocities * 60  # [m/min]
+
+                # Calculate travel time: T = L / velocity [minutes]
+                travel_times[valid_kirpich_mask] = L / velocities_m_per_min  # [minutes]
+
+                log(f"Overland flow calculation completed:")
+                log.record(
+                    "overland_flow",
+                    valid_cells=lambda: int(np.count_nonzero(valid_kirpich_mask)),
+                    cells=len(cells),
+                    travel_time_min=lambda: summary_statistics(travel_times[valid_kirpich_mask]),
+                )
+
+                # Handle cells that don't meet overland flow criteria
+                invalid_kirpich_mask = ~valid_kirpich_mask
+                if np.any(invalid_kirpich_mask):
+                    log.record("overland_flow_fallback", cells=lambda: int(np.count_nonzero(invalid_kirpich_mask)))
+                    # Use simplified approach for these cells
+                    fallback_distances = flow_lengths[invalid_kirpich_mask]
+                    # Use a reasonable fallback velocity: 1.0 m/s = 60 m/min
+                    fallback_times = fallback_distances / 60  # 60 m/min velocity
+                    travel_times[invalid_kirpich_mask] = fallback_times
+
+                log(f"Discharge elevation: {discharge_elevation:.1f} m")
+                log.record(
+                    "flow_geometry",
+                    flow_length_m=lambda: summary_statistics(flow_lengths),
+                    elevation_difference_m=lambda: summary_statistics(elevation_diffs),
+                )
+            else:
+                log("Warning: No valid cells for overland flow calculation, using simplified approach", warning=True)
+                dem_cells = None
+        elif dem_cells is not None:
+            log("Warning: No valid discharge elevation, using simplified approach", warning=True)
+            dem_cells = None
+
+    if dem_cells is None:
+        log("Calculating travel times using simplified approach...")
+
+        # Calculate distance from each cell to the discharge point
+        distances = np.sqrt((rows - discharge_row)**2 + (cols - discharge_col)**2) * np.sqrt(pixel_area_m2)  # Convert to meters
+
+        # Calculate travel time using simplified approach: T = L / (60) [minutes]
+        # where L is distance in meters, using 60 m/min velocity (1.0 m/s)
+        travel_times = distances / 60  # [minutes]
+
+        log(f"Simplified calculation completed (velocity 60 m/min)")
+        log.record(
+            "simplified_flow",
+            distance_m=lambda: summary_statistics(distances),
+            travel_time_min=lambda: summary_statistics(travel_times),
+        )
+
+    method = 'Overland Flow' if dem_cells is not None else 'Simplified'
+    return travel_times, discharge_row, discharge_col, method
+
+
+def compute_travel_time_field(cells, discharge_row, discharge_col, dt, log=NAM_QUIET):
+    """
+    Travel times and arrival timesteps of the valid cells at the discharge point.
+
+    Returns:
+        dict: ``travel_times`` [min], ``arrival_timesteps``, the (possibly
+        moved) ``discharge_row``/``discharge_col`` and the ``method``
+    """
+    travel_times, discharge_row, discharge_col, method = _compute_travel_times(
+        cells, discharge_row, discharge_col, log
+    )
+    return {
+        "travel_times": travel_times,
+        "arrival_timesteps": arrival_timesteps_from_minutes(travel_times, dt, np.ones(travel_times.shape, dtype=bool)),
+        "discharge_row": discharge_row,
+        "discharge_col": discharge_col,
+        "method": method,
+    }
+
+
+def _select_nam_cells(pack, readiness_to_drain=None, log=NAM_QUIET):
+    """
+    Valid cells of the catchment after the readiness to drain adjustment.
+
+    Curve numbers outside the valid range are clamped to 30-100, which makes
+    every cell with a finite curve number valid. When the adjustment or the
+    clamping reaches cells that are not in ``pack``, the selection is redone
+    on a pack of all grid cells.
+
+    Returns:
+        tuple: (CatchmentPack of the valid cells, adjusted curve numbers of
+        these cells)
+
+    Raises:
+        NAMInputError: If no valid cells are found
+    """
+    if not pack.covers_adjusted_cn(readiness_to_drain):
+        log("Readiness to drain adjustment reaches cells outside the catchment pack, using all grid cells")
+        return _select_nam_cells(pack.with_all_cells(), readiness_to_drain, log)
+
+    cn_data = pack.layer("cn")
+
+    # Apply readiness to drain adjustment to curve numbers
+    if readiness_to_drain is not None and readiness_to_drain != 0:
+        log(f"Applying readiness to drain adjustment: {readiness_to_drain}")
+        # Add readiness_to_drain value to each cell's curve number
+        cn_data_adjusted = cn_data + readiness_to_drain
+        log(f"Curve number adjustment applied: {readiness_to_drain}")
+        log.record(
+            "readiness_to_drain",
+            original_cn=lambda: summary_statistics(cn_data),
+            adjusted_cn=lambda: summary_statistics(cn_data_adjusted),
+        )
+        cn_data = cn_data_adjusted
+    else:
+        log(f"No readiness to drain adjustment (value: {readiness_to_drain})")
+
+    # Calculate potential maximum retention S for each cell
+    valid_mask = (cn_data > 0) & (cn_data <= 100)  # Valid curve numbers are 30-100
+    if not np.any(valid_mask):
+        raise NAMInputError("No valid curve numbers found in raster")
+
+    log.record("valid_cells", cells=lambda: int(np.count_nonzero(valid_mask)), grid_cells=pack.shape[0] * pack.shape[1])
+
+    # Validate curve numbers - they should be between 30 and 100
+    cn_min = np.nanmin(cn_data[valid_mask])
+    cn_max = np.nanmax(cn_data[valid_mask])
+
+    if cn_min < 30 or cn_max > 100:
+        if pack.outside_cn_range is not None:
+            log("Curve numbers need clamping, which includes cells outside the catchment pack, using all grid cells")
+            return _select_nam_cells(pack.with_all_cells(), readiness_to_drain, log)
+
+        log(f"WARNING: Curve numbers outside valid range (30-100): min={cn_min:.1f}, max={cn_max:.1f}", warning=True)
+        log("This will cause unrealistic S values. Clamping curve numbers to valid range...", warning=True)
+
+        # Clamp curve numbers to valid range
+        cn_data = np.clip(cn_data, 30, 100)
+        valid_mask = (cn_data > 0) & (cn_data <= 100)
+
+    return pack.select(valid_mask), cn_data[valid_mask]
+
+
+def _prepare_nam_catchment(
+    pack,
+    routing_method,
+    catchment_area,
+    readiness_to_drain=None,
+    storm_center_mode="centroid",
+    discharge_point=None,
+    discharge_point_crs="EPSG:4326",
+    travel_time_field=None,
+    log=NAM_QUIET,
+):
+    """
+    Scenario-independent part of NAM.
+
+    Derives the valid cells, retention S and initial abstraction Ia, the
+    normalised storm kernel around the storm center and the arrival timestep
+    of every valid cell at the discharge point. All per-cell values are
+    vectors over the valid cells in row-major order.
+
+    Args:
+        pack: CatchmentPack of the project rasters
+        routing_method: "time_values", "isozone" or "travel_time"
+        catchment_area: Catchment area [km²]
+        travel_time_field: Function with the signature of
+            ``compute_travel_time_field`` providing the travel time field,
+            e.g. from a store
+
+    Returns:
+        dict: Catchment description consumed by ``_evaluate_nam_scenarios``
+
+    Raises:
+        NAMInputError: If no valid cells or no routing data are available
+    """
+    # 2. Calculate retention for each cell using curve numbers
+    log("Calculating retention for each cell...")
+
+    cells, cn_cells = _select_nam_cells(pack, readiness_to_drain, log)
+    cn_transform = cells.transform
+    cell_rows = cells.rows.astype(np.int64)
+    cell_cols = cells.cols.astype(np.int64)
+    isozone_cells = cells.layer("isozone")
+
+    # Calculate S for each cell: S = (25400 / CN) - 254 [mm]
+    S_cells = ((25400 / cn_cells) - 254).astype(np.float32, copy=False)
+
+    # Calculate initial abstraction Ia for each cell: Ia = 0.2 * S [mm]
+    Ia_cells = 0.1 * S_cells  # SCS standard: Ia = 0.2 * S
+
+    # Statistics about curve numbers and retention
+    log.record(
+        "retention",
+        cn=lambda: summary_statistics(cn_cells, median=True),
+        s_mm=lambda: summary_statistics(S_cells, median=True),
+        ia_mm=lambda: summary_statistics(Ia_cells, median=True),
+    )
+
+    dt = 10  # Time step [min]
+    Tc_total = 60 # Total simulation time [min]
+    log(f"Simulation parameters: dt={dt}min, Tc_total={Tc_total}min")
+
+    # Calculate max_timesteps for simulation (based on maximum travel time)
+    # Estimate maximum travel time based on catchment size (simplified estimate)
+    max_travel_time_minutes = int(np.ceil(np.sqrt(catchment_area * 1e6) / 1000))  # Rough estimate: 1000 m/min velocity
+    max_timesteps = max_travel_time_minutes + 50  # Allow extra timesteps for runoff to decay
+    log(f"Estimated maximum travel time: {max_travel_time_minutes} minutes")
+    log(f"Total simulation timesteps: {max_timesteps}")
+
+    # Find the storm center based on the selected mode
+    if storm_center_mode == "user_point":
+        storm_location = "user-provided point"
+        # Use user-provided discharge point coordinates
+        center_row, center_col = parse_discharge_point(discharge_point, discharge_point_crs, cn_transform, cells.shape, log)
+
+        if center_row is not None and center_col is not None:
+            log(f"Storm center at user-provided coordinates: ({center_row}, {center_col})")
+        else:
+            # Fallback to centroid if no valid coordinates provided
+            log("Warning: No valid user-provided coordinates, falling back to centroid", warning=True)
+            center_row = int(np.mean(cell_rows))
+            center_col = int(np.mean(cell_cols))
+            log(f"Storm center at catchment centroid: ({center_row}, {center_col})")
+    elif storm_center_mode == "discharge_point":
+        storm_location = "discharge point"
+        # Find the discharge point (lowest isozone = zone 0)
+        discharge_cells = isozone_cells == 0
+        if np.any(discharge_cells):
+            # Find the centroid of the discharge point area
+            center_row = int(np.mean(cell_rows[discharge_cells]))
+            center_col = int(np.mean(cell_cols[discharge_cells]))
+            log(f"Storm center at discharge point (zone 0): ({center_row}, {center_col})")
+        else:
+            # Fallback to centroid if no discharge point found
+            log("Warning: No discharge point (zone 0) found, falling back to centroid", warning=True)
+            center_row = int(np.mean(cell_rows))
+            center_col = int(np.mean(cell_cols))
+            log(f"Storm center at catchment centroid: ({center_row}, {center_col})")
+    else:
+        storm_location = "catchment centroid"
+        # Default: Find the center of the catchment (centroid of valid cells)
+        center_row = int(np.mean(cell_rows))
+        center_col = int(np.mean(cell_cols))
+        log(f"Storm center at catchment centroid: ({center_row}, {center_col})")
+
+    # ------------------------------------------------------------
+    # 3a. Storm geometry (large stratiform storm)
+    # ------------------------------------------------------------
+    storm_radius_km = 8.0  # large stratiform storm
+
+    # Get grid resolution in meters (EPSG:2056 coordinates)
+    cell_size_m = abs(cn_transform.a)  # meters per pixel in x direction
+    if cell_size_m <= 0:
+        cell_size_m = 5.0  # fallback
+
+    # Convert radius to pixels
+    storm_radius_pixels = (storm_radius_km * 1000.0) / cell_size_m
+
+    log(
+        f"Storm parameters: radius={storm_radius_km:.1f}km "
+        f"({storm_radius_pixels:.1f} px), cell_size={cell_size_m:.1f}m"
+    )
+
+    # ------------------------------------------------------------
+    # 3b. Exponential decay from the storm center; the storm depth of
+    #     each scenario scales this kernel
+    # ------------------------------------------------------------
+    storm_kernel = _storm_kernel(cells.rows, cells.cols, center_row, center_col, storm_radius_pixels)
+
+    # Determine discharge point coordinates (separate from storm center)
+    discharge_row, discharge_col = parse_discharge_point(discharge_point, discharge_point_crs, cn_transform, cells.shape, log)
+
+    # Fallback to isozone 0 (discharge point) if no user coordinates provided
+    if discharge_row is None:
+        discharge_cells = isozone_cells == 0
+        if np.any(discharge_cells):
+            discharge_row = int(np.mean(cell_rows[discharge_cells]))
+            discharge_col = int(np.mean(cell_cols[discharge_cells]))
+            log(f"Using isozone 0 discharge point: ({discharge_row}, {discharge_col})")
+        else:
+            # Final fallback to storm center
+            discharge_row, discharge_col = center_row, center_col
+            log(f"Warning: No discharge point found, using storm center as discharge point: ({discharge_row}, {discharge_col})", warning=True)
+    else:
+        log(f"Using discharge point: ({discharge_row}, {discharge_col})")
+
+    # Travel times are only needed when routing does not use time_values.tif
+    travel_times = None
+    travel_time_method = None
+    if routing_method != "time_values":
+        travel_field = (travel_time_field or compute_travel_time_field)(cells, discharge_row, discharge_col, dt, log)
+        travel_times = travel_field["travel_times"]
+        discharge_row = travel_field["discharge_row"]
+        discharge_col = travel_field["discharge_col"]
+        travel_time_method = travel_field["method"]
+
+        # Debug raster of the travel times
+        log.raster("travel_times", travel_times, cells)
+
+    # Arrival timestep of every valid cell at the discharge point. Runoff is
+    # routed into ``routed_timesteps`` bins of a series of ``n_timesteps``.
+    time_values_info = None
+    if routing_method == "time_values":
+        # Use time_values.tif-based routing method
+        log(f"Using time_values.tif-based routing method...")
+
+        time_values_cells = cells.layer("time_values")
+        if time_values_cells is None:
+            raise NAMInputError("Time values data not available for time_values routing method")
+
+        # Only cells with a positive travel time are routed
+        valid_time_cells = ~np.isnan(time_values_cells) & (time_values_cells > 0)
+
+        # Calculate arrival timestep for each cell using time_values.tif
+        # time_values_cells contains travel time in minutes for each cell
+        arrival_timesteps = arrival_timesteps_from_minutes(time_values_cells, dt, valid_time_cells)
+
+        # Calculate maximum timestep needed based on time_values
+        max_time_value = np.nanmax(time_values_cells)
+        routed_timesteps = int(np.ceil(max_time_value / dt)) + 10  # Add buffer
+        n_timesteps = max(max_timesteps, routed_timesteps)
+        if routed_timesteps > max_timesteps:
+            log(f"Extended simulation to {routed_timesteps} timesteps based on time_values")
+
+        log(f"Time values routing: max_time={max_time_value:.2f}min, dt={dt}min, max_timesteps={routed_timesteps}")
+
+        time_values_info = {
+            "used_time_values": True,
+            "max_travel_time": float(np.nanmax(time_values_cells)),
+            "mean_travel_time": float(np.nanmean(time_values_cells)),
+            "min_travel_time": float(np.nanmin(time_values_cells))
+        }
+
+    elif routing_method == "isozone":
+        # Use isozone-based routing (original method)
+        log(f"Using isozone-based routing method...")
+
+        # Get maximum isozone to determine total simulation time
+        max_zone = int(cells.isozone_max) if cells.isozone_max is not None else 0
+        if max_zone <= 0:
+            raise NAMInputError("Invalid isozone data: max_zone <= 0")
+
+        log(f"Isozone routing: max_zone={max_zone}, dt={dt}min")
+
+        # Validate isozone data
+        valid_isozones = np.isfinite(isozone_cells) & (isozone_cells >= 0)
+        log.record("valid_isozone_cells", cells=lambda: int(np.count_nonzero(valid_isozones)), total=len(cells))
+
+        # The runoff from each zone reaches the drainage point after 'zone' timesteps
+        arrival_timesteps = arrival_timesteps_from_isozones(isozone_cells, valid_isozones)
+
+        # Extend the runoff series up to the last zone that contains cells
+        zone_cells = np.bincount(arrival_timesteps[arrival_timesteps >= 0], minlength=max_zone + 1)[:max_zone + 1]
+        occupied_zones = np.flatnonzero(zone_cells)
+        routed_timesteps = int(occupied_zones[-1]) + 1 if occupied_zones.size else 0
+        n_timesteps = max(max_timesteps, routed_timesteps)
+
+    else:
+        # Use travel time-based routing (current method)
+        log(f"Using travel time-based routing method...")
+
+        # Arrival timestep for each cell
+        arrival_timesteps = travel_field["arrival_timesteps"]
+        routed_timesteps = max_timesteps
+        n_timesteps = max_timesteps
+
+    # Travel time statistics
+    log(f"Storm center: ({center_row}, {center_col}), discharge point: ({discharge_row}, {discharge_col}), routing: {routing_method}")
+    if routing_method == "time_values":
+        log.record(
+            "travel_times",
+            method="time_values.tif",
+            valid_cells=lambda: int(np.count_nonzero(valid_time_cells)),
+            cells=len(cells),
+            travel_time_min=lambda: summary_statistics(time_values_cells[valid_time_cells]),
+        )
+    else:
+        log.record("travel_times", method=travel_time_method, travel_time_min=lambda: summary_statistics(travel_times))
+
+    return {
+        "cells": cells,
+        "cn_cells": cn_cells,
+        "S_cells": S_cells,
+        "Ia_cells": Ia_cells,
+        "pixel_area_m2": cells.pixel_area_m2,
+        "dt": dt,
+        "Tc_total": Tc_total,
+        "storm_center": (center_row, center_col),
+        "storm_center_mode": storm_center_mode,
+        "storm_location": storm_location,
+        "storm_radius_km": storm_radius_km,
+        "storm_kernel": storm_kernel,
+        "routing_method": routing_method,
+        "arrival_timesteps": arrival_timesteps,
+        "routed_timesteps": routed_timesteps,
+        "n_timesteps": n_timesteps,
+        "time_values_info": time_values_info,
+    }
+
+
+def _aggregate_response_units(catchment, ring_width_m, log=NAM_QUIET):
+    """
+    Group the valid cells into hydrological response units.
+
+    Runoff of a cell only depends on its curve number, its precipitation and
+    its arrival timestep. Cells with the same curve number and arrival
+    timestep whose distance to the storm center falls into the same ring of
+    width ``ring_width_m`` are merged into one unit carrying the mean storm
+    kernel of its cells (which preserves the storm volume) and the number of
+    cells it represents.
+
+    Returns:
+        dict: Catchment like ``catchment`` with per-unit vectors, plus
+        ``cell_counts`` (cells per unit) and ``cell_units`` (unit of every
+        valid cell)
+    """
+    if ring_width_m <= 0:
+        raise NAMInputError("ring_width_m must be positive")
+
+    cells = catchment["cells"]
+    center_row, center_col = catchment["storm_center"]
+    cell_size_m = np.sqrt(catchment["pixel_area_m2"])
+    distances_m = np.hypot(cells.rows.astype(np.int64) - center_row, cells.cols.astype(np.int64) - center_col) * cell_size_m
+    rings = (distances_m // ring_width_m).astype(np.int64)
+
+    _, cn_index = np.unique(catchment["cn_cells"], return_inverse=True)
+    arrival = catchment["arrival_timesteps"] + 1  # -1 (not routed) becomes 0
+    keys = (cn_index.astype(np.int64) * (int(arrival.max()) + 1) + arrival) * (int(rings.max()) + 1) + rings
+    _, first_cell, cell_units, cell_counts = np.unique(
+        keys, return_index=True, return_inverse=True, return_counts=True
+    )
+    storm_kernel = (np.bincount(cell_units, weights=catchment["storm_kernel"]) / cell_counts).astype(np.float32)
+
+    log(
+        f"Response units: {cell_counts.size} units for {cell_units.size} cells "
+        f"(ring width {ring_width_m:.0f} m)"
+    )
+    return {
+        **catchment,
+        "cn_cells": catchment["cn_cells"][first_cell],
+        "S_cells": catchment["S_cells"][first_cell],
+        "Ia_cells": catchment["Ia_cells"][first_cell],
+        "storm_kernel": storm_kernel,
+        "arrival_timesteps": catchment["arrival_timesteps"][first_cell],
+        "cell_counts": cell_counts,
+        "cell_units": cell_units,
+    }
+
+
+def _quantization_error(unit_result, exact_result):
+    """Deviation of a response-unit result from the per-cell result."""
+    unit_q = np.asarray(unit_result.discharge_timesteps)
+    exact_q = np.asarray(exact_result.discharge_timesteps)
+    exact_volume = float(np.sum(exact_result.runoff_timesteps))
+    unit_volume = float(np.sum(unit_result.runoff_timesteps))
+    return {
+        "HQ_exact": exact_result.HQ,
+        "HQ_abs_error": unit_result.HQ - exact_result.HQ,
+        "HQ_rel_error": (unit_result.HQ - exact_result.HQ) / exact_result.HQ if exact_result.HQ else 0.0,
+        "volume_rel_error": (unit_volume - exact_volume) / exact_volume if exact_volume else 0.0,
+        "max_abs_discharge_error": float(np.max(np.abs(unit_q - exact_q))),
+    }
+
+
+def _cell_sum(values, cell_counts=None, axis=None):
+    """Sum over cells; ``cell_counts`` weights the values of response units."""
+    if cell_counts is None:
+        return np.sum(values, axis=axis, dtype=np.float64 if np.issubdtype(values.dtype, np.floating) else None)
+    return np.sum(values * cell_counts, axis=axis)
+
+
+def _cell_mean(values, cell_counts=None, axis=None):
+    """Mean over cells; ``cell_counts`` weights the values of response units."""
+    if cell_counts is None:
+        return np.mean(values, axis=axis, dtype=np.float64)
+    return np.sum(values * cell_counts, axis=axis) / np.sum(cell_counts)
+
+
+def _storm_kernel(rows, cols, center_row, center_col, storm_radius_pixels):
+    """
+    Exponential decay exp(-d / radius) of the storm on the valid cells.
+
+    ``d`` is the distance [px] of each cell to the storm center. The kernel is
+    computed in place in a single float32 vector.
+    """
+    kernel = np.subtract(rows, center_row, dtype=np.float32)
+    np.square(kernel, out=kernel)
+    col_offsets = np.subtract(cols, center_col, dtype=np.float32)
+    np.square(col_offsets, out=col_offsets)
+    kernel += col_offsets
+    del col_offsets
+    np.sqrt(kernel, out=kernel)
+    kernel *= np.float32(-1.0 / storm_radius_pixels)
+    np.exp(kernel, out=kernel)
+    return kernel
+
+
+def _storm_distribution(P_total_storm, I_event, storm_kernel, duration_h, cell_counts=None, I_cap_factor=1.2, log=NAM_QUIET):
+    """
+    Precipitation [mm] of every storm on the valid cells.
+
+    The kernel is scaled by the storm depth of each scenario. Local
+    intensities above ``I_cap_factor`` × the design event intensity are
+    trimmed and the trimmed storm is rescaled to its original mean, so the
+    storm volume is unchanged. All steps work in place on one preallocated
+    float32 array of shape (scenarios, cells).
+
+    Returns:
+        np.ndarray: float32 precipitation per scenario and cell
+    """
+    storm_distribution = np.empty((len(P_total_storm), storm_kernel.size), dtype=np.float32)
+    np.multiply(
+        np.asarray(P_total_storm, dtype=np.float32)[:, None], storm_kernel[None, :], out=storm_distribution
+    )
+
+    # Remember the original catchment-mean precipitation (so we don't change volume)
+    original_mean_precip = _cell_mean(storm_distribution, cell_counts, axis=1)
+
+    # Allow local intensities up to some factor of the design event intensity,
+    # expressed as a depth over the storm duration
+    cap_depth = (I_cap_factor * np.asarray(I_event) * duration_h).astype(np.float32)
+    for k, storm in enumerate(storm_distribution):
+        storm_max = storm.max()
+        log(f"Original storm (reference): mean={original_mean_precip[k]:.2f}mm, max={float(storm_max):.2f}mm")
+        if storm_max <= cap_depth[k]:
+            continue
+
+        log(f"Intensity capping: local intensities trimmed to {I_cap_factor:.1f} × I_event")
+        np.minimum(storm, cap_depth[k], out=storm)
+
+        # After capping, renormalise to keep the SAME mean as original
+        mean_after_cap = _cell_mean(storm, cell_counts)
+        if mean_after_cap > 0:
+            storm *= np.float32(original_mean_precip[k] / mean_after_cap)
+    return storm_distribution
+
+
+def _effective_storm_depth(intensity_fn, x, cc_degree, Tc_total, log=NAM_QUIET):
+    """
+    Total storm depth [mm] of the design event for one return period and scenario.
+
+    Events above the 100-year current climate intensity are damped with a soft
+    limiter so that extreme return periods and warmer scenarios do not grow
+    with the full IDF extrapolation.
+
+    Returns:
+        tuple: (P_total_storm [mm], I_event [mm/h])
+    """
+    # Raw IDF intensity for requested return period & climate scenario
+    i_total = intensity_fn(rp_years=x, duration_minutes=Tc_total)  # [mm/h]
+    I_event = float(i_total)
+    duration_h = Tc_total / 60.0
+
+    # Reference intensity for 100-year CURRENT climate (no cc_factor)
+    try:
+        i_100_ref = intensity_fn(rp_years=100, duration_minutes=Tc_total)
+        I_ref_100 = float(i_100_ref)
+    except Exception:
+        # Fallback if 100a is outside the rp_low/rp_high range
+        I_ref_100 = I_event
+
+    # Soft limiter for extreme events:
+    # - Do nothing up to 100a current climate (keeps calibration)
+    # - For RP >= 300 OR any climate scenario above current,
+    #   reduce the extra growth above 100a.
+    k_extreme = 0.4  # 0 = no growth beyond 100a, 1 = full IDF; tune 0.3–0.5
+
+    if ((x >= 300) or (x >= 100 and cc_degree > 0.0)) and (I_event > I_ref_100):
+        I_eff = I_ref_100 + k_extreme * (I_event - I_ref_100)
+        log(
+            f"Extreme event adjustment: RP={x}, cc_degree={cc_degree}, "
+            f"I_event={I_event:.1f} mm/h, I_ref_100={I_ref_100:.1f} mm/h, "
+            f"I_eff={I_eff:.1f} mm/h (k_extreme={k_extreme:.2f})"
+        )
+    else:
+        I_eff = I_event
+        log(
+            f"No extreme adjustment: RP={x}, cc_degree={cc_degree}, "
+            f"I_event={I_event:.1f} mm/h, I_ref_100={I_ref_100:.1f} mm/h"
+        )
+
+    # Use effective intensity for the storm depth
+    P_total_storm = I_eff * duration_h  # [mm]
+    log(f"Total storm precipitation (effective): {P_total_storm:.2f} mm over {Tc_total} minutes")
+    return P_total_storm, I_event
+
+
+def _scs_effective_precipitation(precipitation, Ia_cells, S_cells):
+    """
+    SCS-CN effective precipitation Pe = (P - Ia)² / (P - Ia + S) [mm].
+
+    ``precipitation`` may carry leading (scenario) axes in front of the cell
+    axis of ``Ia_cells``/``S_cells``. Cells with P <= Ia produce no runoff.
+
+    Returns:
+        np.ndarray: float32 Pe with the shape of ``precipitation``
+    """
+    Ia_cells = np.broadcast_to(Ia_cells, precipitation.shape)
+    S_cells = np.broadcast_to(S_cells, precipitation.shape)
+    P_mask = precipitation > Ia_cells
+    Pe_cells = np.zeros(precipitation.shape, dtype=np.float32)
+    P_excess = precipitation[P_mask] - Ia_cells[P_mask]
+    Pe_cells[P_mask] = (P_excess ** 2) / (P_excess + S_cells[P_mask])
+    return Pe_cells
+
+
+def _cumulative_effective_precipitation(cumulative_precip, Ia_cells, S_cells, log=NAM_QUIET, cell_counts=None):
+    """
+    Effective precipitation [mm] of the ``cumulative`` water balance for one storm.
+
+    Water that infiltrates in one iteration is retained in the cell and is no
+    longer available in the next one. ``cell_counts`` weights the convergence
+    totals when the vectors hold response units.
+
+    Retained water only grows, so a cell whose available precipitation drops
+    to Ia never produces runoff again. The iteration therefore works in place
+    on compacted vectors of the cells that still produce runoff, which shrink
+    from one iteration to the next.
+
+    Returns:
+        tuple: (Pe_cells, retained_water) as float32 vectors
+    """
+    retained_water = np.zeros(cumulative_precip.shape, dtype=np.float32)  # Water retained in each cell
+    Pe_cells = np.zeros(cumulative_precip.shape, dtype=np.float32)  # Effective precipitation
+
+    # Iterative calculation: each cell's retained water affects subsequent calculations
+    max_iterations = 10  # Prevent infinite loops
+    convergence_tolerance = 0.001  # mm
+
+    log(f"Starting iterative cumulative calculation (max {max_iterations} iterations)")
+
+    # Cells that still produce runoff and their compacted vectors
+    active = np.flatnonzero(cumulative_precip > Ia_cells)
+    precip = cumulative_precip[active]
+    Ia_active = Ia_cells[active]
+    S_active = S_cells[active]
+    counts_active = cell_counts[active] if cell_counts is not None else None
+    Pe_active = np.zeros(active.size, dtype=np.float32)
+    retained_active = np.zeros(active.size, dtype=np.float32)
+    work_dtype = np.result_type(cumulative_precip, Ia_cells, S_cells, np.float32)
+    available_precip = np.empty(active.size, dtype=work_dtype)
+    Pe_iteration = np.empty(active.size, dtype=work_dtype)
+
+    def _total(full, compact):
+        values = full.copy()
+        values[active] = compact
+        return _cell_sum(values, cell_counts)
+
+    for iteration in range(max_iterations):
+        # Calculate available precipitation for this iteration
+        np.subtract(precip, retained_active, out=available_precip)
+
+        # Cells where available precipitation no longer exceeds the initial
+        # abstraction leave the active set for good
+        P_mask = available_precip > Ia_active
+        if not P_mask.all():
+            done = ~P_mask
+            Pe_cells[active[done]] = Pe_active[done]
+            retained_water[active[done]] = retained_active[done]
+            active = active[P_mask]
+            precip = precip[P_mask]
+            Ia_active = Ia_active[P_mask]
+            S_active = S_active[P_mask]
+            counts_active = counts_active[P_mask] if counts_active is not None else None
+            Pe_active = Pe_active[P_mask]
+            retained_active = retained_active[P_mask]
+            available_precip = available_precip[P_mask]
+            Pe_iteration = Pe_iteration[:active.size]
+
+        if active.size == 0:
+            log(f"  Iteration {iteration + 1}: No cells have available P > Ia, stopping")
+            break
+
+        # Effective precipitation of this iteration: (P - Ia)² / (P - Ia + S)
+        P_excess = available_precip - Ia_active
+        np.add(P_excess, S_active, out=Pe_iteration)
+        np.square(P_excess, out=P_excess)
+        np.divide(P_excess, Pe_iteration, out=Pe_iteration)
+
+        # Infiltration (retained water) of this iteration
+        infiltration_iteration = np.subtract(available_precip, Pe_iteration, out=P_excess)
+
+        Pe_active += Pe_iteration
+        retained_active += infiltration_iteration
+
+        # Check convergence
+        total_pe_change = _cell_sum(Pe_iteration, counts_active)
+        total_retention_change = _cell_sum(infiltration_iteration, counts_active)
+
+        log.record(
+            "cumulative_iteration",
+            iteration=iteration + 1,
+            cells_with_runoff=lambda: active.size if cell_counts is None else _cell_sum(counts_active),
+            pe_added_mm=total_pe_change,
+            retention_added_mm=total_retention_change,
+            pe_total_mm=lambda: _total(Pe_cells, Pe_active),
+            retention_total_mm=lambda: _total(retained_water, retained_active),
+        )
+
+        # Check if changes are small enough to stop
+        if total_pe_change < convergence_tolerance and total_retention_change < convergence_tolerance:
+            log(f"  Convergence reached after {iteration + 1} iterations")
+            break
+
+        # Safety check: if we've reached max iterations
+        if iteration == max_iterations - 1:
+            log(f"  Warning: Reached maximum iterations ({max_iterations})", warning=True)
+
+    Pe_cells[active] = Pe_active
+    retained_water[active] = retained_active
+    return Pe_cells, retained_water
+
+
+def _evaluate_nam_scenarios(catchment, scenarios, water_balance_mode, precipitation_factor, catchment_area, log=NAM_QUIET):
+    """
+    Evaluate NAM for several storms on one prepared catchment.
+
+    The storm depth is the only scenario-dependent input, so precipitation,
+    effective precipitation and routed runoff are computed for all scenarios
+    at once along a leading scenario axis.
+
+    Args:
+        catchment: Prepared catchment from ``_prepare_nam_catchment``, or
+            its response units from ``_aggregate_response_units``
+        scenarios: List of dicts with ``climate_scenario``, ``x`` (return
+            period), ``cc_degree`` and ``intensity_fn``
+        water_balance_mode: "uniform", "cumulative" or a simple SCS mode
+        precipitation_factor: Scaling of the storm depth for "uniform" and
+            "cumulative"
+        catchment_area: Catchment area [km²]
+
+    Returns:
+        list: One NAMResult per scenario, in the order of ``scenarios``
+    """
+    cells = catchment["cells"]
+    S_cells = catchment["S_cells"]
+    Ia_cells = catchment["Ia_cells"]
+    storm_kernel = catchment["storm_kernel"]
+    arrival_timesteps = catchment["arrival_timesteps"]
+    routed_timesteps = catchment["routed_timesteps"]
+    n_timesteps = catchment["n_timesteps"]
+    pixel_area_m2 = catchment["pixel_area_m2"]
+    routing_method = catchment["routing_method"]
+    dt = catchment["dt"]
+    Tc_total = catchment["Tc_total"]
+    duration_h = Tc_total / 60.0
+    cell_counts = catchment.get("cell_counts")
+    cell_units = catchment.get("cell_units")
+    total_cells = int(S_cells.size) if cell_counts is None else int(np.sum(cell_counts))
+
+    # 3. Total storm precipitation of every scenario
+    mean_Ia = np.nanmean(Ia_cells) if cell_counts is None else _cell_mean(Ia_cells, cell_counts)
+    P_total_storm = np.empty(len(scenarios))
+    I_event = np.empty(len(scenarios))
+    for k, scenario in enumerate(scenarios):
+        P_total_storm[k], I_event[k] = _effective_storm_depth(
+            scenario["intensity_fn"], scenario["x"], scenario["cc_degree"], Tc_total, log
+        )
+        # Check if P_total_storm is sufficient to generate runoff
+        if P_total_storm[k] <= mean_Ia:
+            log("WARNING: Total storm precipitation is less than mean initial abstraction!", warning=True)
+            log("This will result in zero runoff. Consider increasing return period or precipitation factor.")
+        else:
+            log(f"P_total_storm > Ia: {P_total_storm[k]:.2f} > {mean_Ia:.2f} ✓")
+        log(f"Creating natural storm distribution with maximum: {P_total_storm[k]:.2f} mm at {catchment['storm_location']}")
+
+    log(f"Water balance approach: {water_balance_mode}")
+    log(f"Storm center mode: {catchment['storm_center_mode']}")
+    log(f"Routing method: {routing_method}")
+    log(f"Precipitation factor: {precipitation_factor}")
+    log(f"Storm duration: {Tc_total} minutes")
+
+    # Natural storm distribution (exponential decay from the storm center)
+    # with trimmed local peaks, one row per scenario
+    storm_distribution = _storm_distribution(
+        P_total_storm, I_event, storm_kernel, duration_h, cell_counts, log=log
+    )  # [mm]
+
+    # Debug rasters of the rain distribution
+    for k, scenario in enumerate(scenarios):
+        log.raster(
+            f"rain_distribution_{scenario['climate_scenario']}_{scenario['x']}",
+            lambda: storm_distribution[k] if cell_units is None else storm_distribution[k][cell_units],
+            cells,
+        )
+
+    # Calculate effective precipitation using SCS method for each cell
+    log("Calculating runoff for each cell using travel time calculation...")
+    if water_balance_mode == "uniform":
+        # Uniform approach: Use uniform precipitation for SCS calculation
+        uniform_precip = P_total_storm * precipitation_factor  # Apply scaling factor
+        #uniform_precip = P_total_storm * min(106.61 * catchment_area ** (-0.289) / 100, 1.0)
+        for k in range(len(scenarios)):
+            log(f"Uniform approach - uniform={uniform_precip[k]:.2f}mm (factor={precipitation_factor}, catchment_area={catchment_area:.2f}km²)")
+
+        uniform_field = np.broadcast_to(
+            uniform_precip.astype(np.float32)[:, None], storm_distribution.shape
+        )
+        Pe_cells = _scs_effective_precipitation(uniform_field, Ia_cells, S_cells)
+    elif water_balance_mode == "cumulative":
+        # Cumulative approach: Use storm distribution with iterative water retention calculation
+        # This approach considers the spatially varying storm and calculates retained water iteratively
+        log(f"Cumulative approach - using storm distribution with iterative retention")
+        Pe_cells = np.zeros(storm_distribution.shape, dtype=np.float32)
+        for k in range(len(scenarios)):
+            # Spatially varying precipitation
+            cumulative_precip = storm_distribution[k] * precipitation_factor
+            Pe_cells[k], retained_water = _cumulative_effective_precipitation(
+                cumulative_precip, Ia_cells, S_cells, log, cell_counts
+            )
+            log.record(
+                "cumulative_water_balance",
+                climate_scenario=scenarios[k]["climate_scenario"],
+                x=scenarios[k]["x"],
+                precipitation_mm=lambda: _cell_sum(cumulative_precip, cell_counts),
+                retention_mm=lambda: _cell_sum(retained_water, cell_counts),
+                effective_precipitation_mm=lambda: _cell_sum(Pe_cells[k], cell_counts),
+            )
+    else:
+        # Simple SCS approach for other modes (simple, hybrid, conservative)
+        Pe_cells = _scs_effective_precipitation(storm_distribution, Ia_cells, S_cells)
+
+    for k in range(len(scenarios)):
+        cells_with_runoff = int(_cell_sum(Pe_cells[k] != 0, cell_counts))
+        log(f"{cells_with_runoff} cells have P > Ia out of {total_cells} valid cells")
+        if cells_with_runoff == 0:
+            log(f"  WARNING: No cells have P > Ia! This will result in zero runoff.", warning=True)
+            log(f"  Consider increasing precipitation_factor or return period.")
+
+    # Convert effective precipitation to runoff volume [m³] for each cell
+    # Pe is in mm, convert to m³: Pe_mm * area_m² / 1000
+    runoff_volumes = Pe_cells * pixel_area_m2 / 1000  # [m³]
+    if cell_counts is not None:
+        runoff_volumes = runoff_volumes * cell_counts
+
+    # Group cells by arrival timestep and sum runoff volumes in a single pass
+    routed_runoff, arriving_cells = route_runoff(runoff_volumes, arrival_timesteps, routed_timesteps)
+    if cell_counts is not None:
+        arriving_cells, _ = route_runoff(cell_counts, arrival_timesteps, routed_timesteps)
+    runoff_timesteps = np.zeros((len(scenarios), n_timesteps), dtype=np.float64)
+    runoff_timesteps[:, :routed_timesteps] += routed_runoff
+    log(f"{routing_method} routing completed. Max timesteps: {n_timesteps}")
+
+    # Convert runoff volumes to discharge [m³/s]
+    # Discharge = volume / time = m³ / (dt * 60 s)
+    discharge_timesteps = runoff_to_discharge(runoff_timesteps, dt)
+
+    if log.enabled(DIAGNOSTICS_DETAIL):
+        zone_pe = None
+        if routing_method == "isozone":
+            zone_pe, _ = route_runoff(
+                Pe_cells if cell_counts is None else Pe_cells * cell_counts, arrival_timesteps, routed_timesteps
+            )
+        for k, scenario in enumerate(scenarios):
+            log(f"Routing of {scenario['climate_scenario']} (RP={scenario['x']}):")
+            for i in np.flatnonzero(routed_runoff[k] > 0):
+                if zone_pe is not None:
+                    log(f"  Zone {i}: {arriving_cells[i]:.0f} cells, Pe_sum={zone_pe[k, i]:.2f}mm, runoff_volume={routed_runoff[k, i]:.3f} m³, arrives at timestep {i}")
+                else:
+                    log(f"  Timestep {i} ({i*dt}min): {arriving_cells[i]:.0f} cells arrive, runoff_volume={routed_runoff[k, i]:.3f} m³, Q={discharge_timesteps[k, i]:.3f} m³/s")
+
+    if cell_counts is None:
+        effective_curve_number = np.nanmean(catchment["cn_cells"])
+        S = np.nanmean(S_cells)  # Average S for reporting
+        Ia = np.nanmean(Ia_cells)  # Average Ia for reporting
+    else:
+        effective_curve_number = _cell_mean(catchment["cn_cells"], cell_counts)
+        S = _cell_mean(S_cells, cell_counts)
+        Ia = _cell_mean(Ia_cells, cell_counts)
+    center_row, center_col = catchment["storm_center"]
+
+    results = []
+    for k, scenario in enumerate(scenarios):
+        # 4. Find maximum discharge (HQ)
+        HQ = float(np.max(discharge_timesteps[k]))
+        max_timestep = int(np.argmax(discharge_timesteps[k]))
+        log(f"Maximum discharge ({scenario['climate_scenario']}, RP={scenario['x']}): {HQ:.3f} m³/s at timestep {max_timestep}")
+        log.record(
+            "discharge_series",
+            climate_scenario=scenario["climate_scenario"],
+            x=scenario["x"],
+            dt_min=dt,
+            discharge_m3s=lambda: discharge_timesteps[k].round(3).tolist(),
+        )
+
+        # Water balance summary
+        total_initial_water = _cell_sum(storm_distribution[k], cell_counts)
+        total_runoff_generated = _cell_sum(Pe_cells[k], cell_counts)
+        total_infiltration = total_initial_water - total_runoff_generated
+
+        log(f"\n=== WATER BALANCE SUMMARY ===")
+        log(f"Total precipitation applied: {total_initial_water:.2f} mm")
+        log(f"Total runoff generated: {total_runoff_generated:.2f} mm ({total_runoff_generated/total_initial_water*100:.1f}%)")
+        log(f"Total infiltration: {total_infiltration:.2f} mm ({total_infiltration/total_initial_water*100:.1f}%)")
+
+        # 5. Calculate additional parameters for compatibility
+        # Use the timestep of maximum discharge for other calculations
+        Tc = (max_timestep + 1) * dt  # [min]
+        TB = Tc  # Simplified for distributed approach
+        TFl = 0  # Not used in distributed approach
+        i_final = scenario["intensity_fn"](rp_years=scenario["x"], duration_minutes=Tc)  # [mm/h]
+        Pe_final = HQ * dt * 60 / (total_cells * pixel_area_m2 / 1000)  # Average Pe for reporting
+
+        results.append(NAMResult(
+            climate_scenario=scenario["climate_scenario"],
+            x=scenario["x"],
+            HQ=float(HQ),
+            Tc=float(Tc),
+            TB=float(TB),
+            TFl=float(TFl),
+            i=float(i_final),
+            S=float(S),
+            Ia=float(Ia),
+            Pe=float(Pe_final),
+            effective_curve_number=float(effective_curve_number),
+            runoff_timesteps=[float(v) for v in runoff_timesteps[k]],
+            discharge_timesteps=[float(v) for v in discharge_timesteps[k]],
+            max_timestep=int(max_timestep),
+            total_cells=total_cells,
+            pixel_area_m2=float(pixel_area_m2),
+            water_balance={
+                "approach": water_balance_mode,
+                "total_initial_water": float(total_initial_water),
+                "total_infiltration": float(total_infiltration),
+                "total_runoff_generated": float(total_runoff_generated),
+                "infiltration_percentage": float(total_infiltration/total_initial_water*100),
+                "runoff_percentage": float(total_runoff_generated/total_initial_water*100)
+            },
+            storm_distribution={
+                "storm_center": (int(center_row), int(center_col)),
+                "storm_center_mode": catchment["storm_center_mode"],
+                "storm_radius": float(catchment["storm_radius_km"]),
+                "max_precipitation": float(np.max(storm_distribution[k])),
+                "min_precipitation": float(np.min(storm_distribution[k])),
+                "mean_precipitation": float(_cell_mean(storm_distribution[k], cell_counts)),
+                "distribution_type": "exponential_decay"
+            },
+            routing_method=routing_method,
+            time_values_info=catchment["time_values_info"],
+            response_units=None if cell_counts is None else int(cell_counts.size),
+        ))
+    return results
+
+
+def run_nam_kernel(
+    pack,
+    scenarios,
+    catchment_area,
+    water_balance_mode,
+    precipitation_factor,
+    storm_center_mode,
+    routing_method,
+    readiness_to_drain=None,
+    discharge_point=None,
+    discharge_point_crs="EPSG:4326",
+    response_unit_ring_m=None,
+    report_quantization_error=False,
+    travel_time_field=None,
+    log=NAM_QUIET,
+):
+    """
+    Evaluate NAM for several storms on one catchment.
+
+    Args:
+        pack: CatchmentPack of the project rasters
+        scenarios: List of dicts with ``climate_scenario``, ``x`` (return
+            period), ``cc_degree`` and ``intensity_fn`` (IDF intensity
+            [mm/h] as a function of ``rp_years`` and ``duration_minutes``)
+        catchment_area: Catchment area [km²]
+        response_unit_ring_m: If set, evaluate response units of cells with
+            equal curve number and arrival timestep within storm-distance
+            rings of this width [m] instead of every cell
+        report_quantization_error: With ``response_unit_ring_m``, also run the
+            per-cell evaluation and add its deviation as ``quantization_error``
+        travel_time_field: Provider of the travel time field, see
+            ``_prepare_nam_catchment``
+        log: NAMDiagnostics receiving messages, statistics and rasters
+
+    Returns:
+        list: One NAMResult per scenario, in the order of ``scenarios``
+
+    Raises:
+        NAMInputError: If the rasters hold no valid cells or routing data
+    """
+    if not scenarios:
+        return []
+
+    catchment = _prepare_nam_catchment(
+        pack,
+        routing_method,
+        catchment_area,
+        readiness_to_drain=readiness_to_drain,
+        storm_center_mode=storm_center_mode,
+        discharge_point=discharge_point,
+        discharge_point_crs=discharge_point_crs,
+        travel_time_field=travel_time_field,
+        log=log,
+    )
+
+    if response_unit_ring_m is None:
+        return _evaluate_nam_scenarios(
+            catchment, scenarios, water_balance_mode, precipitation_factor, catchment_area, log=log
+        )
+
+    units = _aggregate_response_units(catchment, response_unit_ring_m, log)
+    results = _evaluate_nam_scenarios(
+        units, scenarios, water_balance_mode, precipitation_factor, catchment_area, log=log
+    )
+    if report_quantization_error:
+        exact_results = _evaluate_nam_scenarios(
+            catchment, scenarios, water_balance_mode, precipitation_factor, catchment_area, log=log
+        )
+        for result, exact_result in zip(results, exact_results):
+            result.quantization_error = _quantization_error(result, exact_result)
+            log(
+                f"Quantization error ({result.climate_scenario}, RP={result.x}): "
+                f"HQ {result.HQ:.3f} vs {exact_result.HQ:.3f} m³/s "
+                f"({result.quantization_error['HQ_rel_error'] * 100:.2f}%)"
+            )
+    return results
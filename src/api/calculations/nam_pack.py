@@ -0,0 +1,473 @@
+"""
+Valid-cell "catchment pack" of the NAM input rasters.
+
+The NAM rasters cover the bounding box of the catchment, but only the cells
+with a curve number take part in the calculation. A pack stores those cells
+once as flat row/column indices with aligned curve number, isozone, DEM and
+time value vectors in compact dtypes. It is written next to the project
+rasters (``data/{user}/{project}/nam_pack/``) as one ``.npy`` file per vector
+plus ``meta.json`` and loaded memory-mapped, so NAM works on 1-D vectors
+instead of bounding-box grids.
+
+A stored pack is only used while the mtime and size of all its source rasters
+are unchanged; otherwise it is rebuilt from the rasters.
+
+The pack directory also holds the travel time fields derived from the DEM,
+one file per (DEM version, valid cells, discharge point, dt) in
+``travel_times/``, so the travel time routing is computed once per outlet.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import warnings
+
+import numpy as np
+from rasterio.crs import CRS
+from rasterio.transform import Affine
+from rasterio.warp import Resampling
+
+from calculations.nam_diagnostics import NAM_QUIET
+from calculations.raster_cache import read_raster
+
+
+PACK_DIRNAME = "nam_pack"
+PACK_VERSION = 1
+
+TRAVEL_TIMES_DIRNAME = "travel_times"
+# Number of travel time fields kept per project (least recently used are removed)
+TRAVEL_TIMES_KEEP = 16
+
+# Source rasters of a pack and how they are aligned to the isozone grid
+PACK_LAYERS = {
+    "cn": Resampling.nearest,
+    "isozone": None,
+    "dem": Resampling.bilinear,
+    "time_values": Resampling.bilinear,
+}
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _source_signatures(sources):
+    return {
+        layer: None if sources.get(layer) is None else {
+            "path": os.path.abspath(sources[layer]),
+            "signature": _file_signature(sources[layer]),
+        }
+        for layer in PACK_LAYERS
+    }
+
+
+def encode_vector(values):
+    """
+    Store a vector in the smallest dtype that restores it exactly.
+
+    Integral floating point values (curve numbers, isozones) are stored as
+    unsigned or signed integers with a sentinel for NaN, other floating point
+    values as float32 when that is lossless.
+
+    Returns:
+        tuple: (encoded array, encoding dict for ``decode_vector``)
+    """
+    values = np.asarray(values)
+    encoding = {"dtype": values.dtype.str, "nodata": None}
+    if not np.issubdtype(values.dtype, np.floating):
+        return values, encoding
+
+    missing = np.isnan(values)
+    data = values[~missing]
+    if np.all(np.isfinite(data)) and np.all(data == np.round(data)):
+        low = data.min() if data.size else 0
+        high = data.max() if data.size else 0
+        for candidate in (np.uint8, np.int16, np.int32):
+            info = np.iinfo(candidate)
+            if low >= info.min and high < info.max:
+                encoded = np.full(values.shape, info.max, dtype=candidate)
+                encoded[~missing] = data
+                encoding["nodata"] = int(info.max)
+                return encoded, encoding
+
+    if values.dtype != np.float32:
+        encoded = values.astype(np.float32)
+        if np.array_equal(encoded.astype(values.dtype), values, equal_nan=True):
+            return encoded, encoding
+    return values, encoding
+
+
+def decode_vector(encoded, encoding):
+    """Restore a vector written by ``encode_vector`` (returned as is when not encoded)."""
+    dtype = np.dtype(encoding["dtype"])
+    if encoded.dtype == dtype:
+        return encoded
+    values = encoded.astype(dtype)
+    if encoding["nodata"] is not None:
+        values[encoded == encoding["nodata"]] = np.nan
+    return values
+
+
+class CatchmentPack:
+    """
+    Cells of the aligned NAM rasters as 1-D vectors in row-major order.
+
+    Attributes:
+        shape: Shape of the bounding-box grid
+        transform, crs: Georeferencing of the grid
+        rows, cols: Grid indices of the packed cells
+        isozone_max: Maximum isozone of the whole grid (None if empty)
+        outside_cn_range: (min, max) of the finite curve numbers of the grid
+            cells that are not packed, None if there are none
+        sources: Paths of the source rasters by layer
+        directory: Directory the pack is stored in, None if it is not stored
+        grids: Full grids by layer for packs built from arrays, which take
+            the place of ``sources``
+    """
+
+    def __init__(self, shape, transform, crs, rows, cols, layers, isozone_max=None, outside_cn_range=None, sources=None, directory=None, grids=None):
+        self.shape = tuple(int(n) for n in shape)
+        self.transform = transform
+        self.crs = crs
+        self.rows = rows
+        self.cols = cols
+        self.isozone_max = isozone_max
+        self.outside_cn_range = outside_cn_range
+        self.sources = dict(sources or {})
+        self.directory = directory
+        self.grids = grids
+        # layer -> (encoded vector, encoding) or None if the raster is missing
+        self._layers = layers
+        self._decoded = {}
+
+    def __len__(self):
+        return int(self.rows.size)
+
+    @property
+    def pixel_area_m2(self):
+        return abs(self.transform[0] * self.transform[4])
+
+    def has(self, layer):
+        return self._layers.get(layer) is not None
+
+    def layer(self, layer):
+        """Decoded vector of one layer, None if its raster is missing."""
+        if not self.has(layer):
+            return None
+        if layer not in self._decoded:
+            self._decoded[layer] = decode_vector(*self._layers[layer])
+        return self._decoded[layer]
+
+    def select(self, selection):
+        """New pack with the cells selected by a boolean or index array."""
+        layers = {
+            name: None if entry is None else (np.asarray(entry[0])[selection], entry[1])
+            for name, entry in self._layers.items()
+        }
+        return CatchmentPack(
+            self.shape, self.transform, self.crs,
+            np.asarray(self.rows)[selection], np.asarray(self.cols)[selection], layers,
+            isozone_max=self.isozone_max, outside_cn_range=self.outside_cn_range, sources=self.sources,
+            directory=self.directory, grids=self.grids,
+        )
+
+    def with_all_cells(self):
+        """Pack of every grid cell of the same rasters."""
+        if self.grids is not None:
+            return _pack_grids(self.grids, self.transform, self.crs, all_cells=True, keep_grids=True)
+        return build_pack(self.sources, all_cells=True, directory=self.directory)
+
+    def value_at(self, layer, row, col):
+        """
+        Value of a layer at a grid cell.
+
+        Cells that are not packed are read from the aligned source raster.
+        """
+        flat = np.asarray(self.rows, dtype=np.int64) * self.shape[1] + np.asarray(self.cols, dtype=np.int64)
+        target = int(row) * self.shape[1] + int(col)
+        position = int(np.searchsorted(flat, target))
+        if position < flat.size and flat[position] == target:
+            return self.layer(layer)[position]
+        if self.grids is not None:
+            return self.grids[layer][row, col]
+        return _read_aligned(self.sources, layer).data[row, col]
+
+    def covers_adjusted_cn(self, readiness_to_drain):
+        """
+        Whether cells outside the pack stay invalid after adding
+        ``readiness_to_drain`` to the curve numbers.
+        """
+        if self.outside_cn_range is None:
+            return True
+        low, high = (value + (readiness_to_drain or 0) for value in self.outside_cn_range)
+        return high <= 0 or low > 100
+
+
+def _read_aligned(sources, layer):
+    if layer == "isozone":
+        return read_raster(sources["isozone"])
+    return read_raster(sources[layer], like=sources["isozone"], resampling=PACK_LAYERS[layer])
+
+
+def build_pack(sources, all_cells=False, directory=None):
+    """
+    Build a pack from the project rasters.
+
+    Args:
+        sources: Paths by layer (``cn`` and ``isozone`` required, ``dem`` and
+            ``time_values`` may be None)
+        all_cells: Pack every grid cell instead of the cells with a curve
+            number in (0, 100]
+        directory: Pack directory used for derived artifacts
+
+    Returns:
+        CatchmentPack
+    """
+    rasters = {layer: _read_aligned(sources, layer) for layer in PACK_LAYERS if sources.get(layer) is not None}
+    grids = {layer: raster.data for layer, raster in rasters.items()}
+    return _pack_grids(
+        grids, rasters["cn"].transform, rasters["cn"].crs, all_cells=all_cells, sources=sources, directory=directory
+    )
+
+
+def pack_arrays(transform, cn, isozone, dem=None, time_values=None, crs=None, all_cells=False):
+    """
+    Build a pack from aligned in-memory grids instead of project rasters.
+
+    The pack keeps the grids, so nothing is read from disk later on. It is
+    meant for running the NAM kernel in-process (calibration, sweeps, tests).
+
+    Args:
+        transform: Affine transform of the grids
+        cn, isozone: Curve number and isozone grids of equal shape
+        dem, time_values: Optional grids of the same shape
+        crs: CRS of the grids
+
+    Returns:
+        CatchmentPack
+    """
+    grids = {"cn": cn, "isozone": isozone, "dem": dem, "time_values": time_values}
+    grids = {layer: np.asarray(grid) for layer, grid in grids.items() if grid is not None}
+    shapes = {grid.shape for grid in grids.values()}
+    if len(shapes) != 1 or len(shapes.pop()) != 2:
+        raise ValueError("All grids of a pack must be 2-D and of equal shape")
+    return _pack_grids(grids, transform, crs, all_cells=all_cells, keep_grids=True)
+
+
+def _pack_grids(grids, transform, crs, all_cells=False, sources=None, directory=None, keep_grids=False):
+    cn_data = grids["cn"]
+    isozone_data = grids["isozone"]
+
+    if all_cells:
+        packed = np.ones(cn_data.shape, dtype=bool)
+    else:
+        packed = (cn_data > 0) & (cn_data <= 100)
+    index_dtype = np.uint16 if max(cn_data.shape) <= np.iinfo(np.uint16).max else np.uint32
+    rows, cols = (index.astype(index_dtype) for index in np.nonzero(packed))
+
+    outside = cn_data[~packed]
+    outside = outside[np.isfinite(outside)]
+    outside_cn_range = (float(outside.min()), float(outside.max())) if outside.size else None
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        isozone_max = float(np.nanmax(isozone_data)) if isozone_data.size else np.nan
+    isozone_max = None if np.isnan(isozone_max) else isozone_max
+
+    layers = {
+        layer: encode_vector(grids[layer][packed]) if layer in grids else None
+        for layer in PACK_LAYERS
+    }
+    return CatchmentPack(
+        cn_data.shape, transform, crs, rows, cols, layers,
+        isozone_max=isozone_max, outside_cn_range=outside_cn_range, sources=sources,
+        directory=directory, grids=grids if keep_grids else None,
+    )
+
+
+def write_pack(pack, directory):
+    """
+    Write a pack as ``.npy`` vectors plus ``meta.json``.
+
+    Every file is written under a temporary name and moved into place, the
+    metadata last, so readers never see a partially written pack. Travel time
+    fields of a previous pack are removed.
+    """
+    os.makedirs(directory, exist_ok=True)
+    suffix = f".tmp-{os.getpid()}"
+
+    def _save(name, array):
+        path = os.path.join(directory, f"{name}.npy")
+        with open(path + suffix, "wb") as f:
+            np.save(f, np.ascontiguousarray(array))
+        os.replace(path + suffix, path)
+
+    _save("rows", pack.rows)
+    _save("cols", pack.cols)
+    layers = {}
+    for name, entry in pack._layers.items():
+        if entry is None:
+            layers[name] = None
+            continue
+        _save(name, entry[0])
+        layers[name] = entry[1]
+
+    meta = {
+        "version": PACK_VERSION,
+        "n_cells": len(pack),
+        "shape": list(pack.shape),
+        "transform": list(pack.transform)[:6],
+        "crs": pack.crs.to_wkt() if pack.crs is not None else None,
+        "isozone_max": pack.isozone_max,
+        "outside_cn_range": pack.outside_cn_range,
+        "layers": layers,
+        "sources": _source_signatures(pack.sources),
+    }
+    path = os.path.join(directory, "meta.json")
+    with open(path + suffix, "w") as f:
+        json.dump(meta, f)
+    os.replace(path + suffix, path)
+    pack.directory = directory
+    clear_travel_times(directory)
+
+
+def load_pack(directory, sources):
+    """
+    Load a stored pack with memory-mapped vectors.
+
+    Returns:
+        CatchmentPack or None if there is no pack or it is out of date
+    """
+    try:
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != PACK_VERSION or meta.get("sources") != _source_signatures(sources):
+        return None
+
+    def _load(name):
+        array = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+        if array.shape != (meta["n_cells"],):
+            raise ValueError(f"{name}.npy does not match meta.json")
+        return array
+
+    try:
+        rows = _load("rows")
+        cols = _load("cols")
+        layers = {
+            name: None if encoding is None else (_load(name), encoding)
+            for name, encoding in meta["layers"].items()
+        }
+    except (OSError, ValueError):
+        return None
+
+    outside_cn_range = meta["outside_cn_range"]
+    return CatchmentPack(
+        meta["shape"],
+        Affine(*meta["transform"]),
+        CRS.from_wkt(meta["crs"]) if meta["crs"] else None,
+        rows, cols, layers,
+        isozone_max=meta["isozone_max"],
+        outside_cn_range=tuple(outside_cn_range) if outside_cn_range is not None else None,
+        sources=sources,
+        directory=directory,
+    )
+
+
+def load_or_build_pack(directory, sources, log=NAM_QUIET):
+    """
+    Load the pack of a project, rebuilding and storing it when it is missing
+    or out of date. A pack that cannot be written is still returned.
+    """
+    pack = load_pack(directory, sources)
+    if pack is not None:
+        log(f"Loaded catchment pack from {directory}: {len(pack)} of {pack.shape[0] * pack.shape[1]} cells")
+        return pack
+
+    pack = build_pack(sources)
+    log(f"Built catchment pack: {len(pack)} of {pack.shape[0] * pack.shape[1]} cells")
+    try:
+        write_pack(pack, directory)
+        log(f"Catchment pack saved to {directory}")
+    except OSError as e:
+        log(f"Warning: Could not save catchment pack: {e}", warning=True)
+    return pack
+
+
+def travel_time_key(cells, discharge_row, discharge_col, dt):
+    """
+    Key of the travel time field of ``cells`` towards a discharge point.
+
+    Covers the DEM version (mtime and size of dem.tif), the grid, the valid
+    cells, the discharge cell and the time step.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps({
+        "dem": _source_signatures(cells.sources)["dem"],
+        "shape": list(cells.shape),
+        "transform": list(cells.transform)[:6],
+        "discharge": [int(discharge_row), int(discharge_col)],
+        "dt": dt,
+    }).encode())
+    digest.update(np.ascontiguousarray(cells.rows).tobytes())
+    digest.update(np.ascontiguousarray(cells.cols).tobytes())
+    return digest.hexdigest()
+
+
+def load_travel_times(directory, key):
+    """
+    Load a stored travel time field.
+
+    Returns:
+        dict or None: ``travel_times``, ``arrival_timesteps``,
+        ``discharge_row``, ``discharge_col`` and ``method``
+    """
+    path = os.path.join(directory, TRAVEL_TIMES_DIRNAME, f"{key}.npz")
+    try:
+        with np.load(path) as stored:
+            field = {
+                "travel_times": stored["travel_times"],
+                "arrival_timesteps": stored["arrival_timesteps"].astype(np.int64),
+                "discharge_row": stored["discharge"][0],
+                "discharge_col": stored["discharge"][1],
+                "method": str(stored["method"]),
+            }
+        os.utime(path)  # most recently used
+    except (OSError, ValueError, KeyError):
+        return None
+    return field
+
+
+def store_travel_times(directory, key, field):
+    """Store a travel time field and keep only the ``TRAVEL_TIMES_KEEP`` most recently used ones."""
+    target_dir = os.path.join(directory, TRAVEL_TIMES_DIRNAME)
+    os.makedirs(target_dir, exist_ok=True)
+    path = os.path.join(target_dir, f"{key}.npz")
+    with open(f"{path}.tmp-{os.getpid()}", "wb") as f:
+        np.savez(
+            f,
+            travel_times=field["travel_times"],
+            arrival_timesteps=field["arrival_timesteps"].astype(np.int32),
+            discharge=np.array([field["discharge_row"], field["discharge_col"]], dtype=np.int64),
+            method=np.array(field["method"]),
+        )
+    os.replace(f"{path}.tmp-{os.getpid()}", path)
+
+    stored = sorted(glob.glob(os.path.join(target_dir, "*.npz")), key=os.path.getmtime, reverse=True)
+    for stale in stored[TRAVEL_TIMES_KEEP:]:
+        try:
+            os.remove(stale)
+        except OSError:
+            pass
+
+
+def clear_travel_times(directory):
+    """Remove all stored travel time fields of a pack directory."""
+    for path in glob.glob(os.path.join(directory, TRAVEL_TIMES_DIRNAME, "*.npz")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
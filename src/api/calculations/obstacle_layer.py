@@ -0,0 +1,105 @@
+"""
+Obstacle layer ("Hindernislayer") weighting the flow distance to the outlet.
+
+Every cell is classified by its slope and whether it lies in a forest; the
+weight of each (slope class, forest) pair is looked up in a small table.
+Channel cells (accumulation above ``a_crit``) get the channel weight, cells
+without a valid slope keep their accumulation value.
+
+The table is read from ``OBSTACLE_WEIGHTS_FILE`` (JSON, default
+``data/obstacle_weights.json``) when it exists, so calibration changes need no
+code change::
+
+    {
+      "slope_edges_percent": [1, 5, 10, 20, 40],
+      "forest_weights": [3000, 1500, 750, 500, 375, 300],
+      "open_weights": [1500, 750, 375, 250, 188, 150],
+      "channel_weight": 100,
+      "min_slope_percent": -100
+    }
+
+Slope class ``i`` covers ``edges[i-1] <= slope < edges[i]``; the first class
+starts above ``min_slope_percent`` (exclusive) and the last is open-ended.
+"""
+
+import json
+import os
+
+import numpy as np
+
+
+OBSTACLE_WEIGHTS_FILE = os.getenv("OBSTACLE_WEIGHTS_FILE", "data/obstacle_weights.json")
+
+DEFAULT_OBSTACLE_TABLE = {
+    "slope_edges_percent": [1, 5, 10, 20, 40],
+    "forest_weights": [3000, 1500, 750, 500, 375, 300],
+    "open_weights": [1500, 750, 375, 250, 188, 150],
+    "channel_weight": 100,
+    "min_slope_percent": -100,
+}
+
+_ROWS_PER_BLOCK = 256
+
+
+def load_obstacle_table(path=OBSTACLE_WEIGHTS_FILE):
+    """
+    Obstacle weight table from ``path``, or the default table if it does not exist.
+
+    Raises:
+        ValueError: If the table is inconsistent
+    """
+    table = dict(DEFAULT_OBSTACLE_TABLE)
+    if path and os.path.exists(path):
+        with open(path) as f:
+            table.update(json.load(f))
+
+    edges = np.asarray(table["slope_edges_percent"], dtype=np.float64)
+    if np.any(np.diff(edges) <= 0):
+        raise ValueError(f"Slope class edges must be increasing: {table['slope_edges_percent']}")
+    for key in ("forest_weights", "open_weights"):
+        if len(table[key]) != len(edges) + 1:
+            raise ValueError(f"{key} needs {len(edges) + 1} weights, one per slope class")
+    return table
+
+
+def obstacle_weights(slope_percentage, forest, acc, a_crit, table=None, out=None):
+    """
+    Obstacle weight of every cell.
+
+    Classifies the cells block by block into the preallocated ``out``, so only
+    block-sized temporaries are allocated.
+
+    Args:
+        slope_percentage: Cell slopes [%]
+        forest: 1 for forest cells, 0 elsewhere
+        acc: Flow accumulation [cells]
+        a_crit: Accumulation above which a cell is channel
+        table: Weight table (``load_obstacle_table()`` if None)
+        out: Optional output array of the grid shape
+
+    Returns:
+        np.ndarray: Obstacle weights
+    """
+    if table is None:
+        table = load_obstacle_table()
+    slope_percentage = np.asarray(slope_percentage)
+    forest = np.asarray(forest)
+    acc = np.asarray(acc)
+    if out is None:
+        out = np.empty(acc.shape, dtype=np.result_type(acc.dtype, np.float32))
+
+    edges = np.asarray(table["slope_edges_percent"], dtype=np.float64)
+    # Row = slope class, column = (open, forest)
+    lookup = np.column_stack([table["open_weights"], table["forest_weights"]]).astype(out.dtype)
+    min_slope = table["min_slope_percent"]
+    channel_weight = table["channel_weight"]
+
+    for start in range(0, out.shape[0], _ROWS_PER_BLOCK):
+        rows = slice(start, start + _ROWS_PER_BLOCK)
+        slope_block = slope_percentage[rows]
+        slope_class = np.searchsorted(edges, slope_block, side="right")
+        np.take(lookup.ravel(), slope_class * 2 + (forest[rows] == 1), out=out[rows])
+        # NaN slopes fail the comparison and keep their accumulation value
+        np.copyto(out[rows], acc[rows], where=~(slope_block > min_slope))
+        out[rows][acc[rows] > a_crit] = channel_weight
+    return out
@@ -1,8 +1,23 @@
-from celery import group
+from celery import chord, group, uuid
+from celery.result import AsyncResult, GroupResult
 
 from calculations.calculations import app
 
 
+# Project files read by each method task. Files without a producer in the
+# plan (isozones_cog.tif and time_values.tif come from
+# prepare_discharge_hydroparameters) are expected to exist already.
+METHOD_ARTIFACTS = {
+    "light_methods_batch": (),
+    "modifizierte_fliesszeit": (),
+    "koella": (),
+    "clark-wsl": ("isozones_cog.tif",),
+    "clark_wsl_batch": ("isozones_cog.tif",),
+    "nam": ("curvenumbers.tif", "isozones_cog.tif", "dem.tif", "time_values.tif"),
+    "nam_batch": ("curvenumbers.tif", "isozones_cog.tif", "dem.tif", "time_values.tif"),
+}
+
+
 @app.task(name="launch_group", bind=True)
 def launch_group(self, task_signatures):
     """Launch a group from serialized signatures and return its group id."""
@@ -11,3 +26,59 @@ def launch_group(self, task_signatures):
     grp.save()
     return {"group_id": grp.id}
 
+
+@app.task(name="launch_signatures", bind=True)
+def launch_signatures(self, task_signatures):
+    """Apply serialized signatures under the task ids they were frozen with."""
+    task_ids = []
+    for sig in task_signatures:
+        task_ids.append(app.signature(sig).apply_async().id)
+    return {"task_ids": task_ids}
+
+
+def plan_project_tasks(producers, task_signatures):
+    """
+    Split method tasks by the generated project files they read.
+
+    Args:
+        producers: {filename: signature of the task generating it}
+        task_signatures: Method task signatures; the files they read are
+            looked up in ``METHOD_ARTIFACTS`` by task name
+
+    Returns:
+        tuple: (tasks to start now, producers to run, tasks to start after the producers)
+    """
+    immediate, gated, needed = [], [], []
+    for sig in task_signatures:
+        reads = [filename for filename in METHOD_ARTIFACTS[sig.task] if filename in producers]
+        if not reads:
+            immediate.append(sig)
+            continue
+        gated.append(sig)
+        needed.extend(filename for filename in reads if filename not in needed)
+    return immediate, [producers[filename] for filename in needed], gated
+
+
+def launch_project_tasks(producers, task_signatures):
+    """
+    Start the method tasks of a project as soon as the files they read exist.
+
+    Tasks reading no generated file start immediately. The producers needed by
+    the others run in parallel, and a chord callback starts the dependent
+    tasks once all of them succeeded. Producers nobody reads are not run.
+
+    Returns:
+        GroupResult: Saved group over every started task (producers
+        included), polled through ``/task/group/{id}``
+    """
+    immediate, prerequisites, gated = plan_project_tasks(producers, task_signatures)
+    results = [sig.apply_async() for sig in immediate]
+    if gated:
+        # Fix the task ids up front so the group can track tasks that start later
+        for sig in prerequisites + gated:
+            sig.freeze()
+        chord(group(prerequisites), launch_signatures.si(gated)).apply_async()
+        results.extend(AsyncResult(sig.id, app=app) for sig in prerequisites + gated)
+    grp = GroupResult(uuid(), results, app=app)
+    grp.save()
+    return grp
@@ -0,0 +1,175 @@
+"""
+In-process LRU cache for project rasters.
+
+Repeated calculations on the same project (climate scenarios, return periods,
+reruns after parameter changes) read the same GeoTIFFs under
+``data/{user}/{project}/``. The cache keeps the decoded band of each file in
+memory, keyed by path and validated against the file's mtime and size, so a
+rewritten raster is reloaded automatically.
+
+The memory budget is set with ``RASTER_CACHE_MAX_MB`` (default 1024, 0
+disables caching). Cached arrays are read-only; callers that need to modify
+them must copy first.
+
+Workers answer the ``raster_cache_stats`` remote control command with the
+hit/miss/eviction counters of their cache.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+import numpy as np
+import rasterio
+from celery.worker.control import inspect_command
+from rasterio.warp import Resampling, reproject
+
+
+RASTER_CACHE_MAX_MB = float(os.getenv("RASTER_CACHE_MAX_MB", "1024"))
+
+
+class CachedRaster(NamedTuple):
+    """One band of a raster with its georeferencing."""
+    data: np.ndarray
+    transform: object
+    crs: object
+    nodata: Optional[float]
+    resampled: bool = False
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class RasterCache:
+    """
+    Thread-safe LRU cache of raster bands bounded by a memory budget in bytes.
+
+    Entries are keyed by absolute path, band and optional target grid, and are
+    invalidated when the mtime or size of any involved file changes.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def read(self, path, band=1, like=None, resampling=Resampling.nearest):
+        """
+        Read one band of a raster, from memory when the file is unchanged.
+
+        Args:
+            path: Path of the GeoTIFF
+            band: Band index (1-based)
+            like: Optional path of a raster whose grid the band is aligned to.
+                The band is reprojected onto that grid when the shapes differ.
+            resampling: Resampling method used for the alignment
+
+        Returns:
+            CachedRaster: Read-only data with transform, CRS and nodata value
+        """
+        path = os.path.abspath(path)
+        like = os.path.abspath(like) if like is not None else None
+        key = (path, band, like, resampling if like is not None else None)
+        signature = (_file_signature(path), _file_signature(like) if like is not None else None)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == signature:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._discard(key)
+                self.invalidations += 1
+            self.misses += 1
+
+        raster = self._load(path, band, like, resampling)
+        raster.data.setflags(write=False)
+
+        with self._lock:
+            self._store(key, signature, raster)
+        return raster
+
+    def _load(self, path, band, like, resampling):
+        with rasterio.open(path) as src:
+            data = src.read(band)
+            raster = CachedRaster(data, src.transform, src.crs, src.nodata)
+
+        if like is None:
+            return raster
+
+        target = self.read(like)
+        if data.shape == target.data.shape:
+            return raster
+
+        aligned = np.empty(target.data.shape, dtype=data.dtype)
+        reproject(
+            data,
+            aligned,
+            src_transform=raster.transform,
+            src_crs=raster.crs,
+            dst_transform=target.transform,
+            dst_crs=target.crs,
+            resampling=resampling
+        )
+        return CachedRaster(aligned, target.transform, target.crs, raster.nodata, resampled=True)
+
+    def _store(self, key, signature, raster):
+        size = raster.data.nbytes
+        if key in self._entries:
+            self._discard(key)
+        if size > self.max_bytes:
+            return
+        while self._entries and self._bytes + size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+            self.evictions += 1
+        self._entries[key] = (signature, raster)
+        self._bytes += size
+
+    def _discard(self, key):
+        _, raster = self._entries.pop(key)
+        self._bytes -= raster.data.nbytes
+
+    def clear(self):
+        """Drop all cached rasters (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Counters and memory usage of the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+raster_cache = RasterCache(RASTER_CACHE_MAX_MB * 1024 * 1024)
+
+
+def read_raster(path, band=1, like=None, resampling=Resampling.nearest):
+    """Read a raster band through the per-process cache, see ``RasterCache.read``."""
+    return raster_cache.read(path, band=band, like=like, resampling=resampling)
+
+
+@inspect_command(name="raster_cache_stats")
+def raster_cache_stats(state):
+    """Remote control command returning the raster cache counters of this worker."""
+    return {"pid": os.getpid(), **raster_cache.stats()}
@@ -0,0 +1,250 @@
+"""
+Content-addressed memoization of discharge results.
+
+A result is stored under the SHA-256 of the method name, its full input
+parameters and the content hashes of the project rasters it reads. Repeated
+calculations of an unchanged project find their previous result and only
+upsert it again. A rewritten raster changes its content hash and therefore
+the key, so stale results are never returned. The key also holds the
+application version and the code version of the method
+(``RESULT_CODE_VERSIONS``), so results of older code are not served after a
+deploy.
+
+Entries live in Redis (``RESULT_MEMO_REDIS_URL``, default the Celery result
+backend) with a TTL of ``RESULT_MEMO_TTL_S`` seconds. At most
+``RESULT_MEMO_MAX_ENTRIES`` entries are kept (oldest are evicted first), and
+results larger than ``RESULT_MEMO_MAX_ENTRY_KB`` are not stored.
+``RESULT_MEMO_ENABLED=false`` disables the layer. When Redis is unreachable
+every lookup is a miss and the calculation runs as before.
+
+Hits and misses are counted per method in this process and in Redis; workers
+answer the ``result_memo_stats`` remote control command with both.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from celery.worker.control import inspect_command
+
+from version import __version__
+
+
+RESULT_MEMO_ENABLED = os.getenv("RESULT_MEMO_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+RESULT_MEMO_REDIS_URL = os.getenv(
+    "RESULT_MEMO_REDIS_URL",
+    os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379"),
+)
+RESULT_MEMO_TTL_S = int(os.getenv("RESULT_MEMO_TTL_S", str(7 * 24 * 3600)))
+RESULT_MEMO_MAX_ENTRIES = int(os.getenv("RESULT_MEMO_MAX_ENTRIES", "100000"))
+RESULT_MEMO_MAX_ENTRY_KB = float(os.getenv("RESULT_MEMO_MAX_ENTRY_KB", "512"))
+
+# Version of the code computing each method; bump it when its results change
+RESULT_CODE_VERSIONS = {
+    "modifizierte_fliesszeit": 1,
+    "koella": 1,
+    "modifizierte_fliesszeit_array": 2,
+    "koella_array": 2,
+    "clark-wsl": 1,
+    "nam": 1,
+}
+
+_KEY_PREFIX = "result_memo:"
+_INDEX_KEY = "result_memo:index"
+_STATS_KEY = "result_memo:stats"
+
+logger = logging.getLogger(__name__)
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+
+def _canonical_json(value):
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=_json_default)
+
+
+class _ArtifactHashes:
+    """Content SHA-256 of files, recomputed only when their mtime or size changes."""
+
+    def __init__(self):
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        if path is None or not os.path.exists(path):
+            return None
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._hashes.get(path)
+            if entry is not None and entry[0] == signature:
+                return entry[1]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+
+        with self._lock:
+            self._hashes[path] = (signature, content_hash)
+        return content_hash
+
+
+_artifact_hashes = _ArtifactHashes()
+
+
+def artifact_hash(path):
+    """Content hash of a project artifact (None if it does not exist)."""
+    return _artifact_hashes.get(path)
+
+
+def memo_key(method, params, artifacts=None):
+    """
+    Key of a result.
+
+    Args:
+        method: Name of the calculation
+        params: JSON-serialisable input parameters
+        artifacts: Optional mapping name -> path of the files the calculation reads
+    """
+    payload = {
+        "method": method,
+        "version": [__version__, RESULT_CODE_VERSIONS.get(method, 1)],
+        "params": params,
+        "artifacts": {name: artifact_hash(path) for name, path in sorted((artifacts or {}).items())},
+    }
+    return hashlib.sha256(_canonical_json(payload).encode()).hexdigest()
+
+
+class ResultMemo:
+    """Result store in Redis with TTL, entry bound and hit/miss counters."""
+
+    def __init__(self, url, ttl_s, max_entries, max_entry_bytes, enabled=True):
+        self.url = url
+        self.ttl_s = int(ttl_s)
+        self.max_entries = int(max_entries)
+        self.max_entry_bytes = int(max_entry_bytes)
+        self.enabled = enabled
+        self._client = None
+        self._lock = threading.Lock()
+        self.hits = {}
+        self.misses = {}
+        self.errors = 0
+
+    def _redis(self):
+        if self._client is None:
+            import redis
+            self._client = redis.Redis.from_url(self.url, socket_timeout=1.0, socket_connect_timeout=1.0)
+        return self._client
+
+    def _count(self, counters, method):
+        with self._lock:
+            counters[method] = counters.get(method, 0) + 1
+
+    def get(self, method, key):
+        """Stored result of ``key``, or None on a miss."""
+        if not self.enabled:
+            return None
+        try:
+            client = self._redis()
+            raw = client.get(_KEY_PREFIX + key)
+            field = f"{method}:{'hits' if raw is not None else 'misses'}"
+            client.hincrby(_STATS_KEY, field, 1)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Result memo lookup failed: {e}")
+            raw = None
+        if raw is None:
+            self._count(self.misses, method)
+            return None
+        self._count(self.hits, method)
+        return json.loads(raw)
+
+    def put(self, key, result):
+        """Store ``result`` under ``key`` and evict the oldest entries beyond the bound."""
+        if not self.enabled:
+            return
+        raw = _canonical_json(result)
+        if len(raw) > self.max_entry_bytes:
+            return
+        try:
+            client = self._redis()
+            pipe = client.pipeline()
+            pipe.set(_KEY_PREFIX + key, raw, ex=self.ttl_s)
+            pipe.zadd(_INDEX_KEY, {key: time.time()})
+            pipe.zcard(_INDEX_KEY)
+            size = pipe.execute()[-1]
+            if size > self.max_entries:
+                evicted = client.zpopmin(_INDEX_KEY, size - self.max_entries)
+                if evicted:
+                    client.delete(*(_KEY_PREFIX + member.decode() for member, _ in evicted))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Result memo store failed: {e}")
+
+    def stats(self):
+        """Hit/miss counters of this process and, if reachable, of all processes."""
+        with self._lock:
+            methods = sorted(set(self.hits) | set(self.misses))
+            local = {
+                method: {
+                    "hits": self.hits.get(method, 0),
+                    "misses": self.misses.get(method, 0),
+                    "hit_rate": self.hits.get(method, 0) / (self.hits.get(method, 0) + self.misses.get(method, 0)),
+                }
+                for method in methods
+            }
+        stats = {"enabled": self.enabled, "errors": self.errors, "process": local}
+        if self.enabled:
+            try:
+                client = self._redis()
+                stats["global"] = {k.decode(): int(v) for k, v in client.hgetall(_STATS_KEY).items()}
+                stats["entries"] = client.zcard(_INDEX_KEY)
+            except Exception:
+                pass
+        return stats
+
+
+result_memo = ResultMemo(
+    RESULT_MEMO_REDIS_URL,
+    RESULT_MEMO_TTL_S,
+    RESULT_MEMO_MAX_ENTRIES,
+    RESULT_MEMO_MAX_ENTRY_KB * 1024,
+    enabled=RESULT_MEMO_ENABLED,
+)
+
+
+def memoized(method, params, compute, artifacts=None, memo=None):
+    """
+    Result of ``compute()`` for ``params``, from the memo when available.
+
+    Results are only stored when they carry no ``"error"`` entry.
+    """
+    memo = result_memo if memo is None else memo
+    key = memo_key(method, params, artifacts)
+    result = memo.get(method, key)
+    if result is not None:
+        return result
+    result = compute()
+    if not (isinstance(result, dict) and "error" in result):
+        memo.put(key, result)
+    return result
+
+
+@inspect_command(name="result_memo_stats")
+def result_memo_stats(state):
+    """Remote control command returning the result memo counters of this worker."""
+    return {"pid": os.getpid(), **result_memo.stats()}
@@ -3,18 +3,42 @@ from fastapi.responses import JSONResponse
 from helpers.prisma import prisma
 from helpers.user import get_user
 from prisma.models import User
-from celery import chain, group
+from celery import group
 from celery.result import AsyncResult
 import pandas as pd
+import os
+from concurrent.futures import ThreadPoolExecutor
 
-from calculations.discharge import construct_idf_curve, modifizierte_fliesszeit, prepare_discharge_hydroparameters, koella, clark_wsl_modified
-from calculations.nam import nam, extract_dem
+from calculations.discharge import construct_idf_curve, modifizierte_fliesszeit, prepare_discharge_hydroparameters, koella, clark_wsl_modified, clark_wsl_batch, light_methods_batch
+from calculations.discharge import clark_wsl_zone_cell_counts, run_clark_wsl, run_light_methods
+from calculations.nam import nam_batch, extract_dem
 from calculations.curvenumbers import get_curve_numbers
-from calculations.orchestration import launch_group
+from calculations.orchestration import launch_project_tasks
 
 router = APIRouter(prefix="/discharge",
     tags=["discharge"],)
 
+# Synchronous fast path of the light methods (?sync=true). Requests whose cost
+# (evaluations, for Clark-WSL zones × fractions per scenario) exceeds the
+# threshold are still queued on Celery.
+DISCHARGE_SYNC_MAX_COST = int(os.getenv("DISCHARGE_SYNC_MAX_COST", "50000"))
+_sync_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("DISCHARGE_SYNC_WORKERS", "4")),
+    thread_name_prefix="discharge-sync",
+)
+
+
+def _sync_response(results):
+    """Computed results of one object, shaped like a finished task group."""
+    if "error" in results:
+        return JSONResponse({"sync": True, "status": "FAILURE", "task_result": results["error"], "results": None})
+    return JSONResponse({"sync": True, "status": "SUCCESS", "task_result": None, "results": results})
+
+
+def _light_method_cost(x, climate_scenarios):
+    # 30 and 300 years are interpolated from a 20 and a 100 year evaluation
+    return len(climate_scenarios) * (2 if x in (30, 300) else 1)
+
 @router.get("/calculate_project")
 def get_calculate_project(ProjectId:str, user: User = Depends(get_user)):
     try:
@@ -55,123 +79,108 @@ def get_calculate_project(ProjectId:str, user: User = Depends(get_user)):
         # Climate scenarios to calculate
         climate_scenarios = ["current", "1_5_degree", "2_degree", "3_degree"]
 
-        for mod_fliesszeit in project.Mod_Fliesszeit:
-            for scenario in climate_scenarios:
-                doDoTasks.append(modifizierte_fliesszeit.s(
-                    project.IDF_Parameters.P_low_1h, 
-                    project.IDF_Parameters.P_high_1h, 
-                    project.IDF_Parameters.P_low_24h, 
-                    project.IDF_Parameters.P_high_24h, 
-                    project.IDF_Parameters.rp_low, 
-                    project.IDF_Parameters.rp_high, 
-                    mod_fliesszeit.Annuality.number, 
-                    mod_fliesszeit.Vo20, 
-                    project.channel_length, 
-                    project.delta_h, 
-                    mod_fliesszeit.psi, 
-                    project.catchment_area, 
-                    mod_fliesszeit.id,
-                    project_easting=project.Point.easting,
-                    project_northing=project.Point.northing,
-                    climate_scenario=scenario
-                ))
-
-        for koella_obj in project.Koella:
-            for scenario in climate_scenarios:
-                doDoTasks.append(koella.s(
-                    project.IDF_Parameters.P_low_1h, 
-                    project.IDF_Parameters.P_high_1h, 
-                    project.IDF_Parameters.P_low_24h, 
-                    project.IDF_Parameters.P_high_24h, 
-                    project.IDF_Parameters.rp_low, 
-                    project.IDF_Parameters.rp_high, 
-                    koella_obj.Annuality.number, 
-                    koella_obj.Vo20, 
-                    project.cummulative_channel_length/1000, 
-                    project.catchment_area, 
-                    koella_obj.glacier_area, 
-                    koella_obj.id,
-                    project_easting=project.Point.easting,
-                    project_northing=project.Point.northing,
-                    climate_scenario=scenario
-                ))
-
-                # TODO: get zone parameters from DB
-                zone_parameters = {
-                "Atyp 1": {'V0_20': 20, 'WSV': 10, 'psi': 0.45, 'alpha': 82},
-                "Atyp 2": {'V0_20': 25, 'WSV': 20, 'psi': 0.35, 'alpha': 76},
-                "Atyp 3": {'V0_20': 35, 'WSV': 30, 'psi': 0.15,  'alpha': 63.5},
-                "Atyp 4": {'V0_20': 45,   'WSV': 45, 'psi': 0.1,   'alpha': 54},
-                "Atyp 5": {'V0_20': 50, 'WSV': 60, 'psi': 0.05, 'alpha': 42},
-                "Siedl.typ 1": {'V0_20': 30, 'WSV': 20, 'psi': 0.3, 'alpha': 80},
-                "Siedl.typ 2": {'V0_20': 30, 'WSV': 20, 'psi': 0.3, 'alpha': 80},
-                "Siedl.typ 3": {'V0_20': 30, 'WSV': 20, 'psi': 0.3, 'alpha': 80},
-            }
+        # Mod. Fliesszeit and Kölla of all objects and scenarios are evaluated in one task
+        if len(project.Mod_Fliesszeit) > 0 or len(project.Koella) > 0:
+            doDoTasks.append(light_methods_batch.s(
+                project.IDF_Parameters.P_low_1h,
+                project.IDF_Parameters.P_high_1h,
+                project.IDF_Parameters.P_low_24h,
+                project.IDF_Parameters.P_high_24h,
+                project.IDF_Parameters.rp_low,
+                project.IDF_Parameters.rp_high,
+                mod_fliesszeit_objects=[
+                    {"id": obj.id, "x": obj.Annuality.number, "Vo20": obj.Vo20, "psi": obj.psi}
+                    for obj in project.Mod_Fliesszeit
+                ],
+                koella_objects=[
+                    {"id": obj.id, "x": obj.Annuality.number, "Vo20": obj.Vo20, "glacier_area": obj.glacier_area}
+                    for obj in project.Koella
+                ],
+                L=project.channel_length,
+                delta_H=project.delta_h,
+                Lg=project.cummulative_channel_length/1000,
+                E=project.catchment_area,
+                project_easting=project.Point.easting,
+                project_northing=project.Point.northing,
+                climate_scenarios=climate_scenarios
+            ))
+
+        # TODO: get zone parameters from DB
+        zone_parameters = {
+            "Atyp 1": {'V0_20': 20, 'WSV': 10, 'psi': 0.45, 'alpha': 82},
+            "Atyp 2": {'V0_20': 25, 'WSV': 20, 'psi': 0.35, 'alpha': 76},
+            "Atyp 3": {'V0_20': 35, 'WSV': 30, 'psi': 0.15,  'alpha': 63.5},
+            "Atyp 4": {'V0_20': 45,   'WSV': 45, 'psi': 0.1,   'alpha': 54},
+            "Atyp 5": {'V0_20': 50, 'WSV': 60, 'psi': 0.05, 'alpha': 42},
+            "Siedl.typ 1": {'V0_20': 30, 'WSV': 20, 'psi': 0.3, 'alpha': 80},
+            "Siedl.typ 2": {'V0_20': 30, 'WSV': 20, 'psi': 0.3, 'alpha': 80},
+            "Siedl.typ 3": {'V0_20': 30, 'WSV': 20, 'psi': 0.3, 'alpha': 80},
+        }
 
         for clark_wsl_obj in project.ClarkWSL:
             fractions_dict = [
                 {"typ": f.ZoneParameterTyp, "pct": f.pct}
                 for f in clark_wsl_obj.Fractions
             ]
-            for scenario in climate_scenarios:
-                doDoTasks.append(clark_wsl_modified.s(
-                    P_low_1h=project.IDF_Parameters.P_low_1h,
-                    P_high_1h=project.IDF_Parameters.P_high_1h,
-                    P_low_24h=project.IDF_Parameters.P_low_24h,
-                    P_high_24h=project.IDF_Parameters.P_high_24h,
-                    rp_low=project.IDF_Parameters.rp_low,
-                    rp_high=project.IDF_Parameters.rp_high,
-                    discharge_types_parameters=zone_parameters,
-                    x=clark_wsl_obj.Annuality.number,
-                    fractions_dict=fractions_dict,
-                    clark_wsl=clark_wsl_obj.id,
-                    project_id=project.id,
-                    user_id=user.id,
-                    project_easting=project.Point.easting,
-                    project_northing=project.Point.northing,
-                    climate_scenario=scenario,
-                    intensity_fn=None,
-                    dt=clark_wsl_obj.dt,
-                    pixel_area_m2=clark_wsl_obj.pixel_area_m2
-                ))
+            # All climate scenarios of a Clark-WSL object share one task and one result write
+            doDoTasks.append(clark_wsl_batch.s(
+                P_low_1h=project.IDF_Parameters.P_low_1h,
+                P_high_1h=project.IDF_Parameters.P_high_1h,
+                P_low_24h=project.IDF_Parameters.P_low_24h,
+                P_high_24h=project.IDF_Parameters.P_high_24h,
+                rp_low=project.IDF_Parameters.rp_low,
+                rp_high=project.IDF_Parameters.rp_high,
+                discharge_types_parameters=zone_parameters,
+                x=clark_wsl_obj.Annuality.number,
+                fractions_dict=fractions_dict,
+                clark_wsl=clark_wsl_obj.id,
+                project_id=project.id,
+                user_id=user.id,
+                project_easting=project.Point.easting,
+                project_northing=project.Point.northing,
+                climate_scenarios=climate_scenarios,
+                dt=clark_wsl_obj.dt,
+                pixel_area_m2=clark_wsl_obj.pixel_area_m2
+            ))
 
         for nam_obj in project.NAM:
-            for scenario in climate_scenarios:
-                doDoTasks.append(nam.s(
-                    P_low_1h=project.IDF_Parameters.P_low_1h,
-                    P_high_1h=project.IDF_Parameters.P_high_1h,
-                    P_low_24h=project.IDF_Parameters.P_low_24h,
-                    P_high_24h=project.IDF_Parameters.P_high_24h,
-                    rp_low=project.IDF_Parameters.rp_low,
-                    rp_high=project.IDF_Parameters.rp_high,
-                    x=nam_obj.Annuality.number,
-                    curve_number=70.0,  # Default fallback value
-                    catchment_area=project.catchment_area,
-                    channel_length=project.channel_length,
-                    delta_h=project.delta_h,
-                    nam_id=nam_obj.id,
-                    project_id=project.id,
-                    user_id=user.id,
-                    water_balance_mode=nam_obj.water_balance_mode,
-                    precipitation_factor=nam_obj.precipitation_factor,
-                    storm_center_mode=nam_obj.storm_center_mode,
-                    routing_method=nam_obj.routing_method,
-                    readiness_to_drain=nam_obj.readiness_to_drain,
-                    discharge_point=(project.Point.easting, project.Point.northing),
-                    discharge_point_crs="EPSG:2056",
-                    project_easting=project.Point.easting,
-                    project_northing=project.Point.northing,
-                    climate_scenario=scenario,
-                    debug=False
-                ))
+            # All climate scenarios of a NAM object share one raster load
+            doDoTasks.append(nam_batch.s(
+                P_low_1h=project.IDF_Parameters.P_low_1h,
+                P_high_1h=project.IDF_Parameters.P_high_1h,
+                P_low_24h=project.IDF_Parameters.P_low_24h,
+                P_high_24h=project.IDF_Parameters.P_high_24h,
+                rp_low=project.IDF_Parameters.rp_low,
+                rp_high=project.IDF_Parameters.rp_high,
+                x=nam_obj.Annuality.number,
+                curve_number=70.0,  # Default fallback value
+                catchment_area=project.catchment_area,
+                channel_length=project.channel_length,
+                delta_h=project.delta_h,
+                nam_id=nam_obj.id,
+                project_id=project.id,
+                user_id=user.id,
+                water_balance_mode=nam_obj.water_balance_mode,
+                precipitation_factor=nam_obj.precipitation_factor,
+                storm_center_mode=nam_obj.storm_center_mode,
+                routing_method=nam_obj.routing_method,
+                readiness_to_drain=nam_obj.readiness_to_drain,
+                discharge_point=(project.Point.easting, project.Point.northing),
+                discharge_point_crs="EPSG:2056",
+                project_easting=project.Point.easting,
+                project_northing=project.Point.northing,
+                climate_scenarios=climate_scenarios,
+                debug=False
+            ))
 
         if len(doDoTasks) > 0:
             own_soil = project.NAM[0].use_own_soil_data if len(project.NAM) > 0 else True
-            prerequisites = chain(
-                extract_dem.si(project.id, user.id),
-                get_curve_numbers.si(project.id, user.id, "bek", own_soil),
-            )
-            task = chain(prerequisites, launch_group.si(doDoTasks)).apply_async()
+            # Only NAM reads these; the other methods start right away
+            producers = {
+                "dem.tif": extract_dem.si(project.id, user.id),
+                "curvenumbers.tif": get_curve_numbers.si(project.id, user.id, "bek", own_soil),
+            }
+            task = launch_project_tasks(producers, doDoTasks)
             return JSONResponse({"task_id": task.id})
 
     except Exception as e:
@@ -184,7 +193,7 @@ def get_calculate_project(ProjectId:str, user: User = Depends(get_user)):
         )
 
 @router.get("/modifizierte_fliesszeit")
-def get_modifizierte_fliesszeit(ProjectId:str, ModFliesszeitId: int, user: User = Depends(get_user)):
+def get_modifizierte_fliesszeit(ProjectId:str, ModFliesszeitId: int, sync: bool = False, user: User = Depends(get_user)):
     try:
         project =  prisma.project.find_unique_or_raise(
             where = {
@@ -206,7 +215,28 @@ def get_modifizierte_fliesszeit(ProjectId:str, ModFliesszeitId: int, user: User
         
         # Climate scenarios to calculate
         climate_scenarios = ["current", "1_5_degree", "2_degree", "3_degree"]
-        
+
+        if sync and _light_method_cost(modFliesszeit.Annuality.number, climate_scenarios) <= DISCHARGE_SYNC_MAX_COST:
+            results = _sync_executor.submit(
+                run_light_methods,
+                project.IDF_Parameters.P_low_1h,
+                project.IDF_Parameters.P_high_1h,
+                project.IDF_Parameters.P_low_24h,
+                project.IDF_Parameters.P_high_24h,
+                project.IDF_Parameters.rp_low,
+                project.IDF_Parameters.rp_high,
+                [{"id": modFliesszeit.id, "x": modFliesszeit.Annuality.number, "Vo20": modFliesszeit.Vo20, "psi": modFliesszeit.psi}],
+                [],
+                project.channel_length,
+                project.delta_h,
+                None,
+                project.catchment_area,
+                project_easting=project.Point.easting,
+                project_northing=project.Point.northing,
+                climate_scenarios=climate_scenarios,
+            ).result()
+            return _sync_response(results["mod_fliesszeit"][modFliesszeit.id])
+
         doDoTasks = []
         for scenario in climate_scenarios:
             doDoTasks.append(modifizierte_fliesszeit.s(
@@ -239,7 +269,7 @@ def get_modifizierte_fliesszeit(ProjectId:str, ModFliesszeitId: int, user: User
         )
 
 @router.get("/koella")
-def get_koella(ProjectId:str, KoellaId: int, user: User = Depends(get_user)):
+def get_koella(ProjectId:str, KoellaId: int, sync: bool = False, user: User = Depends(get_user)):
     try:
         project =  prisma.project.find_unique_or_raise(
             where = {
@@ -261,7 +291,28 @@ def get_koella(ProjectId:str, KoellaId: int, user: User = Depends(get_user)):
         
         # Climate scenarios to calculate
         climate_scenarios = ["current", "1_5_degree", "2_degree", "3_degree"]
-        
+
+        if sync and _light_method_cost(koella_obj.Annuality.number, climate_scenarios) <= DISCHARGE_SYNC_MAX_COST:
+            results = _sync_executor.submit(
+                run_light_methods,
+                project.IDF_Parameters.P_low_1h,
+                project.IDF_Parameters.P_high_1h,
+                project.IDF_Parameters.P_low_24h,
+                project.IDF_Parameters.P_high_24h,
+                project.IDF_Parameters.rp_low,
+                project.IDF_Parameters.rp_high,
+                [],
+                [{"id": koella_obj.id, "x": koella_obj.Annuality.number, "Vo20": koella_obj.Vo20, "glacier_area": koella_obj.glacier_area}],
+                None,
+                None,
+                project.cummulative_channel_length/1000,
+                project.catchment_area,
+                project_easting=project.Point.easting,
+                project_northing=project.Point.northing,
+                climate_scenarios=climate_scenarios,
+            ).result()
+            return _sync_response(results["koella"][koella_obj.id])
+
         doDoTasks = []
         for scenario in climate_scenarios:
             doDoTasks.append(koella.s(
@@ -306,7 +357,7 @@ def clark_wsl_modified(self,
 ):
 """
 @router.get("/clark-wsl")
-def get_clark_wsl(ProjectId:str, ClarkWSLId: int, user: User = Depends(get_user)):
+def get_clark_wsl(ProjectId:str, ClarkWSLId: int, sync: bool = False, user: User = Depends(get_user)):
     try:
         project =  prisma.project.find_unique_or_raise(
             where = {
@@ -346,7 +397,31 @@ def get_clark_wsl(ProjectId:str, ClarkWSLId: int, user: User = Depends(get_user)
 
         # Climate scenarios to calculate
         climate_scenarios = ["current", "1_5_degree", "2_degree", "3_degree"]
-        
+
+        # Only with stored zone histograms: the raster fallback stays on the workers
+        zone_cell_counts = clark_wsl_zone_cell_counts(project.id, user.id, allow_raster=False) if sync else None
+        if zone_cell_counts is not None and len(climate_scenarios) * len(zone_cell_counts) * max(len(fractions_dict), 1) <= DISCHARGE_SYNC_MAX_COST:
+            results = _sync_executor.submit(
+                run_clark_wsl,
+                project.IDF_Parameters.P_low_1h,
+                project.IDF_Parameters.P_high_1h,
+                project.IDF_Parameters.P_low_24h,
+                project.IDF_Parameters.P_high_24h,
+                project.IDF_Parameters.rp_low,
+                project.IDF_Parameters.rp_high,
+                zone_parameters,
+                clark_wsl_obj.Annuality.number,
+                fractions_dict,
+                clark_wsl_obj.id,
+                zone_cell_counts,
+                project_easting=project.Point.easting,
+                project_northing=project.Point.northing,
+                climate_scenarios=climate_scenarios,
+                dt=clark_wsl_obj.dt,
+                pixel_area_m2=clark_wsl_obj.pixel_area_m2,
+            ).result()
+            return _sync_response(results)
+
         doDoTasks = []
         for scenario in climate_scenarios:
             doDoTasks.append(clark_wsl_modified.s(
@@ -412,41 +487,40 @@ def get_nam(ProjectId:str, NAMId: int, user: User = Depends(get_user)):
         # Climate scenarios to calculate
         climate_scenarios = ["current", "1_5_degree", "2_degree", "3_degree"]
         
-        doDoTasks = []
-        for scenario in climate_scenarios:
-            doDoTasks.append(nam.s(
-                P_low_1h=project.IDF_Parameters.P_low_1h,
-                P_high_1h=project.IDF_Parameters.P_high_1h,
-                P_low_24h=project.IDF_Parameters.P_low_24h,
-                P_high_24h=project.IDF_Parameters.P_high_24h,
-                rp_low=project.IDF_Parameters.rp_low,
-                rp_high=project.IDF_Parameters.rp_high,
-                x=nam_obj.Annuality.number,
-                curve_number=70.0,  # Default fallback value
-                catchment_area=project.catchment_area,
-                channel_length=project.channel_length,
-                delta_h=project.delta_h,
-                nam_id=nam_obj.id,
-                project_id=project.id,
-                user_id=user.id,
-                water_balance_mode=nam_obj.water_balance_mode,
-                precipitation_factor=nam_obj.precipitation_factor,
-                storm_center_mode=nam_obj.storm_center_mode,
-                routing_method=nam_obj.routing_method,
-                readiness_to_drain=nam_obj.readiness_to_drain,
-                discharge_point=(project.Point.easting, project.Point.northing),
-                discharge_point_crs="EPSG:2056",
-                project_easting=project.Point.easting,
-                project_northing=project.Point.northing,
-                climate_scenario=scenario,
-                debug=True
-            ))
+        # All climate scenarios share one raster load in a single task
+        doDoTasks = [nam_batch.s(
+            P_low_1h=project.IDF_Parameters.P_low_1h,
+            P_high_1h=project.IDF_Parameters.P_high_1h,
+            P_low_24h=project.IDF_Parameters.P_low_24h,
+            P_high_24h=project.IDF_Parameters.P_high_24h,
+            rp_low=project.IDF_Parameters.rp_low,
+            rp_high=project.IDF_Parameters.rp_high,
+            x=nam_obj.Annuality.number,
+            curve_number=70.0,  # Default fallback value
+            catchment_area=project.catchment_area,
+            channel_length=project.channel_length,
+            delta_h=project.delta_h,
+            nam_id=nam_obj.id,
+            project_id=project.id,
+            user_id=user.id,
+            water_balance_mode=nam_obj.water_balance_mode,
+            precipitation_factor=nam_obj.precipitation_factor,
+            storm_center_mode=nam_obj.storm_center_mode,
+            routing_method=nam_obj.routing_method,
+            readiness_to_drain=nam_obj.readiness_to_drain,
+            discharge_point=(project.Point.easting, project.Point.northing),
+            discharge_point_crs="EPSG:2056",
+            project_easting=project.Point.easting,
+            project_northing=project.Point.northing,
+            climate_scenarios=climate_scenarios,
+            debug=True
+        )]
         
-        prerequisites = chain(
-            extract_dem.si(project.id, user.id),
-            get_curve_numbers.si(project.id, user.id, "bek", nam_obj.use_own_soil_data),
-        )
-        task = chain(prerequisites, launch_group.si(doDoTasks)).apply_async()
+        producers = {
+            "dem.tif": extract_dem.si(project.id, user.id),
+            "curvenumbers.tif": get_curve_numbers.si(project.id, user.id, "bek", nam_obj.use_own_soil_data),
+        }
+        task = launch_project_tasks(producers, doDoTasks)
         return JSONResponse({"task_id": task.id})
 
     except Exception as e:
@@ -644,6 +644,38 @@ async def get_celery_info(user: User = Depends(get_user)):
         raise HTTPException(status_code=500, detail=f"Error getting Celery info: {str(e)}")
 
 
+@router.get("/raster-cache")
+async def get_raster_cache_info(user: User = Depends(get_user)):
+    """Get hit/miss/eviction counters of the per-worker raster caches."""
+    try:
+        replies = celery_app.control.broadcast("raster_cache_stats", reply=True, timeout=1.0) or []
+        workers = [
+            {"worker": worker, **stats}
+            for reply in replies
+            for worker, stats in reply.items()
+            if isinstance(stats, dict) and "hits" in stats
+        ]
+        workers.sort(key=lambda x: x["worker"])
+
+        totals = {
+            key: sum(worker.get(key, 0) for worker in workers)
+            for key in ("hits", "misses", "evictions", "invalidations", "entries", "bytes")
+        }
+        lookups = totals["hits"] + totals["misses"]
+        totals["hit_rate"] = totals["hits"] / lookups if lookups else 0.0
+
+        return JSONResponse(
+            {
+                "workers": workers,
+                "worker_count": len(workers),
+                "totals": totals,
+                "timestamp": datetime.now().isoformat(),
+            }
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting raster cache info: {str(e)}")
+
+
 @router.post("/celery/purge")
 async def purge_celery_queue(user: User = Depends(get_user)):
     """Purge pending Celery messages from broker queues."""
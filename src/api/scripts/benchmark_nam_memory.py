@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Peak memory of the NAM storm field: bounding-box grid vs. valid cells.
+
+Compares the former storm generation (int64 meshgrid over the whole bounding
+box, float64 distances/kernel, float64 storms with a boolean cap mask) with
+``_storm_kernel``/``_storm_distribution``, which only touch the valid cells
+and work in place in float32. Peak memory is measured with ``tracemalloc``
+(numpy reports its buffers to it).
+
+Usage (from src/api):
+  python scripts/benchmark_nam_memory.py --size 3000 --valid-fraction 0.4 --scenarios 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from calculations.nam_kernel import _storm_distribution, _storm_kernel
+
+
+def _grid_storm(valid_mask, center, radius_px, P_total_storm, I_event, duration_h, I_cap_factor=1.2):
+    """Storm field as computed before on the full bounding-box grid."""
+    rows, cols = np.meshgrid(np.arange(valid_mask.shape[0]), np.arange(valid_mask.shape[1]), indexing="ij")
+    distances = np.sqrt((rows - center[0]) ** 2 + (cols - center[1]) ** 2)
+    storm_kernel = np.exp(-distances / radius_px)[valid_mask]
+    del rows, cols, distances
+
+    storm_distribution = P_total_storm[:, None] * storm_kernel[None, :]
+    original_mean_precip = storm_distribution.mean(axis=1)
+    I_cap = I_cap_factor * I_event[:, None]
+    high_mask = (storm_distribution / duration_h) > I_cap
+    if np.any(high_mask):
+        storm_distribution[high_mask] = np.broadcast_to(I_cap, storm_distribution.shape)[high_mask] * duration_h
+        mean_after_cap = storm_distribution.mean(axis=1)
+        storm_distribution *= (original_mean_precip / mean_after_cap)[:, None]
+    return storm_distribution
+
+
+def _cell_storm(rows, cols, center, radius_px, P_total_storm, I_event, duration_h):
+    """Storm field on the valid cells (current implementation)."""
+    storm_kernel = _storm_kernel(rows, cols, center[0], center[1], radius_px)
+    return _storm_distribution(P_total_storm, I_event, storm_kernel, duration_h)
+
+
+def _measure(label, fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<12} peak {peak / 2**20:9.1f} MiB   time {elapsed:7.2f} s")
+    return result, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=2000, help="Bounding box side length [cells]")
+    parser.add_argument("--valid-fraction", type=float, default=0.4, help="Share of bounding-box cells in the catchment")
+    parser.add_argument("--scenarios", type=int, default=8, help="Storms evaluated together (scenarios × return periods)")
+    parser.add_argument("--radius-px", type=float, default=400.0, help="Storm radius [cells]")
+    args = parser.parse_args()
+
+    # Elliptic catchment covering about ``valid_fraction`` (at most π/4) of the bounding box
+    yy, xx = np.ogrid[:args.size, :args.size]
+    half = args.size / 2
+    axis = min(2 * args.valid_fraction * args.size / np.pi, half)
+    valid_mask = ((yy - half) / axis) ** 2 + ((xx - half) / half) ** 2 < 1
+    rows, cols = (index.astype(np.uint16 if args.size <= 65535 else np.uint32) for index in np.nonzero(valid_mask))
+    center = (int(half), int(half))
+    P_total_storm = np.linspace(40.0, 80.0, args.scenarios)
+    I_event = P_total_storm * 0.8  # forces intensity capping
+    duration_h = 1.0
+
+    print(f"Bounding box {args.size}×{args.size}, {rows.size} valid cells, {args.scenarios} storms")
+    grid_storm, grid_peak = _measure("bbox grid", _grid_storm, valid_mask, center, args.radius_px, P_total_storm, I_event, duration_h)
+    cell_storm, cell_peak = _measure("valid cells", _cell_storm, rows, cols, center, args.radius_px, P_total_storm, I_event, duration_h)
+
+    rel_diff = np.max(np.abs(cell_storm - grid_storm) / grid_storm)
+    print(f"Peak memory reduced by {(1 - cell_peak / grid_peak) * 100:.1f}% (x{grid_peak / cell_peak:.1f})")
+    print(f"Max relative difference of the storm fields: {rel_diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
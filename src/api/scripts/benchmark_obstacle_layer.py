@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Time and peak memory of the obstacle layer classification.
+
+Classifies a synthetic window (random slopes, forest patches, accumulation)
+with the former chain of ``np.where`` passes and with the lookup table
+classifier of ``calculations.obstacle_layer``, checks that both agree, and
+reports the run time and the peak NumPy allocation (tracemalloc) of each.
+
+Usage (from src/api):
+  python scripts/benchmark_obstacle_layer.py --size 4800
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from calculations.obstacle_layer import obstacle_weights
+
+
+def _obstacle_weights_where(slope_percentage, forests_raster, acc_view, a_crit):
+    """Classification as done before the lookup table."""
+    obstacle_grid = acc_view.copy()
+    obstacle_grid = np.where(np.logical_and(np.logical_and(slope_percentage < 1,slope_percentage>-100), forests_raster==1), 3000,obstacle_grid)
+    obstacle_grid = np.where(np.logical_and(np.logical_and(slope_percentage < 1,slope_percentage>-100), forests_raster==0), 1500,obstacle_grid)
+    obstacle_grid = np.where(np.logical_and(np.logical_and(slope_percentage >= 1,slope_percentage<5), forests_raster==1), 1500, obstacle_grid)
+    obstacle_grid = np.where(np.logical_and(np.logical_and(slope_percentage >= 1,slope_percentage<5), forests_raster==0), 750, obstacle_grid)
+    obstacle_grid = np.where(np.logical_and(np.logical_and(slope_percentage >= 5,slope_percentage<10), forests_raster==1), 750, obstacle_grid)
+    obstacle_grid = np.where(np.logical_and(np.logical_and(slope_percentage >= 5,slope_percentage<10), forests_raster==0), 375, obstacle_grid)
+    obstacle_grid = np.where(np.logical_and(np.logical_and(slope_percentage >= 10,slope_percentage<20), forests_raster==1), 500, obstacle_grid)
+    obstacle_grid = np.where(np.logical_and(np.logical_and(slope_percentage >= 10,slope_percentage<20), forests_raster==0), 250, obstacle_grid)
+    obstacle_grid = np.where(np.logical_and(np.logical_and(slope_percentage >= 20,slope_percentage<40), forests_raster==1), 375, obstacle_grid)
+    obstacle_grid = np.where(np.logical_and(np.logical_and(slope_percentage >= 20,slope_percentage<40), forests_raster==0), 188, obstacle_grid)
+    obstacle_grid = np.where(np.logical_and(slope_percentage >= 40, forests_raster==1), 300, obstacle_grid)
+    obstacle_grid = np.where(np.logical_and(slope_percentage >= 40, forests_raster==0), 150, obstacle_grid)
+    obstacle_grid = np.where(acc_view>a_crit, 100, obstacle_grid)
+    return obstacle_grid
+
+
+def _measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=4800, help="Window edge length [cells]")
+    parser.add_argument("--a-crit", type=float, default=3000, help="Channel accumulation threshold [cells]")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    shape = (args.size, args.size)
+    slope_percentage = rng.gamma(2.0, 8.0, shape)
+    slope_percentage[rng.random(shape) < 0.01] = np.nan
+    forests_raster = (rng.random(shape) < 0.3).astype(np.int64)
+    acc_view = np.floor(rng.pareto(1.0, shape) + 1)
+
+    old, old_time, old_peak = _measure(_obstacle_weights_where, slope_percentage, forests_raster, acc_view, args.a_crit)
+    new, new_time, new_peak = _measure(obstacle_weights, slope_percentage, forests_raster, acc_view, args.a_crit)
+    if not np.array_equal(old, new):
+        raise SystemExit("Lookup table classification differs from the np.where chain")
+
+    print(f"{args.size}x{args.size} window ({slope_percentage.size / 1e6:.1f}M cells)")
+    print(f"{'method':<14}{'time [s]':>10}{'peak [MB]':>12}")
+    print(f"{'np.where':<14}{old_time:>10.3f}{old_peak / 2**20:>12.1f}")
+    print(f"{'lookup table':<14}{new_time:>10.3f}{new_peak / 2**20:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
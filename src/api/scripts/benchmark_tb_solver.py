@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Convergence time of the TB solvers of Mod. Fliesszeit and Kölla.
+
+Solves TB/60 · i(TB + TFl) = Vox with the stepping solver and the bracketed
+solver for a grid of flow times, wetting volumes, return periods and start
+values, and reports the worst-case time, the number of intensity evaluations
+and the residual of both. Start values above the root make the stepping
+solver run ``max_iter`` steps before it retries from TB=1 min.
+
+Usage (from src/api):
+  python scripts/benchmark_tb_solver.py --max-iter 100000
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import time
+
+from calculations.discharge import _solve_tb, construct_idf_curve
+
+
+class _CountingIntensity:
+    def __init__(self, intensity_fn):
+        self.intensity_fn = intensity_fn
+        self.calls = 0
+
+    def __call__(self, rp_years, duration_minutes):
+        self.calls += 1
+        return self.intensity_fn(rp_years=rp_years, duration_minutes=duration_minutes)
+
+
+def _run(solver, intensity_fn, x, TFl, Vox, TB_start, max_iter):
+    intensity_fn.calls = 0
+    start = time.perf_counter()
+    try:
+        TB = _solve_tb(intensity_fn, x, TFl, Vox, TB_start=TB_start, max_iter=max_iter, solver=solver)
+    except RuntimeError:
+        TB = None
+    elapsed = time.perf_counter() - start
+    residual = None if TB is None else TB / 60 * intensity_fn.intensity_fn(rp_years=x, duration_minutes=TB + TFl) - Vox
+    return elapsed, intensity_fn.calls, residual
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--max-iter", type=int, default=100000, help="max_iter of the stepping solver")
+    args = parser.parse_args()
+
+    intensity_fn = _CountingIntensity(construct_idf_curve(30.0, 45.0, 80.0, 130.0, 2.33, 100.0, 0.0))
+    cases = list(itertools.product((2.3, 20, 100), (2.0, 15.0, 60.0), (20, 30, 45), (1, 10, 500)))
+
+    for solver in ("step", "bracket"):
+        worst = (0.0, None)
+        total_time = 0.0
+        max_calls = 0
+        max_residual = 0.0
+        failures = 0
+        for x, TFl, Vox, TB_start in cases:
+            elapsed, calls, residual = _run(solver, intensity_fn, x, TFl, Vox, TB_start, args.max_iter)
+            total_time += elapsed
+            max_calls = max(max_calls, calls)
+            if residual is None:
+                failures += 1
+            else:
+                max_residual = max(max_residual, abs(residual))
+            if elapsed > worst[0]:
+                worst = (elapsed, (x, TFl, Vox, TB_start))
+        print(
+            f"{solver:<8} {len(cases)} cases  total {total_time:8.3f} s  "
+            f"worst {worst[0] * 1e3:9.2f} ms (x, TFl, Vox, TB_start = {worst[1]})  "
+            f"max evaluations {max_calls}  max |residual| {max_residual:.3f} mm  failures {failures}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Build the national flow accumulation COG from data/d8.tif.
+
+Accumulates the D8 flow directions of the whole grid tile by tile (two passes,
+one tile in memory at a time, see ``calculations.flow_accumulation``) into a
+tiled GeoTIFF aligned to the D8 raster, then converts it to a deflate
+compressed COG. prepare_discharge_hydroparameters reads windows of it and
+falls back to accumulating its window while the COG is missing or older than
+data/d8.tif. Rerun after every update of data/d8.tif.
+
+Usage (from src/api):
+  python scripts/build_flow_accumulation.py --tile-size 2048
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+from rio_cogeo.cogeo import cog_translate
+from rio_cogeo.profiles import cog_profiles
+
+from calculations.flow_accumulation import (
+    FLOW_ACCUMULATION_FILE,
+    SOURCE_MTIME_TAG,
+    SOURCE_SIZE_TAG,
+    build_flow_accumulation,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--d8", default="data/d8.tif", help="D8 flow direction raster")
+    parser.add_argument("--output", default=FLOW_ACCUMULATION_FILE, help="Flow accumulation COG")
+    parser.add_argument("--tile-size", type=int, default=2048, help="Tile edge length [cells]")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    stat = os.stat(args.d8)
+    intermediate = f"{args.output}.tiles.tif"
+
+    with rasterio.open(args.d8) as src:
+        profile = src.profile.copy()
+        profile.update({
+            "driver": "GTiff",
+            "dtype": "float32",
+            "nodata": 0,
+            "count": 1,
+            "tiled": True,
+            "blockxsize": 512,
+            "blockysize": 512,
+            "compress": "deflate",
+            "BIGTIFF": "IF_SAFER",
+        })
+
+        with rasterio.open(intermediate, "w", **profile) as dst:
+            def read_tile(row0, col0, height, width):
+                return src.read(1, window=Window(col0, row0, width, height))
+
+            def write_tile(row0, col0, acc):
+                dst.write(acc.astype(np.float32), 1, window=Window(col0, row0, acc.shape[1], acc.shape[0]))
+
+            build_flow_accumulation(
+                read_tile,
+                write_tile,
+                src.shape,
+                tile_size=args.tile_size,
+                nodata=src.nodata,
+                progress=lambda message: print(f"{time.perf_counter() - start:8.1f}s  {message}"),
+            )
+
+    output_profile = cog_profiles.get("deflate")
+    output_profile.update({"BIGTIFF": "IF_SAFER", "PREDICTOR": 3})
+    # Tag the D8 raster the accumulation was built from
+    cog_translate(
+        intermediate,
+        args.output,
+        output_profile,
+        in_memory=False,
+        quiet=True,
+        additional_cog_metadata={SOURCE_SIZE_TAG: str(stat.st_size), SOURCE_MTIME_TAG: str(stat.st_mtime_ns)},
+    )
+    os.remove(intermediate)
+
+    print(f"Wrote {args.output} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
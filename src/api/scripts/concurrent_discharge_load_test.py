@@ -25,13 +25,12 @@ Notes:
   - Base URL must be the API root (no trailing slash), e.g. http://localhost:8000
   - With multiple projects, ``prepare`` temp paths are per project id, reducing
     same-file contention compared to a single shared project.
-  - ``calculate_project`` returns a chain id; when the chain succeeds, the API
-    may still be running a Celery group — this script follows ``group_id`` and
+  - ``calculate_project`` returns the id of a saved Celery group over all its
+    tasks (prerequisites included); this script polls ``/task/group/{id}`` and
     waits until every child task is SUCCESS.
   - Fortschritt in Prozent/Text kommt aus Celery ``update_state(PROGRESS, meta=…)``,
-    sofern die Task das setzt (z. B. ``prepare_discharge_hydroparameters``). Die
-    Chain vor ``calculate_project`` liefert oft nur PENDING/STARTED bis zum Ende
-    der Kette — danach zeigt das Skript die Gruppen-Auslastung ``fertig/total``.
+    sofern die Task das setzt (z. B. ``prepare_discharge_hydroparameters``). Für
+    ``calculate_project`` zeigt das Skript die Gruppen-Auslastung ``fertig/total``.
 """
 
 from __future__ import annotations
@@ -861,6 +860,22 @@ def run_load_test(
     def wait_one(item: tuple[int, str, str, str]) -> tuple[int, bool, str, str, str]:
         idx, tid, pid, title = item
         log_prefix = f"[#{idx}] {_project_label(pid, title)}"
+        if endpoint == "calculate":
+            ok, msg = wait_group_done(
+                session,
+                base_url,
+                headers,
+                tid,
+                poll_interval,
+                deadline_global,
+                stall_timeout,
+                log_prefix,
+                verbose and (not board.enabled),
+                print_lock,
+                board if board.enabled else None,
+                idx,
+            )
+            return idx, ok, msg, pid, title
         ok, msg = wait_task_tree_done(
             session,
             base_url,
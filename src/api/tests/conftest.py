@@ -1,4 +1,7 @@
+import numpy as np
 import pytest
+import rasterio
+from rasterio.transform import from_origin
 from starlette.testclient import TestClient
 
 from api.main import app
@@ -8,3 +11,33 @@ from api.main import app
 def test_app():
     client = TestClient(app)
     yield client  # testing happens here
+
+
+def _write_project(data_dir, shape=(60, 80)):
+    """Write a small synthetic project with curve numbers, isozones, DEM and time values."""
+    rng = np.random.default_rng(0)
+    project_dir = data_dir / "1" / "p"
+    project_dir.mkdir(parents=True)
+    transform = from_origin(2600000, 1200000 + shape[0] * 5, 5, 5)
+    yy, xx = np.mgrid[:shape[0], :shape[1]]
+    inside = ((yy - 30) / 28.0) ** 2 + ((xx - 40) / 38.0) ** 2 < 1
+    outlet_distance = np.hypot(yy - 55, xx - 40)
+    rasters = {
+        "curvenumbers.tif": (np.where(inside, rng.choice([45, 61, 74, 86, 100], size=shape), 0).astype(np.float32), 0),
+        "isozones_cog.tif": (np.where(inside, np.floor(outlet_distance / 8), np.nan), np.nan),
+        "dem.tif": (np.where(inside, 500 + outlet_distance, np.nan).astype(np.float32), np.nan),
+        "time_values.tif": (np.where(inside, outlet_distance / 4, np.nan).astype(np.float32), np.nan),
+    }
+    for name, (data, nodata) in rasters.items():
+        with rasterio.open(
+            project_dir / name, "w", driver="GTiff", height=shape[0], width=shape[1], count=1,
+            dtype=data.dtype.name, crs="EPSG:2056", transform=transform, nodata=nodata
+        ) as dst:
+            dst.write(data, 1)
+
+
+@pytest.fixture
+def nam_project(tmp_path, monkeypatch):
+    _write_project(tmp_path / "data")
+    monkeypatch.setenv("DATA_DIR", str(tmp_path / "data"))
+    monkeypatch.chdir(tmp_path)
@@ -0,0 +1,54 @@
+import os
+
+from calculations import artifact_manifest
+from calculations.artifact_manifest import inputs_hash, is_current, record_artifact
+
+
+def _write(project_dir, filename, content):
+    (project_dir / filename).write_bytes(content)
+
+
+def test_recorded_file_is_current_until_inputs_change(tmp_path):
+    _write(tmp_path, "dem.tif", b"dem")
+    inputs = inputs_hash(catchment_geojson="{}", source=[1, 2])
+
+    assert not is_current(tmp_path, "dem.tif", inputs)
+    record_artifact(tmp_path, "dem.tif", inputs)
+
+    assert is_current(tmp_path, "dem.tif", inputs)
+    assert not is_current(tmp_path, "dem.tif", inputs_hash(catchment_geojson="{}", source=[1, 3]))
+
+
+def test_rewritten_file_is_not_current(tmp_path):
+    _write(tmp_path, "curvenumbers.tif", b"cn")
+    inputs = inputs_hash(own_soil=True)
+    record_artifact(tmp_path, "curvenumbers.tif", inputs)
+
+    _write(tmp_path, "curvenumbers.tif", b"other curve numbers")
+    os.utime(tmp_path / "curvenumbers.tif", ns=(1, 1))
+
+    assert not is_current(tmp_path, "curvenumbers.tif", inputs)
+
+
+def test_new_catchment_invalidates_derived_files(tmp_path):
+    for filename in ("catchment.geojson", "dem.tif", "curvenumbers.tif", "isozones_cog.tif"):
+        _write(tmp_path, filename, filename.encode())
+    record_artifact(tmp_path, "catchment.geojson", inputs_hash(easting=1))
+    record_artifact(tmp_path, "isozones_cog.tif", inputs_hash(easting=1))
+    record_artifact(tmp_path, "dem.tif", "dem-inputs")
+    record_artifact(tmp_path, "curvenumbers.tif", "cn-inputs")
+
+    record_artifact(tmp_path, "catchment.geojson", inputs_hash(easting=2))
+
+    assert not is_current(tmp_path, "dem.tif", "dem-inputs")
+    assert not is_current(tmp_path, "curvenumbers.tif", "cn-inputs")
+    assert is_current(tmp_path, "isozones_cog.tif", inputs_hash(easting=1))
+
+
+def test_code_version_change_invalidates(tmp_path, monkeypatch):
+    _write(tmp_path, "dem.tif", b"dem")
+    record_artifact(tmp_path, "dem.tif", "inputs")
+
+    monkeypatch.setitem(artifact_manifest.ARTIFACT_CODE_VERSIONS, "dem.tif", 2)
+
+    assert not is_current(tmp_path, "dem.tif", "inputs")
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from calculations.discharge import _clark_wsl_hydrograph
+from calculations.isozone_histogram import isozone_cell_counts
+
+
+ZONE_PARAMETERS = {
+    "Atyp 1": {'V0_20': 20, 'WSV': 10, 'psi': 0.45, 'alpha': 82},
+    "Atyp 2": {'V0_20': 25, 'WSV': 20, 'psi': 0.35, 'alpha': 76},
+    "Atyp 3": {'V0_20': 35, 'WSV': 30, 'psi': 0.15, 'alpha': 63.5},
+    "Atyp 4": {'V0_20': 45, 'WSV': 45, 'psi': 0.1, 'alpha': 54},
+    "Siedl.typ 1": {'V0_20': 30, 'WSV': 27, 'psi': 0.3, 'alpha': 80},
+}
+FRACTIONS = [
+    {"typ": "Atyp 1", "pct": 20},
+    {"typ": "Atyp 2", "pct": 35},
+    {"typ": "Atyp 3", "pct": 0},
+    {"typ": "Atyp 4", "pct": 25},
+    {"typ": "Siedl.typ 1", "pct": 15},
+    {"typ": "unknown", "pct": 5},
+]
+
+
+def _loop_clark_wsl(isozone_raster, fractions, discharge_types_parameters, Ptotal, dt, pixel_area_m2):
+    """Reference implementation: the former per-zone loops of clark_wsl_modified."""
+    max_zone = int(np.nanmax(isozone_raster))
+    Tc = dt * (max_zone + 1)
+    W_iso = np.zeros(max_zone + 1)
+    WSV_weighted_sum = 0
+    total_area = 0
+    for z in range(max_zone + 1):
+        zone_mask = isozone_raster == z
+        if not np.any(zone_mask):
+            continue
+        zone_area = np.sum(zone_mask) * pixel_area_m2
+        for fraction in fractions:
+            pct = fraction["pct"]
+            if pct == 0:
+                continue
+            area = pct / 100 * zone_area
+            total_area += area
+            if fraction["typ"] not in discharge_types_parameters:
+                continue
+            WSV60min = discharge_types_parameters[fraction["typ"]]["WSV"]
+            WSVcorr = WSV60min * (0.5 + Tc / 120)
+            Peff = ((Ptotal - 0.2 * WSVcorr) ** 2) / (Ptotal + 0.8 * WSVcorr)
+            Pinfilt_total = Ptotal - Peff
+            if WSV60min >= 30:
+                f0_fc, r = 1, 0.0000001
+            elif WSV60min >= 25:
+                f0_fc, r = 2, 0.02
+            elif WSV60min >= 20:
+                f0_fc, r = 5, 0.04
+            else:
+                f0_fc, r = 8, 0.06
+            t_sec_z = Tc * 60 / (max_zone + 1)
+            Pinfilt_available = Pinfilt_total / (max_zone + 1)
+            fc = Pinfilt_available / (t_sec_z + ((f0_fc - 1) / r) * (1 - np.exp(-r * t_sec_z)))
+            f0 = f0_fc * fc
+            Pinfilt_z = min(fc * t_sec_z + ((f0 - fc) / r) * (1 - np.exp(-r * t_sec_z)), Pinfilt_available)
+            P_step = max(Ptotal / (max_zone + 1) - Pinfilt_z, 0)
+            WSV_weighted_sum += WSV60min * area
+            W_iso[z] += P_step * area / 1000 / 60 / dt
+    W = np.zeros(max_zone + 1)
+    for t in range(len(W)):
+        for z in range(len(W_iso)):
+            if t - z >= 0:
+                W[t] += W_iso[t - z]
+    K_sec = (2.25 * WSV_weighted_sum / total_area - 18.5) * 60
+    c1 = dt * 60 / (2 * K_sec + dt * 60)
+    c3 = (2 * K_sec - dt * 60) / (2 * K_sec + dt * 60)
+    Q = np.zeros_like(W)
+    for t in range(1, len(Q)):
+        Q[t] = c1 * W[t] + c1 * W[t - 1] + c3 * Q[t - 1]
+    return W, Q
+
+
+def _isozones(seed=0, shape=(120, 90)):
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:shape[0], :shape[1]]
+    zones = np.floor(np.hypot(yy - 110, xx - 45) / 6).astype(np.float64)
+    zones[rng.random(shape) < 0.2] = np.nan
+    zones[zones == 7] = np.nan  # an empty zone
+    return zones
+
+
+def test_isozone_cell_counts_match_per_zone_masks():
+    isozones = _isozones()
+    counts = isozone_cell_counts(isozones)
+
+    assert len(counts) == int(np.nanmax(isozones)) + 1
+    for z, count in enumerate(counts):
+        assert count == np.sum(isozones == z)
+
+
+@pytest.mark.parametrize("Ptotal, dt", [(45.0, 10), (120.0, 5), (8.0, 10)])
+def test_clark_wsl_hydrograph_matches_zone_loops(Ptotal, dt):
+    isozones = _isozones()
+    Tc = dt * (int(np.nanmax(isozones)) + 1)
+
+    W, Q = _clark_wsl_hydrograph(isozone_cell_counts(isozones), FRACTIONS, ZONE_PARAMETERS, Ptotal, Tc, dt, 25)
+    W_ref, Q_ref = _loop_clark_wsl(isozones, FRACTIONS, ZONE_PARAMETERS, Ptotal, dt, 25)
+
+    np.testing.assert_allclose(W, W_ref, rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(Q, Q_ref, rtol=1e-10, atol=1e-12)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+import calculations.discharge as calc_discharge
+from calculations.discharge import _catchment_touches_window_edge, _initial_window_half_size, _window_bounds
+
+DATASET = (2480000.0, 1070000.0, 2840000.0, 1300000.0)
+
+
+def _catchment(rows, cols, shape=(10, 10)):
+    catch = np.zeros(shape, dtype=bool)
+    catch[rows, cols] = True
+    return catch
+
+
+def test_window_is_clipped_to_dataset():
+    assert _window_bounds(2481000.0, 1200000.0, 2000.0, DATASET) == (2480000.0, 1198000.0, 2483000.0, 1202000.0)
+
+    with pytest.raises(ValueError):
+        _window_bounds(2000000.0, 1200000.0, 2000.0, DATASET)
+
+
+def test_interior_catchment_does_not_grow():
+    window = (2600000.0, 1200000.0, 2600050.0, 1200050.0)
+
+    assert not _catchment_touches_window_edge(_catchment(slice(2, 8), slice(3, 6)), window, window, DATASET, 5)
+
+
+def test_catchment_at_window_edge_grows():
+    window = (2600000.0, 1200000.0, 2600050.0, 1200050.0)
+
+    assert _catchment_touches_window_edge(_catchment(slice(0, 4), 5), window, window, DATASET, 5)
+
+
+def test_edges_that_cannot_move_are_ignored():
+    # West edge at the dataset extent, north edge clipped to valid data
+    window = (DATASET[0], 1200000.0, DATASET[0] + 50, 1200050.0)
+    grid_bbox = (DATASET[0], 1200000.0, DATASET[0] + 50, 1200030.0)
+
+    assert not _catchment_touches_window_edge(_catchment(slice(1, 5), 0, shape=(6, 10)), grid_bbox, window, DATASET, 5)
+    assert not _catchment_touches_window_edge(_catchment(0, slice(2, 5), shape=(6, 10)), grid_bbox, window, DATASET, 5)
+
+
+def test_window_without_national_accumulation_starts_at_full_size(monkeypatch):
+    monkeypatch.setattr(calc_discharge, "_predicted_window_half_size", lambda *args: 3000.0)
+
+    assert _initial_window_half_size(2600000.0, 1200000.0, 3000, 5, True, 2000.0, 12000.0) == 3000.0
+    assert _initial_window_half_size(2600000.0, 1200000.0, 3000, 5, True, 2000.0, 12000.0, predict=False) == 2000.0
+    # A window accumulated on its own could snap the outlet to another channel
+    assert _initial_window_half_size(2600000.0, 1200000.0, 3000, 5, False, 2000.0, 12000.0) == 12000.0
@@ -0,0 +1,161 @@
+import json
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import calculations.discharge as calc_discharge
+from calculations.isozone_histogram import write_isozone_histogram
+from routers import discharge
+
+
+IDF = SimpleNamespace(P_low_1h=30.0, P_high_1h=45.0, P_low_24h=80.0, P_high_24h=130.0, rp_low=2.33, rp_high=100.0)
+
+
+def _project(**objects):
+    defaults = dict(
+        id="p",
+        IDF_Parameters=IDF,
+        Point=SimpleNamespace(easting=2600000.0, northing=1200000.0),
+        channel_length=1500.0,
+        delta_h=400.0,
+        cummulative_channel_length=3200.0,
+        catchment_area=2.5,
+        Mod_Fliesszeit=[],
+        Koella=[],
+        ClarkWSL=[],
+    )
+    return SimpleNamespace(**{**defaults, **objects})
+
+
+class FakeCelery:
+    def __init__(self):
+        self.signatures = []
+
+    def s(self, *args, **kwargs):
+        self.signatures.append((args, kwargs))
+        return (args, kwargs)
+
+
+class FakeGroup:
+    def __init__(self, signatures):
+        self.signatures = signatures
+        self.id = "group-id"
+
+    def apply_async(self):
+        return self
+
+    def save(self):
+        pass
+
+
+class FakeResultWriter:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def upsert(self, model, object_id, relation, result_data):
+        pass
+
+
+def _patch(monkeypatch, project):
+    stored = []
+    monkeypatch.setattr(discharge, "prisma", SimpleNamespace(project=SimpleNamespace(find_unique_or_raise=lambda **kwargs: project)))
+    monkeypatch.setattr(calc_discharge, "_store_light_results", lambda model, relations, results: stored.append((model, results)))
+    monkeypatch.setattr(discharge, "group", FakeGroup)
+    monkeypatch.setattr(calc_discharge.result_memo, "enabled", False)
+    return stored
+
+
+def test_mod_fliesszeit_sync_returns_and_stores_results(monkeypatch):
+    obj = SimpleNamespace(id=7, Annuality=SimpleNamespace(number=30), Vo20=30, psi=0.3)
+    stored = _patch(monkeypatch, _project(Mod_Fliesszeit=[obj]))
+    fake_task = FakeCelery()
+    monkeypatch.setattr(discharge, "modifizierte_fliesszeit", fake_task)
+
+    response = discharge.get_modifizierte_fliesszeit("p", 7, sync=True, user=SimpleNamespace(id=1))
+    content = json.loads(response.body)
+
+    assert content["sync"] is True
+    assert content["status"] == "SUCCESS"
+    assert set(content["results"]) == {"current", "1_5_degree", "2_degree", "3_degree"}
+    assert content["results"]["2_degree"]["HQ"] > content["results"]["current"]["HQ"]
+    assert stored[0][0] == "mod_fliesszeit" and 7 in stored[0][1]
+    assert fake_task.signatures == []
+
+
+def _queued_results(task, fake_task):
+    # Run the queued scalar tasks the way a worker would
+    return {
+        kwargs["climate_scenario"]: task(*args, **kwargs)
+        for args, kwargs in fake_task.signatures
+    }
+
+
+def test_sync_and_queued_light_methods_agree(monkeypatch):
+    monkeypatch.setattr(calc_discharge, "ResultWriter", FakeResultWriter)
+    for x in (2.3, 30, 100):
+        mod_obj = SimpleNamespace(id=7, Annuality=SimpleNamespace(number=x), Vo20=30, psi=0.3)
+        koella_obj = SimpleNamespace(id=3, Annuality=SimpleNamespace(number=x), Vo20=30, glacier_area=0.2)
+        _patch(monkeypatch, _project(Mod_Fliesszeit=[mod_obj], Koella=[koella_obj]))
+        user = SimpleNamespace(id=1)
+
+        for endpoint, object_id, router_task, task in (
+            (discharge.get_modifizierte_fliesszeit, 7, "modifizierte_fliesszeit", calc_discharge.modifizierte_fliesszeit),
+            (discharge.get_koella, 3, "koella", calc_discharge.koella),
+        ):
+            fake_task = FakeCelery()
+            monkeypatch.setattr(discharge, router_task, fake_task)
+
+            sync_results = json.loads(endpoint("p", object_id, sync=True, user=user).body)["results"]
+            assert json.loads(endpoint("p", object_id, sync=False, user=user).body) == {"task_id": "group-id"}
+            queued_results = _queued_results(task, fake_task)
+
+            assert set(queued_results) == set(sync_results)
+            for scenario, result in queued_results.items():
+                for name in ("HQ", "TB", "Tc"):
+                    assert sync_results[scenario][name] == pytest.approx(result[name], rel=1e-9), (router_task, x, scenario, name)
+
+
+def test_koella_above_cost_threshold_falls_back_to_celery(monkeypatch):
+    obj = SimpleNamespace(id=3, Annuality=SimpleNamespace(number=100), Vo20=30, glacier_area=0.0)
+    stored = _patch(monkeypatch, _project(Koella=[obj]))
+    fake_task = FakeCelery()
+    monkeypatch.setattr(discharge, "koella", fake_task)
+    monkeypatch.setattr(discharge, "DISCHARGE_SYNC_MAX_COST", 1)
+
+    response = discharge.get_koella("p", 3, sync=True, user=SimpleNamespace(id=1))
+
+    assert json.loads(response.body) == {"task_id": "group-id"}
+    assert len(fake_task.signatures) == 4
+    assert stored == []
+
+
+def test_clark_wsl_sync_needs_stored_zone_histogram(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    obj = SimpleNamespace(
+        id=5, Annuality=SimpleNamespace(number=100), dt=10, pixel_area_m2=25,
+        Fractions=[SimpleNamespace(ZoneParameterTyp="Atyp 2", pct=100)],
+    )
+    stored = _patch(monkeypatch, _project(ClarkWSL=[obj]))
+    fake_task = FakeCelery()
+    monkeypatch.setattr(discharge, "clark_wsl_modified", fake_task)
+
+    # Without the sidecar the calculation is queued
+    response = discharge.get_clark_wsl("p", 5, sync=True, user=SimpleNamespace(id=1))
+    assert json.loads(response.body) == {"task_id": "group-id"}
+
+    project_dir = tmp_path / "data" / "1" / "p"
+    project_dir.mkdir(parents=True)
+    (project_dir / "isozones_cog.tif").write_bytes(b"isozones")
+    write_isozone_histogram(project_dir, np.array([0, 40, 90, 60, 20]))
+
+    response = discharge.get_clark_wsl("p", 5, sync=True, user=SimpleNamespace(id=1))
+    content = json.loads(response.body)
+
+    assert content["status"] == "SUCCESS"
+    assert content["results"]["current"]["Tc"] == 50
+    assert stored[0][0] == "clarkwsl" and 5 in stored[0][1]
+    assert len(fake_task.signatures) == 4
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from calculations.flow_accumulation import _D8_OFFSETS, build_flow_accumulation, flow_tree_depth
+
+NODATA = 255
+
+
+def _d8(shape, seed=0):
+    """Steepest descent D8 codes of a random surface with some nodata cells."""
+    rng = np.random.default_rng(seed)
+    dem = rng.random(shape)
+    padded = np.pad(dem, 1, constant_values=np.inf)
+    drops = np.stack([
+        dem - padded[1 + drow:1 + drow + shape[0], 1 + dcol:1 + dcol + shape[1]]
+        for drow, dcol in _D8_OFFSETS
+    ])
+    fdir = np.where(drops.max(axis=0) > 0, drops.argmax(axis=0) + 1, 0).astype(np.uint8)
+    fdir[rng.random(shape) < 0.05] = NODATA
+    return fdir
+
+
+def _walk_accumulation(fdir):
+    acc = np.zeros(fdir.shape)
+    for row, col in np.ndindex(fdir.shape):
+        while 0 <= row < fdir.shape[0] and 0 <= col < fdir.shape[1] and fdir[row, col] != NODATA:
+            acc[row, col] += 1
+            if not 1 <= fdir[row, col] <= 8:
+                break
+            drow, dcol = _D8_OFFSETS[fdir[row, col] - 1]
+            row, col = row + drow, col + dcol
+    return acc
+
+
+def _tiled_accumulation(fdir, tile_size):
+    acc = np.full(fdir.shape, -1.0)
+
+    def write_tile(row0, col0, tile):
+        acc[row0:row0 + tile.shape[0], col0:col0 + tile.shape[1]] = tile
+
+    build_flow_accumulation(
+        lambda row0, col0, height, width: fdir[row0:row0 + height, col0:col0 + width],
+        write_tile,
+        fdir.shape,
+        tile_size=tile_size,
+        nodata=NODATA,
+    )
+    return acc
+
+
+@pytest.mark.parametrize("tile_size", [100, 16, 7, 1])
+def test_tiled_accumulation_matches_whole_grid(tile_size):
+    fdir = _d8((37, 53))
+
+    np.testing.assert_array_equal(_tiled_accumulation(fdir, tile_size), _walk_accumulation(fdir))
+
+
+def test_flow_tree_depth_rejects_cycles():
+    with pytest.raises(ValueError):
+        flow_tree_depth(np.array([1, 0, 2]))
@@ -0,0 +1,40 @@
+import numpy as np
+
+from calculations.flow_distance import distances_to_outlet
+
+
+def test_weighted_distance_and_longest_path():
+    # 1 = N, 3 = E, 5 = S; everything drains to the outlet at (2, 2)
+    fdir = np.array([
+        [5, 5, 5],
+        [5, 5, 5],
+        [3, 3, 0],
+    ])
+    weights = np.arange(1.0, 10.0).reshape(3, 3)
+
+    dist, max_steps = distances_to_outlet(fdir, weights, (2, 2))
+
+    np.testing.assert_array_equal(dist, [
+        [1 + 4 + 7 + 8, 2 + 5 + 8, 3 + 6],
+        [4 + 7 + 8, 5 + 8, 6],
+        [7 + 8, 8, 0],
+    ])
+    assert max_steps == 4
+
+
+def test_cells_draining_elsewhere_are_inf():
+    fdir = np.array([[3, 0, 7, 0]])
+
+    dist, max_steps = distances_to_outlet(fdir, np.ones(fdir.shape), (0, 1))
+
+    np.testing.assert_array_equal(dist, [[1, 0, 1, np.inf]])
+    assert max_steps == 1
+
+
+def test_outlet_draining_into_its_upstream_cell():
+    fdir = np.array([[3, 7]])
+
+    dist, max_steps = distances_to_outlet(fdir, np.full(fdir.shape, 2.0), (0, 0))
+
+    np.testing.assert_array_equal(dist, [[0, 2]])
+    assert max_steps == 1
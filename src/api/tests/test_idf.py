@@ -0,0 +1,69 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from calculations.discharge import construct_idf_curve
+from calculations.idf import IDFCurve
+
+
+IDF = (30.0, 45.0, 80.0, 130.0, 2.33, 100.0)
+
+
+def _polyfit_idf(P_low_1h, P_high_1h, P_low_24h, P_high_24h, rp_low, rp_high, cc_factor):
+    """Reference implementation: the former scalar closure with per-call polyfits."""
+    log_rp = np.log10([rp_low, rp_high])
+    coeffs_1h = np.polyfit(log_rp, [P_low_1h * (1 + cc_factor), P_high_1h * (1 + cc_factor)], 1)
+    coeffs_24h = np.polyfit(log_rp, [P_low_24h * (1 + cc_factor), P_high_24h * (1 + cc_factor)], 1)
+
+    def idf_intensity(rp_years, duration_minutes):
+        P1 = coeffs_1h[0] * np.log10(rp_years) + coeffs_1h[1]
+        P24 = coeffs_24h[0] * np.log10(rp_years) + coeffs_24h[1]
+        slope, intercept = np.polyfit(np.log10([1, 24]), np.log10([P1, P24 / 24.0]), 1)
+        return 10 ** (slope * np.log10(duration_minutes / 60.0) + intercept)
+
+    return idf_intensity
+
+
+@pytest.mark.parametrize("cc_factor", [0.0, 0.12])
+def test_idf_curve_matches_polyfit_closure(cc_factor):
+    curve = construct_idf_curve(*IDF, cc_factor)
+    reference = _polyfit_idf(*IDF, cc_factor)
+
+    for x in (2.3, 20, 30, 100, 300):
+        for duration in (5.0, 37.5, 60.0, 600.0, 1440.0, 4000.0):
+            assert curve(rp_years=x, duration_minutes=duration) == pytest.approx(reference(x, duration), rel=1e-10)
+
+
+def test_idf_curve_broadcasts_return_periods_and_durations():
+    curve = IDFCurve(*IDF)
+    rp = np.array([2.3, 20, 100])[:, None]
+    durations = np.linspace(10, 1440, 7)[None, :]
+
+    intensity = curve(rp_years=rp, duration_minutes=durations)
+
+    assert intensity.shape == (3, 7)
+    for i in range(3):
+        for j in range(7):
+            assert intensity[i, j] == pytest.approx(curve(float(rp[i, 0]), float(durations[0, j])))
+    np.testing.assert_allclose(curve.depth(rp, durations), intensity * durations / 60.0)
+    assert np.ndim(curve(20, 60.0)) == 0
+
+
+def test_idf_curve_derivatives_match_finite_differences():
+    curve = IDFCurve(*IDF)
+    durations = np.array([10.0, 90.0, 900.0])
+    h = 1e-4
+
+    for x in (2.3, 100):
+        fd_intensity = (curve(x, durations + h) - curve(x, durations - h)) / (2 * h)
+        fd_depth = (curve.depth(x, durations + h) - curve.depth(x, durations - h)) / (2 * h)
+        np.testing.assert_allclose(curve.intensity_derivative(x, durations), fd_intensity, rtol=1e-6)
+        np.testing.assert_allclose(curve.depth_derivative(x, durations), fd_depth, rtol=1e-6)
+
+
+def test_idf_curve_serialises():
+    curve = IDFCurve(*IDF, 0.05)
+
+    for restored in (pickle.loads(pickle.dumps(curve)), IDFCurve.from_dict(curve.to_dict())):
+        assert restored(100, 45.0) == curve(100, 45.0)
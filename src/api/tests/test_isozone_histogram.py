@@ -0,0 +1,43 @@
+import os
+
+import numpy as np
+
+from calculations.isozone_histogram import (
+    read_zone_cell_counts,
+    time_value_histogram,
+    write_isozone_histogram,
+)
+
+
+def _touch_later(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_zone_cell_counts_round_trip_while_isozones_unchanged(tmp_path):
+    (tmp_path / "isozones_cog.tif").write_bytes(b"isozones")
+    write_isozone_histogram(tmp_path, np.array([0, 12, 30, 7]), time_value_histogram([0.5, 1.2, 1.9, np.nan, 3.0]))
+
+    np.testing.assert_array_equal(read_zone_cell_counts(tmp_path), [0, 12, 30, 7])
+
+
+def test_rewritten_isozones_invalidate_the_sidecar(tmp_path):
+    isozones = tmp_path / "isozones_cog.tif"
+    isozones.write_bytes(b"isozones")
+    write_isozone_histogram(tmp_path, np.array([0, 12]))
+
+    _touch_later(isozones)
+
+    assert read_zone_cell_counts(tmp_path) is None
+
+
+def test_missing_sidecar_reads_as_none(tmp_path):
+    (tmp_path / "isozones_cog.tif").write_bytes(b"isozones")
+
+    assert read_zone_cell_counts(tmp_path) is None
+
+
+def test_time_value_histogram_skips_nodata():
+    counts = time_value_histogram(np.array([[0.2, 0.9, np.nan], [2.5, -1.0, 2.0]]))
+
+    np.testing.assert_array_equal(counts, [2, 0, 2])
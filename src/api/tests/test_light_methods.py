@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+from calculations.discharge import (
+    _solve_tb,
+    construct_idf_curve,
+    koella_standardVo,
+    loglog_interp_targets,
+    modifizierte_fliesszeit_standardVo,
+)
+from calculations.light_methods import koella_array, modifizierte_fliesszeit_array, solve_tb_array
+
+
+IDF = (30.0, 45.0, 80.0, 130.0, 2.33, 100.0)
+SCENARIOS = ("current", "1_5_degree", "2_degree", "3_degree")
+CC_FACTORS = (0.0, 0.063, 0.098, 0.196)
+EASTING, NORTHING = 2600000.0, 1200000.0
+
+
+def _scalar_mod_fliesszeit(x, scenario, Vo20, L, delta_H, psi, E):
+    return modifizierte_fliesszeit_standardVo(
+        None, *IDF, x, Vo20, L, delta_H, psi, E, 1, EASTING, NORTHING,
+        climate_scenario=scenario,
+    )
+
+
+def _scalar_koella(x, scenario, Vo20, Lg, E, glacier_area):
+    return koella_standardVo(
+        None, *IDF, x, Vo20, Lg, E, glacier_area, 1, EASTING, NORTHING,
+        climate_scenario=scenario,
+    )
+
+
+def test_solve_tb_array_matches_scalar_step_solver():
+    curve = construct_idf_curve(*IDF, 0.0)
+    x = np.array([2.3, 20, 100])[:, None]
+    TFl = np.array([2.0, 15.0, 60.0])[None, :]
+
+    TB = solve_tb_array(curve, x, 0.098, TFl, 30)
+
+    assert TB.shape == (3, 3)
+    scenario_curve = construct_idf_curve(*IDF, 0.098)
+    for i in range(3):
+        for j in range(3):
+            expected = _solve_tb(scenario_curve, float(x[i, 0]), float(TFl[0, j]), 30)
+            assert TB[i, j] == pytest.approx(expected, rel=1e-9)
+
+
+def test_mod_fliesszeit_array_matches_scalar_tasks():
+    curve = construct_idf_curve(*IDF, 0.0)
+    x = np.array([2.3, 20, 30, 100, 300])[:, None]
+    cc_factor = np.array(CC_FACTORS)[None, :]
+
+    results = modifizierte_fliesszeit_array(curve, x, 30, 1500.0, 400.0, 0.3, 2.5, cc_factor=cc_factor)
+
+    for i, rp in enumerate(x[:, 0]):
+        for j, scenario in enumerate(SCENARIOS):
+            if rp in (30, 300):
+                r20 = _scalar_mod_fliesszeit(20, scenario, 30, 1500.0, 400.0, 0.3, 2.5)
+                r100 = _scalar_mod_fliesszeit(100, scenario, 30, 1500.0, 400.0, 0.3, 2.5)
+                expected = dict(r20, HQ=loglog_interp_targets(20, r20["HQ"], 100, r100["HQ"])[int(rp)])
+            else:
+                expected = _scalar_mod_fliesszeit(float(rp), scenario, 30, 1500.0, 400.0, 0.3, 2.5)
+            for name, value in expected.items():
+                assert results[name][i, j] == pytest.approx(value, rel=1e-9), (rp, scenario, name)
+
+
+def test_koella_array_matches_scalar_tasks():
+    curve = construct_idf_curve(*IDF, 0.0)
+    x = np.array([2.3, 20, 30, 100, 300])
+    Vo20 = np.array([20, 27, 33, 45, 38])
+    E = np.array([0.5, 2.0, 8.0, 1.0, 12.0])
+
+    results = koella_array(curve, x, Vo20, 3.2, E, 0.1, cc_factor=0.098)
+
+    for k in range(len(x)):
+        if x[k] in (30, 300):
+            r20 = _scalar_koella(20, "2_degree", Vo20[k], 3.2, E[k], 0.1)
+            r100 = _scalar_koella(100, "2_degree", Vo20[k], 3.2, E[k], 0.1)
+            expected = dict(r20, HQ=loglog_interp_targets(20, r20["HQ"], 100, r100["HQ"])[int(x[k])])
+        else:
+            expected = _scalar_koella(float(x[k]), "2_degree", Vo20[k], 3.2, E[k], 0.1)
+        for name, value in expected.items():
+            assert results[name][k] == pytest.approx(value, rel=1e-9), (x[k], name)
+
+
+def test_solve_tb_array_retries_from_one_minute_like_the_step_solver():
+    curve = construct_idf_curve(*IDF, 0.0)
+
+    # Starting above the root the stepping solver walks away and retries from TB=1 min
+    TB = solve_tb_array(curve, 100, 0.0, 2.0, 20, TB_start=400)
+
+    assert TB == pytest.approx(_solve_tb(curve, 100, 2.0, 20, TB_start=400), rel=1e-9)
+
+
+def test_light_method_arrays_reject_unknown_return_periods():
+    curve = construct_idf_curve(*IDF, 0.0)
+
+    with pytest.raises(ValueError):
+        modifizierte_fliesszeit_array(curve, [20, 50], 30, 1500.0, 400.0, 0.3, 2.5)
+    with pytest.raises(ValueError):
+        koella_array(curve, 5, 30, 3.2, 2.0, 0.0)
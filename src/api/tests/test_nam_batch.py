@@ -0,0 +1,144 @@
+import numpy as np
+import pytest
+
+from calculations.nam import run_nam_batch, NAMInputError, _make_nam_diagnostics
+from calculations.nam_diagnostics import DIAGNOSTICS_DETAIL, DIAGNOSTICS_OFF, DIAGNOSTICS_RASTERS, NAMDiagnostics
+from calculations.nam_kernel import _storm_distribution, _storm_kernel
+
+
+IDF = dict(P_low_1h=30.0, P_high_1h=45.0, P_low_24h=80.0, P_high_24h=130.0, rp_low=2.33, rp_high=100.0)
+
+
+def _run(routing_method, water_balance_mode, climate_scenarios, return_periods, **kwargs):
+    return run_nam_batch(
+        **IDF,
+        return_periods=return_periods,
+        catchment_area=0.05,
+        project_id="p",
+        user_id="1",
+        water_balance_mode=water_balance_mode,
+        precipitation_factor=0.7,
+        storm_center_mode="centroid",
+        routing_method=routing_method,
+        project_easting=2600000.0,
+        project_northing=1200000.0,
+        climate_scenarios=climate_scenarios,
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize("routing_method", ["time_values", "isozone", "travel_time"])
+@pytest.mark.parametrize("water_balance_mode", ["uniform", "simple", "cumulative"])
+def test_batch_matches_single_scenario_runs(nam_project, routing_method, water_balance_mode):
+    scenarios = ["current", "1_5_degree", "2_degree", "3_degree"]
+    batch = _run(routing_method, water_balance_mode, scenarios, [100, 300])
+
+    assert [(r["climate_scenario"], r["x"]) for r in batch] == [(s, x) for s in scenarios for x in (100, 300)]
+    for result in batch:
+        single, = _run(routing_method, water_balance_mode, [result["climate_scenario"]], [result["x"]])
+        assert single["HQ"] == result["HQ"]
+        assert single["discharge_timesteps"] == result["discharge_timesteps"]
+        assert single["water_balance"] == result["water_balance"]
+        assert result["HQ"] > 0
+
+
+def test_batch_scenarios_increase_discharge(nam_project):
+    batch = _run("time_values", "simple", ["current", "3_degree"], [100])
+    assert batch[1]["HQ"] >= batch[0]["HQ"]
+
+
+def test_missing_rasters_raise(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(NAMInputError, match="Curve number raster not found"):
+        _run("time_values", "simple", ["current"], [100])
+
+
+@pytest.mark.parametrize("readiness_to_drain", [0, 2])
+def test_stored_pack_gives_same_results(nam_project, tmp_path, readiness_to_drain):
+    def run():
+        return run_nam_batch(
+            **IDF, return_periods=[100], catchment_area=0.05, project_id="p", user_id="1",
+            water_balance_mode="simple", precipitation_factor=0.7, storm_center_mode="centroid",
+            routing_method="isozone", readiness_to_drain=readiness_to_drain, climate_scenarios=["current"],
+        )
+
+    first = run()
+    assert (tmp_path / "data" / "1" / "p" / "nam_pack" / "meta.json").exists()
+    assert run() == first
+
+
+@pytest.mark.parametrize("water_balance_mode", ["uniform", "simple", "cumulative"])
+def test_response_units_approximate_cell_results(nam_project, water_balance_mode):
+    results = run_nam_batch(
+        **IDF, return_periods=[100, 300], catchment_area=0.05, project_id="p", user_id="1",
+        water_balance_mode=water_balance_mode, precipitation_factor=0.7, storm_center_mode="centroid",
+        routing_method="time_values", climate_scenarios=["current", "3_degree"],
+        response_unit_ring_m=25, report_quantization_error=True,
+    )
+
+    for result in results:
+        assert result["response_units"] < result["total_cells"]
+        error = result["quantization_error"]
+        assert abs(error["HQ_rel_error"]) < 0.01
+        assert abs(error["volume_rel_error"]) < 0.01
+        assert result["water_balance"]["total_initial_water"] == pytest.approx(
+            result["storm_distribution"]["mean_precipitation"] * result["total_cells"]
+        )
+
+
+def test_travel_time_field_is_reused(nam_project, tmp_path):
+    first = _run("travel_time", "simple", ["current"], [100])
+    fields = list((tmp_path / "data" / "1" / "p" / "nam_pack" / "travel_times").glob("*.npz"))
+    assert len(fields) == 1
+
+    assert _run("travel_time", "simple", ["current"], [100]) == first
+    assert list((tmp_path / "data" / "1" / "p" / "nam_pack" / "travel_times").glob("*.npz")) == fields
+
+
+def test_diagnostics_level_does_not_change_results(nam_project, tmp_path):
+    quiet = NAMDiagnostics(DIAGNOSTICS_OFF, collect=True)
+    results = _run("travel_time", "cumulative", ["current"], [100], diagnostics=quiet)
+    assert {record["event"] for record in quiet.records} <= {"warning"}
+    assert not (tmp_path / "data" / "temp").exists()
+
+    detail = NAMDiagnostics(DIAGNOSTICS_DETAIL, collect=True)
+    assert _run("travel_time", "cumulative", ["current"], [100], diagnostics=detail) == results
+    events = {record["event"] for record in detail.records}
+    assert {"retention", "travel_times", "cumulative_iteration", "discharge_series"} <= events
+    assert not (tmp_path / "data" / "temp").exists()
+
+    assert _run("travel_time", "cumulative", ["current"], [100], diagnostics=_make_nam_diagnostics(False, DIAGNOSTICS_RASTERS)) == results
+    assert len(list((tmp_path / "data" / "temp").glob("*.tif"))) == 2
+
+
+def test_only_flagged_messages_are_warnings():
+    quiet = NAMDiagnostics(DIAGNOSTICS_OFF, collect=True)
+
+    quiet("Quantization error (current, RP=100): HQ 1.2 vs 1.2 m³/s")
+    quiet("Curve number raster not found", warning=True)
+
+    assert quiet.records == [{"event": "warning", "level": DIAGNOSTICS_OFF, "message": "Curve number raster not found"}]
+
+
+def test_storm_kernel_matches_grid_kernel():
+    rows, cols = (index.astype(np.uint16) for index in np.nonzero(np.ones((40, 50), dtype=bool)))
+    kernel = _storm_kernel(rows, cols, 12, 31, 25.0)
+
+    yy, xx = np.mgrid[:40, :50]
+    expected = np.exp(-np.sqrt((yy - 12) ** 2 + (xx - 31) ** 2) / 25.0).ravel()
+    assert kernel.dtype == np.float32
+    np.testing.assert_allclose(kernel, expected, rtol=1e-6)
+
+
+def test_storm_distribution_caps_peaks_and_keeps_volume():
+    kernel = np.linspace(1.0, 0.2, 1000, dtype=np.float32)
+    P_total_storm = np.array([50.0, 20.0])
+    I_event = np.array([30.0, 30.0])
+
+    storm = _storm_distribution(P_total_storm, I_event, kernel, duration_h=1.0)
+
+    assert storm.dtype == np.float32
+    np.testing.assert_allclose(storm.mean(axis=1, dtype=np.float64), P_total_storm * kernel.mean(dtype=np.float64), rtol=1e-6)
+    assert storm[0].max() < 50.0
+    np.testing.assert_allclose(storm[1], 20.0 * kernel, rtol=1e-6)
@@ -0,0 +1,102 @@
+import os
+
+import numpy as np
+import pytest
+import rasterio
+
+from calculations.discharge import construct_idf_curve
+from calculations.nam_kernel import (
+    NAMInputError,
+    NAMResult,
+    _cell_sum,
+    _cumulative_effective_precipitation,
+    run_nam_kernel,
+)
+from calculations.nam_pack import pack_arrays
+from tests.test_nam_batch import IDF, _run
+
+
+def _project_pack(data_dir):
+    grids = {}
+    for layer, name in (("cn", "curvenumbers"), ("isozone", "isozones_cog"), ("dem", "dem"), ("time_values", "time_values")):
+        with rasterio.open(data_dir / "1" / "p" / f"{name}.tif") as src:
+            grids[layer] = src.read(1)
+            transform, crs = src.transform, src.crs
+    return pack_arrays(transform, crs=crs, **grids)
+
+
+def _scenarios(return_periods):
+    intensity_fn = construct_idf_curve(*IDF.values(), 0.0)
+    return [
+        {"climate_scenario": "current", "x": x, "cc_degree": 0.0, "intensity_fn": intensity_fn}
+        for x in return_periods
+    ]
+
+
+@pytest.mark.parametrize("routing_method", ["time_values", "isozone", "travel_time"])
+def test_kernel_on_arrays_matches_project_run(nam_project, tmp_path, routing_method):
+    pack = _project_pack(tmp_path / "data")
+    files_before = sorted(os.listdir(tmp_path))
+
+    results = run_nam_kernel(
+        pack, _scenarios([100, 300]), 0.05, "cumulative", 0.7, "centroid", routing_method,
+    )
+
+    assert all(isinstance(result, NAMResult) for result in results)
+    assert sorted(os.listdir(tmp_path)) == files_before
+    expected = _run(routing_method, "cumulative", ["current"], [100, 300])
+    assert [result.to_dict() for result in results] == expected
+
+
+def test_kernel_readiness_to_drain_uses_all_grid_cells(nam_project, tmp_path):
+    pack = _project_pack(tmp_path / "data")
+
+    result, = run_nam_kernel(pack, _scenarios([100]), 0.05, "simple", 0.7, "centroid", "isozone", readiness_to_drain=2)
+
+    assert result.total_cells == pack.shape[0] * pack.shape[1]
+
+
+def test_kernel_without_valid_cells_raises():
+    grid = np.zeros((10, 10), dtype=np.float32)
+    pack = pack_arrays(rasterio.transform.from_origin(2600000, 1200050, 5, 5), cn=grid, isozone=grid)
+
+    with pytest.raises(NAMInputError):
+        run_nam_kernel(pack, _scenarios([100]), 0.05, "simple", 0.7, "centroid", "isozone")
+
+
+def _cumulative_loop(cumulative_precip, Ia_cells, S_cells, cell_counts=None):
+    """Cumulative water balance on full vectors with masks, as implemented before."""
+    retained_water = np.zeros(cumulative_precip.shape, dtype=np.float32)
+    Pe_cells = np.zeros(cumulative_precip.shape, dtype=np.float32)
+    for _ in range(10):
+        available_precip = cumulative_precip - retained_water
+        P_mask = available_precip > Ia_cells
+        if not np.any(P_mask):
+            break
+        P_excess = available_precip[P_mask] - Ia_cells[P_mask]
+        Pe_iteration = (P_excess ** 2) / (P_excess + S_cells[P_mask])
+        infiltration_iteration = available_precip[P_mask] - Pe_iteration
+        Pe_cells[P_mask] += Pe_iteration
+        retained_water[P_mask] += infiltration_iteration
+        counts_valid = cell_counts[P_mask] if cell_counts is not None else None
+        total_pe_change = _cell_sum(Pe_iteration, counts_valid)
+        total_retention_change = _cell_sum(infiltration_iteration, counts_valid)
+        if total_pe_change < 0.001 and total_retention_change < 0.001:
+            break
+    return Pe_cells, retained_water
+
+
+@pytest.mark.parametrize("with_counts", [False, True])
+def test_cumulative_water_balance_matches_masked_loop(with_counts):
+    rng = np.random.default_rng(1)
+    cn = rng.choice(np.array([45, 61, 74, 86, 100], dtype=np.float32), size=5000)
+    S_cells = ((25400 / cn) - 254).astype(np.float32)
+    Ia_cells = 0.1 * S_cells
+    precip = rng.uniform(0, 120, size=5000).astype(np.float32)
+    cell_counts = rng.integers(1, 50, size=5000) if with_counts else None
+
+    Pe_cells, retained_water = _cumulative_effective_precipitation(precip, Ia_cells, S_cells, cell_counts=cell_counts)
+
+    expected_pe, expected_retained = _cumulative_loop(precip, Ia_cells, S_cells, cell_counts)
+    np.testing.assert_array_equal(Pe_cells, expected_pe)
+    np.testing.assert_array_equal(retained_water, expected_retained)
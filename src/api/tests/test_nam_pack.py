@@ -0,0 +1,117 @@
+import os
+
+import numpy as np
+import pytest
+
+from calculations.nam_pack import (
+    PACK_DIRNAME,
+    TRAVEL_TIMES_DIRNAME,
+    build_pack,
+    decode_vector,
+    encode_vector,
+    load_or_build_pack,
+    load_pack,
+    load_travel_times,
+    store_travel_times,
+    travel_time_key,
+)
+from tests.conftest import _write_project
+
+
+@pytest.fixture
+def sources(tmp_path):
+    _write_project(tmp_path)
+    project_dir = tmp_path / "1" / "p"
+    return {
+        "cn": str(project_dir / "curvenumbers.tif"),
+        "isozone": str(project_dir / "isozones_cog.tif"),
+        "dem": str(project_dir / "dem.tif"),
+        "time_values": None,
+    }
+
+
+@pytest.mark.parametrize("values, stored_dtype", [
+    (np.array([45, 61, 100], dtype=np.float32), np.uint8),
+    (np.array([0, 3, np.nan, 7], dtype=np.float64), np.uint8),
+    (np.array([-4, 300], dtype=np.float32), np.int16),
+    (np.array([512.5, np.nan], dtype=np.float64), np.float32),
+    (np.array([512.123456789], dtype=np.float64), np.float64),
+])
+def test_encoding_round_trip(values, stored_dtype):
+    encoded, encoding = encode_vector(values)
+    assert encoded.dtype == stored_dtype
+    decoded = decode_vector(encoded, encoding)
+    assert decoded.dtype == values.dtype
+    np.testing.assert_array_equal(decoded, values)
+
+
+def test_pack_holds_only_catchment_cells(sources):
+    pack = build_pack(sources)
+
+    cn = pack.layer("cn")
+    assert len(pack) < pack.shape[0] * pack.shape[1]
+    assert np.all((cn > 0) & (cn <= 100))
+    assert pack.outside_cn_range == (0.0, 0.0)
+    assert not pack.has("time_values")
+    assert np.all(np.diff(pack.rows.astype(np.int64) * pack.shape[1] + pack.cols) > 0)
+
+
+def test_stored_pack_is_memory_mapped_and_identical(sources, tmp_path):
+    directory = tmp_path / PACK_DIRNAME
+    built = load_or_build_pack(directory, sources, log=lambda *a: None)
+    loaded = load_pack(directory, sources)
+
+    assert isinstance(loaded.rows, np.memmap)
+    assert loaded.shape == built.shape
+    assert loaded.transform == built.transform
+    for layer in ("cn", "isozone", "dem"):
+        np.testing.assert_array_equal(loaded.layer(layer), built.layer(layer))
+
+
+def test_rewritten_raster_invalidates_pack(sources, tmp_path):
+    directory = tmp_path / PACK_DIRNAME
+    load_or_build_pack(directory, sources, log=lambda *a: None)
+
+    stat = os.stat(sources["cn"])
+    os.utime(sources["cn"], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert load_pack(directory, sources) is None
+
+
+def test_value_at_reads_cells_outside_the_pack(sources):
+    pack = build_pack(sources)
+    row, col = int(pack.rows[0]), int(pack.cols[0])
+
+    assert pack.value_at("dem", row, col) == pack.layer("dem")[0]
+    assert np.isnan(pack.value_at("dem", 0, 0))
+    assert pack.covers_adjusted_cn(-4)
+    assert not pack.covers_adjusted_cn(2)
+
+
+def test_travel_time_fields_are_stored_per_discharge_point(sources, tmp_path):
+    directory = tmp_path / PACK_DIRNAME
+    pack = load_or_build_pack(directory, sources, log=lambda *a: None)
+    field = {
+        "travel_times": np.linspace(0, 30, len(pack), dtype=np.float32),
+        "arrival_timesteps": np.arange(len(pack), dtype=np.int64) % 4,
+        "discharge_row": 55,
+        "discharge_col": 40,
+        "method": "Overland Flow",
+    }
+    key = travel_time_key(pack, 55, 40, 10)
+    store_travel_times(directory, key, field)
+
+    stored = load_travel_times(directory, key)
+    np.testing.assert_array_equal(stored["travel_times"], field["travel_times"])
+    np.testing.assert_array_equal(stored["arrival_timesteps"], field["arrival_timesteps"])
+    assert (stored["discharge_row"], stored["discharge_col"], stored["method"]) == (55, 40, "Overland Flow")
+    assert travel_time_key(pack, 55, 41, 10) != key
+    assert travel_time_key(pack.select(slice(1, None)), 55, 40, 10) != key
+
+    stat = os.stat(sources["dem"])
+    os.utime(sources["dem"], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert travel_time_key(pack, 55, 40, 10) != key
+
+    # Rebuilding the pack drops the fields of the previous DEM
+    load_or_build_pack(directory, sources, log=lambda *a: None)
+    assert not list((directory / TRAVEL_TIMES_DIRNAME).glob("*.npz"))
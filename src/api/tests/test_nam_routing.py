@@ -0,0 +1,115 @@
+import numpy as np
+
+from calculations.nam_routing import (
+    arrival_timesteps_from_isozones,
+    arrival_timesteps_from_minutes,
+    route_runoff,
+    runoff_to_discharge,
+)
+
+
+def _make_catchment(seed=0, shape=(60, 80)):
+    rng = np.random.default_rng(seed)
+    valid_mask = rng.random(shape) < 0.7
+    pe_cells = np.where(valid_mask, rng.uniform(0, 40, shape), 0).astype(np.float32)
+    runoff_volumes = pe_cells * 25.0 / 1000
+    return rng, valid_mask, pe_cells, runoff_volumes
+
+
+def _loop_time_values(runoff_volumes, time_values_data, valid_mask, dt, max_timesteps):
+    """Reference implementation: one full-grid mask per timestep."""
+    runoff_timesteps = [0.0] * max_timesteps
+    arrival_timesteps = np.round(time_values_data / dt).astype(int)
+    max_time_value = np.nanmax(time_values_data[valid_mask])
+    max_timesteps_needed = int(np.ceil(max_time_value / dt)) + 10
+    if max_timesteps_needed > len(runoff_timesteps):
+        runoff_timesteps.extend([0.0] * (max_timesteps_needed - len(runoff_timesteps)))
+    valid_time_mask = valid_mask & ~np.isnan(time_values_data) & (time_values_data > 0)
+    for i in range(max_timesteps_needed):
+        timestep_mask = (arrival_timesteps == i) & valid_time_mask
+        if np.any(timestep_mask):
+            runoff_timesteps[i] += np.sum(runoff_volumes[timestep_mask])
+    return runoff_timesteps, max_timesteps_needed
+
+
+def _loop_isozone(runoff_volumes, isozone_data, valid_mask, max_timesteps):
+    runoff_timesteps = [0.0] * max_timesteps
+    max_zone = int(np.nanmax(isozone_data))
+    valid_isozones = np.isfinite(isozone_data) & (isozone_data >= 0)
+    for zone in range(max_zone + 1):
+        zone_mask = (isozone_data == zone) & valid_mask & valid_isozones
+        if not np.any(zone_mask):
+            continue
+        while len(runoff_timesteps) <= zone:
+            runoff_timesteps.append(0.0)
+        runoff_timesteps[zone] += np.sum(runoff_volumes[zone_mask])
+    return runoff_timesteps
+
+
+def _loop_travel_time(runoff_volumes, travel_times, valid_mask, dt, max_timesteps):
+    runoff_timesteps = [0.0] * max_timesteps
+    arrival_timesteps = np.round(travel_times / dt).astype(int)
+    for i in range(max_timesteps):
+        timestep_mask = (arrival_timesteps == i) & valid_mask
+        if np.any(timestep_mask):
+            runoff_timesteps[i] += np.sum(runoff_volumes[timestep_mask])
+    return runoff_timesteps
+
+
+def test_time_values_routing_matches_loop():
+    rng, valid_mask, _, runoff_volumes = _make_catchment(seed=1)
+    dt = 10
+    time_values_data = rng.uniform(0, 240, valid_mask.shape).astype(np.float32)
+    time_values_data[rng.random(valid_mask.shape) < 0.05] = np.nan
+    time_values_data[rng.random(valid_mask.shape) < 0.05] = 0
+
+    expected, n_needed = _loop_time_values(runoff_volumes, time_values_data, valid_mask, dt, 50)
+
+    valid_time_mask = valid_mask & ~np.isnan(time_values_data) & (time_values_data > 0)
+    arrival = arrival_timesteps_from_minutes(time_values_data, dt, valid_time_mask)
+    routed, counts = route_runoff(runoff_volumes, arrival, n_needed)
+    runoff_timesteps = np.zeros(max(50, n_needed))
+    runoff_timesteps[:n_needed] += routed
+
+    assert len(routed) == n_needed
+    np.testing.assert_allclose(runoff_timesteps, expected, rtol=1e-5, atol=1e-6)
+    assert counts.sum() == np.sum(valid_time_mask)
+
+
+def test_isozone_routing_matches_loop():
+    rng, valid_mask, _, runoff_volumes = _make_catchment(seed=2)
+    isozone_data = rng.integers(0, 70, valid_mask.shape).astype(np.float64)
+    isozone_data[rng.random(valid_mask.shape) < 0.1] = np.nan
+
+    expected = _loop_isozone(runoff_volumes, isozone_data, valid_mask, 50)
+
+    max_zone = int(np.nanmax(isozone_data))
+    valid_isozones = np.isfinite(isozone_data) & (isozone_data >= 0)
+    arrival = arrival_timesteps_from_isozones(isozone_data, valid_mask & valid_isozones)
+    routed, counts = route_runoff(runoff_volumes, arrival, max_zone + 1)
+    occupied = np.flatnonzero(counts)
+    n_routed = max(50, int(occupied[-1]) + 1)
+    runoff_timesteps = np.zeros(n_routed)
+    runoff_timesteps[:occupied[-1] + 1] += routed[:occupied[-1] + 1]
+
+    np.testing.assert_allclose(runoff_timesteps, expected, rtol=1e-5, atol=1e-6)
+
+
+def test_travel_time_routing_drops_late_arrivals_like_loop():
+    rng, valid_mask, _, runoff_volumes = _make_catchment(seed=3)
+    dt = 10
+    max_timesteps = 20
+    travel_times = rng.uniform(0, 400, valid_mask.shape).astype(np.float32)
+
+    expected = _loop_travel_time(runoff_volumes, travel_times, valid_mask, dt, max_timesteps)
+
+    arrival = arrival_timesteps_from_minutes(travel_times, dt, valid_mask)
+    routed, _ = route_runoff(runoff_volumes, arrival, max_timesteps)
+
+    assert len(routed) == max_timesteps
+    np.testing.assert_allclose(routed, expected, rtol=1e-5, atol=1e-6)
+
+
+def test_runoff_to_discharge():
+    discharge = runoff_to_discharge([0.0, 600.0, 1200.0], dt=10)
+    np.testing.assert_allclose(discharge, [0.0, 1.0, 2.0])
@@ -0,0 +1,34 @@
+import json
+
+import numpy as np
+import pytest
+
+from calculations.obstacle_layer import load_obstacle_table, obstacle_weights
+
+
+def test_weights_by_slope_class_and_forest():
+    slope = np.array([[0.5, 0.5, 1.0, 4.9], [12.0, 39.9, 40.0, np.nan]])
+    forest = np.array([[1, 0, 1, 0], [1, 0, 0, 1]])
+    acc = np.array([[1.0, 2.0, 3.0, 5000.0], [4.0, 5.0, 6.0, 7.0]])
+
+    weights = obstacle_weights(slope, forest, acc, a_crit=3000, table=load_obstacle_table(None))
+
+    # Channel cells get the channel weight, cells without slope keep their accumulation
+    np.testing.assert_array_equal(weights, [[3000, 1500, 1500, 100], [500, 188, 150, 7]])
+
+
+def test_table_is_read_from_file(tmp_path):
+    path = tmp_path / "obstacle_weights.json"
+    path.write_text(json.dumps({"slope_edges_percent": [10], "forest_weights": [2, 1], "open_weights": [4, 3]}))
+
+    weights = obstacle_weights(np.array([[5.0, 50.0]]), np.array([[1, 0]]), np.zeros((1, 2)), 3000, load_obstacle_table(path))
+
+    np.testing.assert_array_equal(weights, [[2, 3]])
+
+
+def test_inconsistent_table_is_rejected(tmp_path):
+    path = tmp_path / "obstacle_weights.json"
+    path.write_text(json.dumps({"slope_edges_percent": [10], "forest_weights": [2, 1, 0]}))
+
+    with pytest.raises(ValueError):
+        load_obstacle_table(path)
@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+from calculations.orchestration import plan_project_tasks
+
+
+def _sig(task, **kwargs):
+    return SimpleNamespace(task=task, **kwargs)
+
+
+PRODUCERS = {
+    "dem.tif": _sig("extract_dem"),
+    "curvenumbers.tif": _sig("get_curve_numbers"),
+}
+
+
+def test_light_methods_do_not_wait_for_raster_tasks():
+    light = _sig("light_methods_batch")
+    clark = _sig("clark_wsl_batch", clark_wsl=1)
+
+    immediate, prerequisites, gated = plan_project_tasks(PRODUCERS, [light, clark])
+
+    assert immediate == [light, clark]
+    assert prerequisites == []
+    assert gated == []
+
+
+def test_nam_is_gated_on_the_files_it_reads():
+    light = _sig("light_methods_batch")
+    nam_1 = _sig("nam_batch", nam_id=1)
+    nam_2 = _sig("nam_batch", nam_id=2)
+
+    immediate, prerequisites, gated = plan_project_tasks(PRODUCERS, [nam_1, light, nam_2])
+
+    assert immediate == [light]
+    assert gated == [nam_1, nam_2]
+    # Each producer runs once, however many tasks read its file
+    assert sorted(sig.task for sig in prerequisites) == ["extract_dem", "get_curve_numbers"]
+
+
+def test_files_without_producer_do_not_gate():
+    nam = _sig("nam_batch")
+
+    immediate, prerequisites, gated = plan_project_tasks({"dem.tif": PRODUCERS["dem.tif"]}, [nam])
+
+    assert immediate == []
+    assert [sig.task for sig in prerequisites] == ["extract_dem"]
+    assert gated == [nam]
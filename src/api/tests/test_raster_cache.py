@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.warp import Resampling
+
+from calculations.raster_cache import RasterCache
+
+
+def _write(path, data, cell_size=5.0):
+    transform = from_origin(2600000, 1200000, cell_size, cell_size)
+    with rasterio.open(
+        path, "w", driver="GTiff", height=data.shape[0], width=data.shape[1], count=1,
+        dtype=data.dtype.name, crs="EPSG:2056", transform=transform, compress="lzw"
+    ) as dst:
+        dst.write(data, 1)
+
+
+def _touch_later(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_second_read_is_a_hit_and_read_only(tmp_path):
+    path = tmp_path / "cn.tif"
+    _write(path, np.arange(12, dtype=np.float32).reshape(3, 4))
+    cache = RasterCache(max_bytes=1024 * 1024)
+
+    first = cache.read(path)
+    second = cache.read(path)
+
+    assert second.data is first.data
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    with pytest.raises(ValueError):
+        first.data[0, 0] = 1
+
+
+def test_rewritten_file_is_reloaded(tmp_path):
+    path = tmp_path / "dem.tif"
+    _write(path, np.zeros((3, 4), dtype=np.float32))
+    cache = RasterCache(max_bytes=1024 * 1024)
+    cache.read(path)
+
+    _write(path, np.ones((3, 4), dtype=np.float32))
+    _touch_later(path)
+
+    assert np.all(cache.read(path).data == 1)
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    paths = [tmp_path / f"r{i}.tif" for i in range(3)]
+    for path in paths:
+        _write(path, np.zeros((10, 10), dtype=np.float64))  # 800 bytes each
+    cache = RasterCache(max_bytes=2000)
+
+    cache.read(paths[0])
+    cache.read(paths[1])
+    cache.read(paths[0])
+    cache.read(paths[2])  # evicts paths[1]
+
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["entries"] == 2
+    assert stats["bytes"] <= 2000
+    cache.read(paths[0])
+    assert cache.stats()["hits"] == 2
+
+
+def test_read_aligned_to_reference_grid(tmp_path):
+    reference = tmp_path / "isozones.tif"
+    coarse = tmp_path / "cn.tif"
+    _write(reference, np.zeros((4, 6), dtype=np.float64))
+    _write(coarse, np.full((2, 3), 70, dtype=np.float32), cell_size=10.0)
+    cache = RasterCache(max_bytes=1024 * 1024)
+
+    aligned = cache.read(coarse, like=reference, resampling=Resampling.nearest)
+
+    assert aligned.resampled
+    assert aligned.data.shape == (4, 6)
+    assert np.all(aligned.data == 70)
+    assert aligned.transform == cache.read(reference).transform
@@ -0,0 +1,135 @@
+import calculations.result_memo as result_memo_module
+from calculations.result_memo import ResultMemo, memo_key, memoized
+
+
+class FakeRedis:
+    """The subset of the redis client used by ResultMemo."""
+
+    def __init__(self):
+        self.values = {}
+        self.index = {}
+        self.hashes = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value.encode()
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    def hincrby(self, name, field, amount):
+        fields = self.hashes.setdefault(name, {})
+        fields[field.encode()] = fields.get(field.encode(), 0) + amount
+
+    def hgetall(self, name):
+        return self.hashes.get(name, {})
+
+    def zadd(self, name, mapping):
+        self.index.update(mapping)
+
+    def zcard(self, name):
+        return len(self.index)
+
+    def zpopmin(self, name, count):
+        oldest = sorted(self.index.items(), key=lambda item: item[1])[:count]
+        for member, _ in oldest:
+            del self.index[member]
+        return [(member.encode(), score) for member, score in oldest]
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+def _memo(max_entries=100):
+    memo = ResultMemo("redis://unused", ttl_s=60, max_entries=max_entries, max_entry_bytes=1 << 20)
+    memo._client = FakeRedis()
+    return memo
+
+
+def test_hit_skips_the_calculation():
+    memo = _memo()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"HQ": 12.5, "TB": [1, 2]}
+
+    first = memoized("koella", {"x": 100}, compute, memo=memo)
+    second = memoized("koella", {"x": 100}, compute, memo=memo)
+
+    assert first == second == {"HQ": 12.5, "TB": [1, 2]}
+    assert len(calls) == 1
+    assert memo.stats()["process"]["koella"] == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+    assert memo.stats()["global"] == {"koella:hits": 1, "koella:misses": 1}
+
+
+def test_changed_artifact_changes_the_key(tmp_path):
+    raster = tmp_path / "isozones_cog.tif"
+    raster.write_bytes(b"zones v1")
+    before = memo_key("clark-wsl", {"x": 100}, {"isozones": str(raster)})
+
+    raster.write_bytes(b"zones v2 with other content")
+
+    assert memo_key("clark-wsl", {"x": 100}, {"isozones": str(raster)}) != before
+    assert memo_key("clark-wsl", {"x": 30}, {"isozones": str(raster)}) != memo_key("clark-wsl", {"x": 100}, {"isozones": str(raster)})
+
+
+def test_new_code_version_misses(monkeypatch):
+    memo = _memo()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"HQ": float(len(calls))}
+
+    assert memoized("koella_array", {"x": 100}, compute, memo=memo) == {"HQ": 1.0}
+
+    monkeypatch.setitem(result_memo_module.RESULT_CODE_VERSIONS, "koella_array", 99)
+    assert memoized("koella_array", {"x": 100}, compute, memo=memo) == {"HQ": 2.0}
+
+    monkeypatch.setattr(result_memo_module, "__version__", "99.0.0")
+    assert memoized("koella_array", {"x": 100}, compute, memo=memo) == {"HQ": 3.0}
+    assert memo.stats()["process"]["koella_array"]["hits"] == 0
+
+
+def test_errors_are_not_stored():
+    memo = _memo()
+
+    memoized("nam", {"x": 100}, lambda: {"error": "no curve numbers"}, memo=memo)
+
+    assert memo._client.values == {}
+
+
+def test_entries_are_bounded():
+    memo = _memo(max_entries=3)
+
+    for x in range(5):
+        memoized("koella", {"x": x}, lambda: {"HQ": 1.0}, memo=memo)
+
+    assert len(memo._client.values) == 3
+    assert len(memo._client.index) == 3
+    assert memo.get("koella", memo_key("koella", {"x": 0})) is None
+    assert memo.get("koella", memo_key("koella", {"x": 4})) == {"HQ": 1.0}
+
+
+def test_unreachable_redis_is_a_miss():
+    memo = ResultMemo("redis://unused", ttl_s=60, max_entries=10, max_entry_bytes=1 << 20)
+    memo._client = object()
+
+    assert memoized("koella", {"x": 100}, lambda: {"HQ": 2.0}, memo=memo) == {"HQ": 2.0}
+    assert memo.errors == 2
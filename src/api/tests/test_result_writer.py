@@ -0,0 +1,102 @@
+import pytest
+
+import calculations.discharge as calc_discharge
+from calculations.discharge import KOELLA_RESULT_RELATIONS, ResultWriter, _store_light_results
+
+
+class FakeModel:
+    def __init__(self, calls, name):
+        self.calls = calls
+        self.name = name
+
+    def update(self, where, data):
+        self.calls.append((self.name, where["id"], data))
+
+
+class FakeBatch:
+    def __init__(self, prisma):
+        self.prisma = prisma
+        self.calls = []
+
+    def __getattr__(self, name):
+        return FakeModel(self.calls, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.prisma.fail_next:
+            self.prisma.fail_next = False
+            raise ConnectionError("query engine went away")
+        self.prisma.transactions.append(self.calls)
+
+
+class FakePrisma:
+    def __init__(self):
+        self.connected = True
+        self.fail_next = False
+        self.transactions = []
+
+    def is_connected(self):
+        return self.connected
+
+    def disconnect(self, timeout=None):
+        self.connected = False
+
+    def batch_(self):
+        return FakeBatch(self)
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    created = []
+
+    def connect():
+        created.append(FakePrisma())
+        return created[-1]
+
+    monkeypatch.setattr(calc_discharge, "connect_prisma_with_retry", connect)
+    monkeypatch.setattr(calc_discharge, "_worker_prisma", None)
+    return created
+
+
+def test_scenarios_of_one_object_are_one_update(connections):
+    with ResultWriter() as writer:
+        for scenario in ("current", "1_5_degree", "2_degree", "3_degree"):
+            writer.upsert("koella", 4, KOELLA_RESULT_RELATIONS[scenario], {"HQ": 1.0})
+        writer.upsert("koella", 5, "Koella_Result", {"HQ": 2.0})
+
+    (transaction,) = connections[0].transactions
+    assert [(model, object_id) for model, object_id, _ in transaction] == [("koella", 4), ("koella", 5)]
+    assert set(transaction[0][2]) == {"Koella_Result", "Koella_Result_1_5", "Koella_Result_2", "Koella_Result_3"}
+    assert transaction[0][2]["Koella_Result_2"] == {"upsert": {"update": {"HQ": 1.0}, "create": {"HQ": 1.0}}}
+
+
+def test_connection_is_reused_across_writes(connections):
+    for object_id in range(3):
+        _store_light_results("koella", KOELLA_RESULT_RELATIONS, {object_id: {"current": {"HQ": 1.0}}})
+    _store_light_results("koella", KOELLA_RESULT_RELATIONS, {9: {"error": "no convergence"}})
+
+    assert len(connections) == 1
+    assert len(connections[0].transactions) == 3
+
+
+def test_lost_connection_is_reconnected(connections):
+    with ResultWriter() as writer:
+        writer.upsert("koella", 1, "Koella_Result", {"HQ": 1.0})
+    connections[0].fail_next = True
+
+    with ResultWriter() as writer:
+        writer.upsert("koella", 2, "Koella_Result", {"HQ": 2.0})
+
+    assert len(connections) == 2
+    assert connections[1].transactions == [[("koella", 2, {"Koella_Result": {"upsert": {"update": {"HQ": 2.0}, "create": {"HQ": 2.0}}}})]]
+
+
+def test_nothing_is_written_when_the_block_raises(connections):
+    with pytest.raises(RuntimeError):
+        with ResultWriter() as writer:
+            writer.upsert("koella", 1, "Koella_Result", {"HQ": 1.0})
+            raise RuntimeError("calculation failed")
+
+    assert connections == []
@@ -0,0 +1,51 @@
+import pytest
+
+from calculations.discharge import _TB_BISECTION_MAXITER, _TB_BRACKET_EXPANSIONS, _solve_tb, construct_idf_curve
+
+
+IDF = (30.0, 45.0, 80.0, 130.0, 2.33, 100.0, 0.0)
+
+
+class _CountingIntensity:
+    def __init__(self, intensity_fn):
+        self.intensity_fn = intensity_fn
+        self.calls = 0
+
+    def __call__(self, rp_years, duration_minutes):
+        self.calls += 1
+        return self.intensity_fn(rp_years=rp_years, duration_minutes=duration_minutes)
+
+
+def _residual(intensity_fn, x, TFl, Vox, TB):
+    return TB / 60 * intensity_fn(rp_years=x, duration_minutes=TB + TFl) - Vox
+
+
+# (x, TFl, Vox) whose stepping converges from the default start value
+@pytest.mark.parametrize("x, TFl, Vox", [
+    (2.3, 2.0, 45), (20, 2.0, 30), (100, 2.0, 45),
+    (2.3, 15.0, 20), (20, 15.0, 30), (100, 15.0, 45),
+    (2.3, 60.0, 30), (20, 60.0, 20), (100, 60.0, 30),
+])
+def test_bracket_solver_agrees_with_stepping(x, TFl, Vox):
+    intensity_fn = construct_idf_curve(*IDF)
+
+    stepped = _solve_tb(intensity_fn, x, TFl, Vox, solver="step")
+    bracketed = _solve_tb(intensity_fn, x, TFl, Vox, solver="bracket")
+
+    assert abs(_residual(intensity_fn, x, TFl, Vox, stepped)) < 1
+    assert abs(_residual(intensity_fn, x, TFl, Vox, bracketed)) < 1
+
+
+def test_bracket_solver_has_bounded_work_for_bad_start_values():
+    intensity_fn = _CountingIntensity(construct_idf_curve(*IDF))
+
+    for TB_start in (0.01, 1, 10, 1e4, 1e7):
+        intensity_fn.calls = 0
+        TB = _solve_tb(intensity_fn, 100, 2.0, 20, TB_start=TB_start, solver="bracket")
+        assert abs(_residual(intensity_fn, 100, 2.0, 20, TB)) < 1
+        assert intensity_fn.calls <= 1 + _TB_BRACKET_EXPANSIONS + _TB_BISECTION_MAXITER
+
+
+def test_unknown_solver_raises():
+    with pytest.raises(ValueError):
+        _solve_tb(construct_idf_curve(*IDF), 20, 10.0, 30, solver="newton")